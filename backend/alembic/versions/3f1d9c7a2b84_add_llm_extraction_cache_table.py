@@ -0,0 +1,34 @@
+"""add_llm_extraction_cache_table
+
+Revision ID: 3f1d9c7a2b84
+Revises: c256d0279ea6
+Create Date: 2026-10-18 09:12:41.204519
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1d9c7a2b84'
+down_revision: Union[str, None] = 'c256d0279ea6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create llm_extraction_cache table."""
+    op.create_table(
+        'llm_extraction_cache',
+        sa.Column('content_hash', sa.String(64), primary_key=True),
+        sa.Column('prompt_version', sa.String(), nullable=False),
+        sa.Column('result', sa.JSON(), nullable=False),
+        sa.Column('created', sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Drop llm_extraction_cache table."""
+    op.drop_table('llm_extraction_cache')
@@ -0,0 +1,54 @@
+"""add_ingestion_jobs_table
+
+Revision ID: 5c7e3a9d2f10
+Revises: 8a4e2f6b1c93
+Create Date: 2026-10-18 14:05:27.381906
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c7e3a9d2f10'
+down_revision: Union[str, None] = '8a4e2f6b1c93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create ingestion_jobs table."""
+    op.create_table(
+        'ingestion_jobs',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.String(), sa.ForeignKey('users.user_id'), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('max_attempts', sa.Integer(), nullable=False),
+        sa.Column('run_after', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('locked_by', sa.String(), nullable=True),
+        sa.Column('locked_until', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('updated', sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index(
+        'ix_ingestion_jobs_queued_user_id',
+        'ingestion_jobs',
+        ['user_id'],
+        unique=True,
+        postgresql_where=sa.text("status = 'queued'"),
+    )
+    op.create_index(
+        'ix_ingestion_jobs_status_run_after', 'ingestion_jobs', ['status', 'run_after']
+    )
+
+
+def downgrade() -> None:
+    """Drop ingestion_jobs table."""
+    op.drop_index('ix_ingestion_jobs_status_run_after', table_name='ingestion_jobs')
+    op.drop_index('ix_ingestion_jobs_queued_user_id', table_name='ingestion_jobs')
+    op.drop_table('ingestion_jobs')
@@ -0,0 +1,32 @@
+"""add_checkpoint_columns_to_task_runs
+
+Revision ID: 8a4e2f6b1c93
+Revises: 3f1d9c7a2b84
+Create Date: 2026-10-18 11:40:05.917342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a4e2f6b1c93'
+down_revision: Union[str, None] = '3f1d9c7a2b84'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add ingestion checkpoint columns to processing_task_runs."""
+    op.add_column('processing_task_runs', sa.Column('query', sa.Text(), nullable=True))
+    op.add_column('processing_task_runs', sa.Column('page_token', sa.String(), nullable=True))
+    op.add_column('processing_task_runs', sa.Column('processed_message_ids', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Remove ingestion checkpoint columns from processing_task_runs."""
+    op.drop_column('processing_task_runs', 'processed_message_ids')
+    op.drop_column('processing_task_runs', 'page_token')
+    op.drop_column('processing_task_runs', 'query')
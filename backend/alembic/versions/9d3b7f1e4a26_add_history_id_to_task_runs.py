@@ -0,0 +1,28 @@
+"""add_history_id_to_task_runs
+
+Revision ID: 9d3b7f1e4a26
+Revises: 5c7e3a9d2f10
+Create Date: 2026-10-18 15:12:44.301857
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d3b7f1e4a26'
+down_revision: Union[str, None] = '5c7e3a9d2f10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add the Gmail history id of the last sync to processing_task_runs."""
+    op.add_column('processing_task_runs', sa.Column('history_id', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Remove the Gmail history id from processing_task_runs."""
+    op.drop_column('processing_task_runs', 'history_id')
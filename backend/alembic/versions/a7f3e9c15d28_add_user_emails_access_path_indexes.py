@@ -0,0 +1,56 @@
+"""add_user_emails_access_path_indexes
+
+Revision ID: a7f3e9c15d28
+Revises: e4b8c2d61f07
+Create Date: 2026-10-18 18:20:51.774062
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7f3e9c15d28'
+down_revision: Union[str, None] = 'e4b8c2d61f07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Index user_emails by user for listing by date and filtering by status."""
+    # built concurrently, outside the migration's transaction, so ingestion
+    # keeps writing to the table meanwhile
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_user_emails_user_id_received_at',
+            'user_emails',
+            ['user_id', sa.text('received_at DESC'), sa.text('id DESC')],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_user_emails_user_id_status',
+            'user_emails',
+            ['user_id', sa.text('lower(application_status)')],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Drop the user_emails access path indexes."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_user_emails_user_id_status',
+            table_name='user_emails',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            'ix_user_emails_user_id_received_at',
+            table_name='user_emails',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,40 @@
+"""add_user_email_summaries_table
+
+Revision ID: d91c6b4f3e52
+Revises: a7f3e9c15d28
+Create Date: 2026-10-18 20:41:06.215937
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd91c6b4f3e52'
+down_revision: Union[str, None] = 'a7f3e9c15d28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    Create user_email_summaries table. It starts empty: a user's summary is
+    built from their emails the first time it is read or written.
+    """
+    op.create_table(
+        'user_email_summaries',
+        sa.Column('user_id', sa.String(), primary_key=True),
+        sa.Column('email_count', sa.Integer(), nullable=False),
+        sa.Column('status_counts', sa.JSON(), nullable=False),
+        sa.Column('job_titles', sa.JSON(), nullable=False),
+        sa.Column('first_received_at', sa.DateTime(), nullable=True),
+        sa.Column('last_received_at', sa.DateTime(), nullable=True),
+        sa.Column('updated', sa.DateTime(timezone=True), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Drop user_email_summaries table."""
+    op.drop_table('user_email_summaries')
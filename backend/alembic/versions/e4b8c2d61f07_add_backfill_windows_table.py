@@ -0,0 +1,45 @@
+"""add_backfill_windows_table
+
+Revision ID: e4b8c2d61f07
+Revises: 9d3b7f1e4a26
+Create Date: 2026-10-18 16:42:09.518334
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b8c2d61f07'
+down_revision: Union[str, None] = '9d3b7f1e4a26'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create backfill_windows table."""
+    op.create_table(
+        'backfill_windows',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.String(), sa.ForeignKey('users.user_id'), nullable=False),
+        sa.Column('window_start', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('window_end', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('query', sa.Text(), nullable=False),
+        sa.Column('shard_queries', sa.JSON(), nullable=True),
+        sa.Column('page_token', sa.String(), nullable=True),
+        sa.Column('processed_message_ids', sa.JSON(), nullable=True),
+        sa.Column('processed_emails', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('updated', sa.DateTime(timezone=True), nullable=False),
+        sa.UniqueConstraint('user_id', 'window_start'),
+    )
+
+
+def downgrade() -> None:
+    """Drop backfill_windows table."""
+    op.drop_table('backfill_windows')
@@ -0,0 +1,41 @@
+"""add_user_email_applications_table
+
+Revision ID: f3a8d1c7b925
+Revises: d91c6b4f3e52
+Create Date: 2026-10-18 23:12:47.508613
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a8d1c7b925'
+down_revision: Union[str, None] = 'd91c6b4f3e52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    Create user_email_applications table. The stored summaries are deleted,
+    so each is built again, together with its applications, the first time
+    it is read or written.
+    """
+    op.create_table(
+        'user_email_applications',
+        sa.Column('user_id', sa.String(), primary_key=True),
+        sa.Column('company_name', sa.String(), primary_key=True),
+        sa.Column('job_title', sa.String(), primary_key=True),
+        sa.Column('last_received_at', sa.DateTime(), nullable=False),
+        sa.Column('last_id', sa.String(), nullable=False),
+        sa.Column('application_status', sa.String(), nullable=False),
+    )
+    op.execute("DELETE FROM user_email_summaries")
+
+
+def downgrade() -> None:
+    """Drop user_email_applications table."""
+    op.drop_table('user_email_applications')
@@ -0,0 +1,113 @@
+"""
+Micro-benchmark of turning fetched Gmail messages into the text the LLM sees,
+over a corpus shaped like real job search emails: ATS confirmations, heavy
+newsletter-style job alerts, rejections with legal footers, interview invites
+with calendar attachments and applications with a resume attached.
+
+Compares the HTML to text converters available (see
+utils/email_utils.HTML_TO_TEXT_CONVERTERS) with BeautifulSoup, which
+get_email_content used before, and the whole of parse_email_message with
+the character budget against the previous extraction. Then measures how
+much compaction (utils/compaction_utils.py) shrinks the labelled emails in
+tests/sample_compaction_emails.yaml, and whether the preclassifier still
+comes to the same results on them.
+
+    python benchmark_email_parsing.py --repeat 20
+"""
+
+import argparse
+import time
+from typing import Callable
+
+from tests.email_corpus import (
+    beautifulsoup_to_text,
+    load_sample_emails,
+    make_corpus,
+    text_after,
+    text_before,
+    to_full_format,
+)
+from utils.email_utils import (
+    HTML_TO_TEXT_CONVERTERS,
+    decode_part_body,
+    get_email_payload,
+    is_attachment,
+    parse_email_message,
+    walk_payload,
+)
+from utils.preclassifier_utils import preclassify_email
+
+
+def parse_email_message_before(message_id: str, message: dict) -> str:
+    """The text the LLM saw before: the last text parts, all of the HTML, no budget."""
+    payload = get_email_payload(message)
+    headers = {header["name"].lower(): header["value"] for header in payload["headers"]}
+    text_content = headers["subject"]
+    html_content = None
+    for part in walk_payload(payload):
+        if is_attachment(part):
+            continue
+        if part["mimeType"] == "text/plain":
+            text_content = headers["subject"] + "\n" + decode_part_body(part)
+        elif part["mimeType"] == "text/html":
+            html_content = decode_part_body(part)
+    if html_content:
+        text_content += "\n" + beautifulsoup_to_text(html_content)
+    return text_content
+
+
+def time_per_call(fn: Callable, args_list, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for args in args_list:
+            fn(*args)
+    return (time.perf_counter() - start) / (repeat * len(args_list))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    messages = {name: to_full_format(name, raw) for name, raw in make_corpus(args.seed).items()}
+    html_bodies = [
+        decode_part_body(part)
+        for message in messages.values()
+        for part in walk_payload(message["payload"])
+        if part["mimeType"] == "text/html" and not is_attachment(part)
+    ]
+    print(f"{len(messages)} emails, {sum(len(x) for x in html_bodies)} characters of HTML")
+
+    print("HTML to text, whole bodies:")
+    converters = {"beautifulsoup": beautifulsoup_to_text, **HTML_TO_TEXT_CONVERTERS}
+    for name, convert in converters.items():
+        seconds = time_per_call(convert, [(html,) for html in html_bodies], args.repeat)
+        print(f"  {name:<14} {seconds * 1000:8.2f} ms per body")
+
+    print("parse_email_message:")
+    cases = [(name, message) for name, message in messages.items()]
+    for label, parse in (("before", parse_email_message_before), ("now", parse_email_message)):
+        seconds = time_per_call(parse, cases, args.repeat)
+        chars = sum(len(text if isinstance(text, str) else text["text_content"]) for text in (parse(*case) for case in cases))
+        print(f"  {label:<14} {seconds * 1000:8.2f} ms per email, {chars // len(cases)} characters of text on average")
+
+    print("compaction of the labelled emails:")
+    samples = load_sample_emails()
+    before = [text_before(sample) for sample in samples]
+    after = [text_after(sample) for sample in samples]
+    agreeing = 0
+    for sample, text, compacted in zip(samples, before, after):
+        email_data = {"from": sample["from"], "subject": sample["subject"], "raw_text_content": sample["text"]}
+        agreeing += preclassify_email({**email_data, "text_content": text}) == preclassify_email(
+            {**email_data, "text_content": compacted}
+        )
+    print(
+        f"  {sum(map(len, before)) // len(before)} -> {sum(map(len, after)) // len(after)} characters on average "
+        f"({1 - sum(map(len, after)) / sum(map(len, before)):.0%} smaller), "
+        f"preclassifier agrees on {agreeing} of {len(samples)}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Benchmark of the user_emails read paths with and without the indexes of
+db/user_emails.py, on a synthetic table in a throwaway Postgres container
+(testcontainers, so Docker is needed) or an existing database.
+
+Rows are spread over --users users, plus one heavy user with --heavy-rows
+emails. For each path the statement the app sends is captured, then timed
+and explained (EXPLAIN ANALYZE) for the heavy user and a typical one,
+first with only the primary key and then with the indexes.
+
+    python benchmark_user_emails_indexes.py --rows 10000000 --users 20000
+    python benchmark_user_emails_indexes.py --database-url postgresql://... --rows 100000
+"""
+
+import argparse
+import statistics
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+import database
+from db.user_emails import UserEmails
+from db.utils.user_email_utils import count_user_emails, encode_email_cursor, get_user_emails_page
+from db.utils.user_utils import get_last_email_date
+
+HEAVY_USER_ID = "heavy-user"
+STATUSES = ["no response", "rejected", "interview scheduled", "request for availability", "offer"]
+
+
+@contextmanager
+def benchmark_engine(database_url: str):
+    if database_url:
+        yield sa.create_engine(database_url)
+        return
+    from testcontainers.postgres import PostgresContainer
+
+    with PostgresContainer("postgres:13") as postgres:
+        yield sa.create_engine(postgres.get_connection_url())
+
+
+def load_rows(engine, rows: int, users: int, heavy_rows: int) -> None:
+    """(Re)creates user_emails with only its primary key and fills it in the database."""
+    UserEmails.__table__.drop(engine, checkfirst=True)
+    UserEmails.__table__.create(engine)
+    drop_indexes(engine)
+    insert = """
+        INSERT INTO user_emails
+            (id, user_id, company_name, application_status, received_at, subject, job_title, email_from)
+        SELECT
+            md5(i::text), {user_id}, 'Company ' || (i % 500),
+            (ARRAY{statuses})[1 + i % {status_count}],
+            now() - random() * interval '730 days',
+            'Your application', 'Software Engineer', 'no-reply@example.com'
+        FROM generate_series(1, :rows) AS i
+    """
+    statuses = "[" + ", ".join(f"'{status}'" for status in STATUSES) + "]"
+    with engine.begin() as connection:
+        connection.execute(
+            sa.text(insert.format(user_id="'user-' || (i % :users)", statuses=statuses, status_count=len(STATUSES))),
+            {"rows": rows, "users": users},
+        )
+        connection.execute(
+            sa.text(insert.format(user_id=":heavy_user_id", statuses=statuses, status_count=len(STATUSES))),
+            {"rows": heavy_rows, "heavy_user_id": HEAVY_USER_ID},
+        )
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(sa.text("VACUUM ANALYZE user_emails"))
+
+
+def drop_indexes(engine) -> None:
+    for index in UserEmails.__table__.indexes:
+        index.drop(engine, checkfirst=True)
+
+
+def create_indexes(engine) -> None:
+    for index in UserEmails.__table__.indexes:
+        index.create(engine)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(sa.text("VACUUM ANALYZE user_emails"))
+
+
+def capture_statement(engine, read: Callable[[], object]) -> Tuple[str, dict]:
+    """The last SQL statement and parameters read() sends to the database."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    sa.event.listen(engine, "before_cursor_execute", record)
+    try:
+        read()
+    finally:
+        sa.event.remove(engine, "before_cursor_execute", record)
+    return statements[-1]
+
+
+def get_read_paths(engine, user_id: str) -> Dict[str, Callable[[], object]]:
+    session = Session(engine)
+    # a cursor halfway through the user's emails
+    middle = session.execute(
+        sa.select(UserEmails)
+        .where(UserEmails.user_id == user_id)
+        .order_by(UserEmails.received_at.desc(), UserEmails.id.desc())
+        .offset(count_user_emails(session, user_id) // 2)
+        .limit(1)
+    ).scalar_one()
+    cursor = encode_email_cursor(middle)
+    return {
+        "first page": lambda: get_user_emails_page(session, user_id, 100),
+        "middle page": lambda: get_user_emails_page(session, user_id, 100, cursor),
+        "rejected page": lambda: get_user_emails_page(session, user_id, 100, status=["rejected"]),
+        "count": lambda: count_user_emails(session, user_id),
+        "last email date": lambda: get_last_email_date(user_id),
+    }
+
+
+def measure(engine, paths: Dict[str, Callable[[], object]], repeat: int) -> Dict[str, Tuple[float, List[str]]]:
+    """Path -> (median milliseconds, query plan)."""
+    results = {}
+    for name, read in paths.items():
+        statement, parameters = capture_statement(engine, read)
+        timings = []
+        with engine.connect() as connection:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                connection.exec_driver_sql(statement, parameters).fetchall()
+                timings.append(time.perf_counter() - start)
+            plan = connection.exec_driver_sql("EXPLAIN ANALYZE " + statement, parameters).scalars().all()
+        results[name] = (statistics.median(timings) * 1000, plan)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--heavy-rows", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--database-url", help="use this database instead of a container; user_emails is replaced")
+    parser.add_argument("--plans", action="store_true", help="print the whole query plans, not just the scans")
+    args = parser.parse_args()
+
+    with benchmark_engine(args.database_url) as engine:
+        # get_last_email_date opens its own session on the app's engine
+        database.engine = engine
+        start = time.perf_counter()
+        load_rows(engine, args.rows, args.users, args.heavy_rows)
+        print(f"loaded {args.rows + args.heavy_rows} rows in {time.perf_counter() - start:.0f} s")
+
+        users = {"heavy user": HEAVY_USER_ID, "typical user": "user-1"}
+        before = {label: measure(engine, get_read_paths(engine, user_id), args.repeat) for label, user_id in users.items()}
+        start = time.perf_counter()
+        create_indexes(engine)
+        print(f"created the indexes in {time.perf_counter() - start:.0f} s")
+        after = {label: measure(engine, get_read_paths(engine, user_id), args.repeat) for label, user_id in users.items()}
+
+        for label in users:
+            print(f"{label}:")
+            for name, (before_ms, before_plan) in before[label].items():
+                after_ms, after_plan = after[label][name]
+                print(f"  {name:<16} {before_ms:9.2f} ms -> {after_ms:7.2f} ms ({before_ms / after_ms:.0f}x)")
+                for title, plan in (("before", before_plan), ("after", after_plan)):
+                    lines = plan if args.plans else [line for line in plan if "Scan" in line]
+                    print(f"    {title}: " + "\n            ".join(line.strip() for line in lines))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Compares the stored per-user email summaries (db/user_email_summaries.py)
+with summaries built from the users' emails, and prints the differences.
+With --fix the differing summaries are rebuilt. Exits with 1 if differences
+are left.
+
+    python check_email_summaries.py
+    python check_email_summaries.py --user-id 1234 --fix
+"""
+
+import argparse
+import logging
+import sys
+from typing import List
+
+from sqlalchemy import select
+from sqlmodel import Session
+
+import database
+from db.user_email_summaries import UserEmailSummaries
+from db.utils.email_summary_utils import check_user_email_summary
+
+def get_user_ids(session: Session) -> List[str]:
+    """Every user with a summary; the others get one built when it is first needed."""
+    statement = select(UserEmailSummaries.user_id).order_by(UserEmailSummaries.user_id)
+    return list(session.execute(statement).scalars())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-id", action="append", help="check only this user, can be repeated")
+    parser.add_argument("--fix", action="store_true", help="rebuild the summaries that differ")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    checked = differing = 0
+    with Session(database.engine) as session:
+        with session.begin():
+            user_ids = args.user_id or get_user_ids(session)
+        for user_id in user_ids:
+            # a transaction per user, so a fix holds its lock briefly
+            with session.begin():
+                differences = check_user_email_summary(session, user_id, fix=args.fix)
+            checked += 1
+            if differences:
+                differing += 1
+                print("\n".join(differences))
+
+    action = "rebuilt" if args.fix else "differ"
+    print(f"checked {checked} users, {differing} summaries {action}")
+    if differing and not args.fix:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
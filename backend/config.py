@@ -26,6 +26,16 @@ class Settings(BaseSettings):
     DATABASE_URL_DOCKER: str = (
         "postgresql://postgres:postgres@db:5432/jobseeker_analytics"
     )
+    LLM_MAX_WORKERS: int = 4  # concurrent Gemini requests during ingestion
+    LLM_REQUESTS_PER_MINUTE: int = 30  # shared across all workers in the process
+    WORKER_CONCURRENT_JOBS: int = 4  # ingestion jobs a worker process runs at the same time
+    GMAIL_LIST_CONCURRENCY: int = 4  # query shards of a backfill window listed at the same time, 1 to list it in one go
+    GMAIL_LIST_MAX_QUERY_LENGTH: int = 1500  # characters per query shard, see CompiledFilter.shard_queries
+    BACKFILL_WINDOW_DAYS: int = 30  # date windows a long backfill is split into, processed newest first
+    EMAILS_PAGE_SIZE: int = 100  # emails per /get-emails page
+    EMAILS_MAX_PAGE_SIZE: int = 500  # largest page_size a client may ask /get-emails for
+    EMAIL_MAX_CHARS: int = 10000  # of an email's text passed on to the LLM
+    EMAIL_MAX_TOKENS: int = 1000  # of an email's text after compaction, see utils/compaction_utils.py
 
     @field_validator("GOOGLE_SCOPES", mode="before")
     @classmethod
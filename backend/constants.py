@@ -2,11 +2,7 @@
 This file contains the main constants used in the application.
 """
 
-from datetime import datetime, timedelta
 from pathlib import Path
-from utils.filter_utils import (
-    parse_base_filter_config,
-)  # , parse_override_filter_config
 
 
 GENERIC_ATS_DOMAINS = [
@@ -22,14 +18,6 @@ GENERIC_ATS_DOMAINS = [
 ]
 
 DEFAULT_DAYS_AGO = 30
-# Get the current date
-current_date = datetime.now()
-
-# Subtract 30 days
-date_days_ago = current_date - timedelta(days=DEFAULT_DAYS_AGO)
-
-# Format the date in the required format (YYYY/MM/DD)
-formatted_date = date_days_ago.strftime("%Y/%m/%d")
 
 APPLIED_FILTER_PATH = (
     Path(__file__).parent / "email_query_filters" / "applied_email_filter.yaml"
@@ -39,12 +27,5 @@ APPLIED_FILTER_OVERRIDES_PATH = (
     / "email_query_filters"
     / "applied_email_filter_overrides.yaml"
 )
-QUERY_APPLIED_EMAIL_FILTER = (
-    f"after:{formatted_date} AND ({parse_base_filter_config(APPLIED_FILTER_PATH)})"
-)
-
-# ------ implement override filter later!! #
-# OR \n"
-# f"{parse_override_filter_config(APPLIED_FILTER_OVERRIDES_PATH)})"
-# )
-# label:jobs -label:query4
\ No newline at end of file
+# the overrides file only holds an example so far; pass it to
+# utils.filter_utils.compile_filter to force-include its emails
@@ -0,0 +1,50 @@
+from sqlmodel import Field, SQLModel, Column, JSON
+from datetime import datetime, timezone
+from typing import List, Optional
+import sqlalchemy as sa
+
+PENDING = "pending"
+STARTED = "started"
+FINISHED = "finished"
+FAILED = "failed"
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class BackfillWindows(SQLModel, table=True):
+    """
+    The date windows a long backfill is split into. They are processed
+    newest first as independent units, each with its own checkpoint, so
+    recent emails show up first and a window that failed is retried by the
+    next run without redoing the others.
+    """
+
+    __tablename__ = "backfill_windows"
+    __table_args__ = (sa.UniqueConstraint("user_id", "window_start"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: str = Field(foreign_key="users.user_id", nullable=False)
+    window_start: datetime = Field(sa_column=Column(sa.DateTime(timezone=True), nullable=False))
+    # the newest window is open ended
+    window_end: Optional[datetime] = Field(
+        default=None, sa_column=Column(sa.DateTime(timezone=True), nullable=True)
+    )
+    status: str = Field(default=PENDING, nullable=False)
+    attempts: int = Field(default=0, nullable=False)
+    # the Gmail query of the window, and its shards when it is listed concurrently
+    query: str = Field(sa_column=Column(sa.Text, nullable=False))
+    shard_queries: Optional[List[str]] = Field(default=None, sa_column=Column(JSON, nullable=True))
+    # checkpoint, as in TaskRuns
+    page_token: Optional[str] = None
+    processed_message_ids: Optional[List[str]] = Field(
+        default=None, sa_column=Column(JSON, nullable=True)
+    )
+    processed_emails: int = Field(default=0, nullable=False)
+    last_error: Optional[str] = Field(default=None, sa_column=Column(sa.Text, nullable=True))
+    created: datetime = Field(
+        default_factory=utc_now, sa_column=Column(sa.DateTime(timezone=True), nullable=False)
+    )
+    updated: datetime = Field(
+        default_factory=utc_now, sa_column=Column(sa.DateTime(timezone=True), nullable=False)
+    )
@@ -0,0 +1,57 @@
+from sqlmodel import Field, SQLModel, Column, JSON
+from datetime import datetime, timezone
+from typing import Optional
+import sqlalchemy as sa
+
+QUEUED = "queued"
+RUNNING = "running"
+FINISHED = "finished"
+FAILED = "failed"
+
+MAX_ATTEMPTS = 5
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class IngestionJobs(SQLModel, table=True):
+    """
+    Email ingestion jobs, enqueued by the web app and run by worker.py.
+    A user has at most one queued job: enqueuing again refreshes its payload.
+    """
+
+    __tablename__ = "ingestion_jobs"
+    __table_args__ = (
+        sa.Index(
+            "ix_ingestion_jobs_queued_user_id",
+            "user_id",
+            unique=True,
+            postgresql_where=sa.text("status = 'queued'"),
+        ),
+        sa.Index("ix_ingestion_jobs_status_run_after", "status", "run_after"),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: str = Field(foreign_key="users.user_id", nullable=False)
+    status: str = Field(default=QUEUED, nullable=False)
+    # what fetch_emails_to_db needs from the web session, including the OAuth
+    # credentials; cleared once the job is done
+    payload: Optional[dict] = Field(default=None, sa_column=Column(JSON, nullable=True))
+    attempts: int = Field(default=0, nullable=False)
+    max_attempts: int = Field(default=MAX_ATTEMPTS, nullable=False)
+    # the job is not claimed before run_after, used for retry backoff
+    run_after: datetime = Field(
+        default_factory=utc_now, sa_column=Column(sa.DateTime(timezone=True), nullable=False)
+    )
+    # a running job whose lock expired is considered abandoned and claimed again
+    locked_by: Optional[str] = None
+    locked_until: Optional[datetime] = Field(
+        default=None, sa_column=Column(sa.DateTime(timezone=True), nullable=True)
+    )
+    last_error: Optional[str] = Field(default=None, sa_column=Column(sa.Text, nullable=True))
+    created: datetime = Field(
+        default_factory=utc_now, sa_column=Column(sa.DateTime(timezone=True), nullable=False)
+    )
+    updated: datetime = Field(
+        default_factory=utc_now, sa_column=Column(sa.DateTime(timezone=True), nullable=False)
+    )
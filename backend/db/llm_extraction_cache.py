@@ -0,0 +1,13 @@
+from sqlmodel import SQLModel, Field, Column, JSON
+from datetime import datetime, timezone
+
+
+class LlmExtractionCache(SQLModel, table=True):
+    __tablename__ = "llm_extraction_cache"
+    # sha256 of the prompt version and the normalized email text sent to the LLM
+    content_hash: str = Field(primary_key=True, max_length=64)
+    prompt_version: str = Field(nullable=False)
+    result: dict = Field(sa_column=Column(JSON, nullable=False))
+    created: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc), nullable=False
+    )
@@ -1,10 +1,12 @@
-from sqlmodel import Field, SQLModel, Relationship
+from sqlmodel import Field, SQLModel, Relationship, Column, JSON
 from datetime import datetime, timezone
+from typing import List, Optional
 import sqlalchemy as sa
 from db.users import Users
 
 FINISHED = "finished"
 STARTED = "started"
+FAILED = "failed"
 
 
 class TaskRuns(SQLModel, table=True):
@@ -19,5 +21,16 @@ class TaskRuns(SQLModel, table=True):
     status: str = Field(nullable=False)
     total_emails: int = 0
     processed_emails: int = 0
+    # checkpoint of an unfinished run, so that the next run resumes where it stopped:
+    # the Gmail query, the page token to continue listing from and the ids of
+    # messages already processed on the pages after that token
+    query: Optional[str] = Field(default=None, sa_column=Column(sa.Text, nullable=True))
+    page_token: Optional[str] = None
+    processed_message_ids: Optional[List[str]] = Field(
+        default=None, sa_column=Column(JSON, nullable=True)
+    )
+    # Gmail history id of the mailbox when the last finished run started; the
+    # next incremental sync lists only the messages added after it
+    history_id: Optional[str] = None
 
     user: Users = Relationship()
@@ -0,0 +1,47 @@
+from sqlmodel import Field, SQLModel, Column, JSON
+from datetime import datetime, timezone
+from typing import Dict, Optional
+import sqlalchemy as sa
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class UserEmailSummaries(SQLModel, table=True):
+    """
+    What the dashboard shows of a user's emails, kept up to date as emails
+    are stored and deleted (see db/utils/email_summary_utils.py), so it is
+    read as one row instead of being computed from all of them.
+    """
+
+    __tablename__ = "user_email_summaries"
+    user_id: str = Field(primary_key=True)
+    email_count: int = Field(default=0, nullable=False)
+    # application_status as stored -> number of emails
+    status_counts: Dict[str, int] = Field(default_factory=dict, sa_column=Column(JSON, nullable=False))
+    # job_title -> {"responses", "applications", "last_received_at", "last_id"},
+    # an application being a company and job title pair
+    job_titles: Dict[str, dict] = Field(default_factory=dict, sa_column=Column(JSON, nullable=False))
+    first_received_at: Optional[datetime] = None
+    last_received_at: Optional[datetime] = None
+    updated: datetime = Field(
+        default_factory=utc_now, sa_column=Column(sa.DateTime(timezone=True), nullable=False)
+    )
+
+
+class UserEmailApplications(SQLModel, table=True):
+    """
+    The newest email of each of a user's applications (company and job title
+    pairs), which UserEmailSummaries.job_titles counts, so that storing an
+    email updates the counts without reading the user's other emails.
+    """
+
+    __tablename__ = "user_email_applications"
+    user_id: str = Field(primary_key=True)
+    company_name: str = Field(primary_key=True)
+    job_title: str = Field(primary_key=True)
+    last_received_at: datetime
+    last_id: str
+    # the newest email's application_status, as stored
+    application_status: str
@@ -1,5 +1,6 @@
 from sqlmodel import SQLModel, Field
 from datetime import datetime
+import sqlalchemy as sa
 
 class UserEmails(SQLModel, table=True):
     __tablename__ = "user_emails"  
@@ -10,4 +11,20 @@ class UserEmails(SQLModel, table=True):
     received_at: datetime
     subject: str
     job_title: str
-    email_from: str  # to avoid 'from' being a reserved key word
\ No newline at end of file
+    email_from: str  # to avoid 'from' being a reserved key word
+
+
+# The primary key leads with the Gmail id, which no read path filters on.
+# These match the user's email listing (newest first, paged on
+# (received_at, id)), last email date and counts, and the status filter.
+sa.Index(
+    "ix_user_emails_user_id_received_at",
+    UserEmails.user_id,
+    UserEmails.received_at.desc(),
+    UserEmails.id.desc(),
+)
+sa.Index(
+    "ix_user_emails_user_id_status",
+    UserEmails.user_id,
+    sa.func.lower(UserEmails.application_status),
+)
@@ -0,0 +1,95 @@
+"""
+Date-window partitioning of long backfills, see db/backfill_windows.py.
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import sqlalchemy as sa
+from sqlmodel import Session, select
+
+from db.backfill_windows import FAILED, FINISHED, STARTED, BackfillWindows, utc_now
+from start_date.storage import (
+    add_date_window,
+    get_date_windows,
+    get_start_date_email_filter,
+    get_start_date_email_filter_shards,
+    parse_start_date,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def plan_backfill_windows(
+    session: Session,
+    user_id: str,
+    start_date: Optional[str],
+    window_days: int,
+    shard_max_length: Optional[int] = None,
+) -> List[BackfillWindows]:
+    """
+    Replaces the user's backfill windows with windows of window_days from
+    start_date until now, and returns them newest first. With
+    shard_max_length, every window also gets the shards of its query (see
+    get_start_date_email_filter_shards) to list them at the same time.
+    The caller commits the session.
+    """
+    delete_backfill_windows(session, user_id)
+    query = get_start_date_email_filter(start_date)
+    windows = []
+    for window in get_date_windows(parse_start_date(start_date), datetime.now(), window_days):
+        after, before = window
+        windows.append(
+            BackfillWindows(
+                user_id=user_id,
+                window_start=datetime.fromtimestamp(after, timezone.utc),
+                window_end=datetime.fromtimestamp(before, timezone.utc) if before else None,
+                query=add_date_window(query, window),
+                shard_queries=(
+                    get_start_date_email_filter_shards(start_date, [window], shard_max_length)
+                    if shard_max_length
+                    else None
+                ),
+            )
+        )
+    session.add_all(windows)
+    session.flush()
+    logger.info(f"user_id:{user_id} backfill split into {len(windows)} windows of {window_days} days")
+    return windows
+
+
+def get_unfinished_backfill_windows(session: Session, user_id: str) -> List[BackfillWindows]:
+    """The user's backfill windows still to be processed, newest first."""
+    return list(
+        session.execute(
+            select(BackfillWindows)
+            .where((BackfillWindows.user_id == user_id) & (BackfillWindows.status != FINISHED))
+            .order_by(BackfillWindows.window_start.desc())
+        ).scalars()
+    )
+
+
+def delete_backfill_windows(session: Session, user_id: str) -> None:
+    session.execute(sa.delete(BackfillWindows).where(BackfillWindows.user_id == user_id))
+
+
+def start_backfill_window(window: BackfillWindows) -> None:
+    window.status = STARTED
+    window.attempts += 1
+    window.updated = utc_now()
+
+
+def finish_backfill_window(window: BackfillWindows) -> None:
+    window.status = FINISHED
+    window.page_token = None
+    window.processed_message_ids = None
+    window.last_error = None
+    window.updated = utc_now()
+
+
+def fail_backfill_window(window: BackfillWindows, error: str) -> None:
+    """Keeps the window's checkpoint, so the next run resumes it."""
+    window.status = FAILED
+    window.last_error = error
+    window.updated = utc_now()
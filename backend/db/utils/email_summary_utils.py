@@ -0,0 +1,431 @@
+"""
+Per-user summaries of the stored emails (db/user_email_summaries.py): email
+and status counts, response counts by job title and the dates of the first
+and last email.
+
+Writes to user_emails go through upsert_user_emails and delete_user_email,
+which update the summary in the same transaction: counts change by the rows
+written. The newest email of each application (company and job title pair)
+is stored alongside, so a row inserted only has to be compared with the
+newest email of its own application. A missing summary is built from the
+user's emails the first time it is needed, and check_user_email_summary
+compares a summary with one built from scratch (see check_email_summaries.py).
+"""
+
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, tuple_
+from sqlalchemy import text as sql_text
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, select
+
+from db.user_email_summaries import UserEmailApplications, UserEmailSummaries, utc_now
+from db.user_emails import UserEmails
+
+logger = logging.getLogger(__name__)
+
+# statuses that count as a response from the company, see count_job_titles
+RESPONSE_STATUSES = ("request for availability", "offer", "interview scheduled")
+INTERVIEW_REQUEST_STATUS = "request for availability"
+SUMMARY_FIELDS = ("email_count", "status_counts", "job_titles", "first_received_at", "last_received_at")
+APPLICATIONS_INSERT_CHUNK_SIZE = 1000
+
+Application = Tuple[str, str]  # (company_name, job_title)
+
+# Every (company, job title) pair counts once, with the status of its
+# newest email, which DISTINCT ON keeps.
+NEWEST_APPLICATION_EMAILS = sql_text("""
+    SELECT DISTINCT ON (company_name, job_title)
+        company_name, job_title, received_at, id, application_status
+    FROM user_emails
+    WHERE user_id = :user_id AND (
+        :all_applications
+        OR (company_name, job_title) IN (
+            SELECT * FROM unnest(CAST(:company_names AS varchar[]), CAST(:job_titles AS varchar[]))
+        )
+    )
+    ORDER BY company_name, job_title, received_at DESC, id DESC
+""")
+
+
+def select_newest_emails(
+    session: Session, user_id: str, applications: Optional[Iterable[Application]] = None
+) -> Dict[Application, dict]:
+    """
+    The newest email of each of the user's applications, all or only the
+    given ones, as {"last_received_at", "last_id", "application_status"}.
+    """
+    applications = list(applications or [])
+    rows = session.execute(
+        NEWEST_APPLICATION_EMAILS,
+        {
+            "user_id": user_id,
+            "all_applications": not applications,
+            "company_names": [company_name for company_name, _ in applications],
+            "job_titles": [job_title for _, job_title in applications],
+        },
+    )
+    return {
+        (company_name, job_title): {
+            "last_received_at": received_at,
+            "last_id": email_id,
+            "application_status": application_status,
+        }
+        for company_name, job_title, received_at, email_id, application_status in rows
+    }
+
+
+def select_applications(
+    session: Session,
+    user_id: str,
+    applications: Optional[Iterable[Application]] = None,
+    job_titles: Optional[Iterable[str]] = None,
+) -> Dict[Application, dict]:
+    """
+    The newest emails stored for the user's applications (see
+    select_newest_emails), all, only the given ones or only those for the
+    given job titles.
+    """
+    statement = select(
+        UserEmailApplications.company_name,
+        UserEmailApplications.job_title,
+        UserEmailApplications.last_received_at,
+        UserEmailApplications.last_id,
+        UserEmailApplications.application_status,
+    ).where(UserEmailApplications.user_id == user_id)
+    if applications is not None:
+        statement = statement.where(
+            tuple_(UserEmailApplications.company_name, UserEmailApplications.job_title).in_(list(applications))
+        )
+    if job_titles is not None:
+        statement = statement.where(UserEmailApplications.job_title.in_(list(job_titles)))
+    return {
+        (company_name, job_title): {
+            "last_received_at": last_received_at,
+            "last_id": last_id,
+            "application_status": application_status,
+        }
+        for company_name, job_title, last_received_at, last_id, application_status in session.execute(statement)
+    }
+
+
+def store_applications(session: Session, user_id: str, applications: Dict[Application, Optional[dict]]) -> None:
+    """Stores the newest emails of the user's applications; those set to None have no email left."""
+    rows = [
+        {"user_id": user_id, "company_name": company_name, "job_title": job_title, **newest}
+        for (company_name, job_title), newest in applications.items()
+        if newest is not None
+    ]
+    for start in range(0, len(rows), APPLICATIONS_INSERT_CHUNK_SIZE):
+        statement = insert(UserEmailApplications).values(rows[start : start + APPLICATIONS_INSERT_CHUNK_SIZE])
+        statement = statement.on_conflict_do_update(
+            index_elements=["user_id", "company_name", "job_title"],
+            set_={
+                column: statement.excluded[column]
+                for column in ("last_received_at", "last_id", "application_status")
+            },
+        )
+        session.execute(statement)
+    emptied = [application for application, newest in applications.items() if newest is None]
+    if emptied:
+        session.execute(
+            delete(UserEmailApplications).where(
+                UserEmailApplications.user_id == user_id,
+                tuple_(UserEmailApplications.company_name, UserEmailApplications.job_title).in_(emptied),
+            )
+        )
+
+
+def replace_applications(session: Session, user_id: str, applications: Dict[Application, dict]) -> None:
+    session.execute(delete(UserEmailApplications).where(UserEmailApplications.user_id == user_id))
+    store_applications(session, user_id, applications)
+
+
+def is_newer(newest: dict, than: Optional[dict]) -> bool:
+    """Whether an application's newest email is newer than another one, as ordered by (received_at, id)."""
+    return than is None or (newest["last_received_at"], newest["last_id"]) > (than["last_received_at"], than["last_id"])
+
+
+def is_response(application_status: str) -> bool:
+    return application_status.strip().lower() in RESPONSE_STATUSES
+
+
+def add_application(job_titles: Dict[str, dict], job_title: str, newest: dict) -> None:
+    counts = job_titles.setdefault(
+        job_title, {"responses": 0, "applications": 0, "last_received_at": None, "last_id": None}
+    )
+    counts["responses"] += is_response(newest["application_status"])
+    counts["applications"] += 1
+    last = counts["last_received_at"] and {
+        "last_received_at": datetime.fromisoformat(counts["last_received_at"]),
+        "last_id": counts["last_id"],
+    }
+    if is_newer(newest, last):
+        counts["last_received_at"] = newest["last_received_at"].isoformat()
+        counts["last_id"] = newest["last_id"]
+
+
+def remove_application(job_titles: Dict[str, dict], job_title: str, newest: dict) -> None:
+    counts = job_titles[job_title]
+    counts["responses"] -= is_response(newest["application_status"])
+    counts["applications"] -= 1
+    if not counts["applications"]:
+        del job_titles[job_title]
+
+
+def count_job_titles(applications: Dict[Application, dict]) -> Dict[str, dict]:
+    """
+    The applications by job title, given their newest emails: how many there
+    are, how many got a response (their newest email has one of the
+    RESPONSE_STATUSES) and the newest email's date and id.
+    """
+    job_titles = {}
+    for (_, job_title), newest in applications.items():
+        add_application(job_titles, job_title, newest)
+    return job_titles
+
+
+def count_emails(session: Session, user_id: str) -> Tuple[int, Optional[datetime], Optional[datetime]]:
+    """The number of the user's emails and the dates of the first and last one."""
+    statement = select(
+        func.count(), func.min(UserEmails.received_at), func.max(UserEmails.received_at)
+    ).where(UserEmails.user_id == user_id)
+    return tuple(session.execute(statement).one())
+
+
+def build_user_email_summary(session: Session, user_id: str) -> Tuple[dict, Dict[Application, dict]]:
+    """
+    The summary's fields, computed from all the user's emails, and the newest
+    email of each of their applications.
+    """
+    email_count, first_received_at, last_received_at = count_emails(session, user_id)
+    statement = (
+        select(UserEmails.application_status, func.count())
+        .where(UserEmails.user_id == user_id)
+        .group_by(UserEmails.application_status)
+    )
+    applications = select_newest_emails(session, user_id)
+    fields = {
+        "email_count": email_count,
+        "status_counts": dict(session.execute(statement).all()),
+        "job_titles": count_job_titles(applications),
+        "first_received_at": first_received_at,
+        "last_received_at": last_received_at,
+    }
+    return fields, applications
+
+
+def create_user_email_summary(session: Session, user_id: str) -> bool:
+    """
+    Stores the user's summary built from their emails, unless another
+    transaction stored one meanwhile. Returns whether it was stored.
+    """
+    fields, applications = build_user_email_summary(session, user_id)
+    statement = (
+        insert(UserEmailSummaries)
+        .values(user_id=user_id, updated=utc_now(), **fields)
+        .on_conflict_do_nothing(index_elements=["user_id"])
+        .returning(UserEmailSummaries.user_id)
+    )
+    if session.execute(statement).first() is None:
+        return False
+    replace_applications(session, user_id, applications)
+    return True
+
+
+def select_user_email_summary(session: Session, user_id: str, lock: bool = False) -> Optional[UserEmailSummaries]:
+    statement = select(UserEmailSummaries).where(UserEmailSummaries.user_id == user_id)
+    if lock:
+        # held until the transaction ends, so concurrent writes apply in turn
+        statement = statement.with_for_update()
+    return session.execute(statement.execution_options(populate_existing=True)).scalar_one_or_none()
+
+
+def get_user_email_summary(session: Session, user_id: str) -> UserEmailSummaries:
+    """The user's summary, built from their emails if there is none yet. The caller commits."""
+    summary = select_user_email_summary(session, user_id)
+    if summary is None:
+        create_user_email_summary(session, user_id)
+        summary = select_user_email_summary(session, user_id)
+    return summary
+
+
+def update_job_titles(
+    session: Session,
+    user_id: str,
+    summary: UserEmailSummaries,
+    before: Dict[Application, dict],
+    after: Dict[Application, Optional[dict]],
+) -> None:
+    """
+    Updates the summary's job titles for the applications whose newest email
+    changed from before to after, None if they have no email left.
+    """
+    job_titles = {job_title: dict(counts) for job_title, counts in summary.job_titles.items()}
+    # job titles whose newest email may now be an older one, of another application
+    stale = set()
+    for (company_name, job_title), newest in after.items():
+        previous = before.get((company_name, job_title))
+        if previous is not None:
+            counts = job_titles[job_title]
+            if (previous["last_received_at"].isoformat(), previous["last_id"]) == (
+                counts["last_received_at"],
+                counts["last_id"],
+            ) and not (newest is not None and is_newer(newest, previous)):
+                stale.add(job_title)
+            remove_application(job_titles, job_title, previous)
+        if newest is not None:
+            add_application(job_titles, job_title, newest)
+
+    stale &= job_titles.keys()
+    if stale:
+        for job_title in stale:
+            job_titles[job_title]["last_received_at"] = job_titles[job_title]["last_id"] = None
+        # stored by now, see update_user_email_summary
+        for (_, job_title), newest in select_applications(session, user_id, job_titles=stale).items():
+            counts = job_titles[job_title]
+            last = counts["last_received_at"] and {
+                "last_received_at": datetime.fromisoformat(counts["last_received_at"]),
+                "last_id": counts["last_id"],
+            }
+            if is_newer(newest, last):
+                counts["last_received_at"] = newest["last_received_at"].isoformat()
+                counts["last_id"] = newest["last_id"]
+    summary.job_titles = job_titles
+
+
+def update_user_email_summary(
+    session: Session, user_id: str, added: Iterable[dict] = (), removed: Iterable[dict] = ()
+) -> None:
+    """
+    Updates the user's summary for the emails (as column -> value) just
+    inserted and deleted, and flushed, in this transaction.
+    """
+    added, removed = list(added), list(removed)
+    if not added and not removed:
+        return
+    summary = select_user_email_summary(session, user_id, lock=True)
+    if summary is None:
+        # built from the emails as they are now, these changes included
+        if create_user_email_summary(session, user_id):
+            return
+        summary = select_user_email_summary(session, user_id, lock=True)
+
+    status_counts = dict(summary.status_counts)
+    for row in added:
+        status_counts[row["application_status"]] = status_counts.get(row["application_status"], 0) + 1
+    for row in removed:
+        count = status_counts.pop(row["application_status"], 0) - 1
+        if count > 0:
+            status_counts[row["application_status"]] = count
+    summary.status_counts = status_counts
+    summary.email_count += len(added) - len(removed)
+
+    boundaries = (summary.first_received_at, summary.last_received_at)
+    if any(row["received_at"] in boundaries for row in removed):
+        _, summary.first_received_at, summary.last_received_at = count_emails(session, user_id)
+    elif added:
+        received = [row["received_at"] for row in added]
+        if summary.first_received_at is not None:
+            received += boundaries
+        summary.first_received_at, summary.last_received_at = min(received), max(received)
+
+    # only the newest email of the applications the rows belong to is read,
+    # unless it is one of the rows deleted
+    before = select_applications(
+        session, user_id, {(row["company_name"], row["job_title"]) for row in added + removed}
+    )
+    after = dict(before)
+    for row in added:
+        application = (row["company_name"], row["job_title"])
+        newest = {
+            "last_received_at": row["received_at"],
+            "last_id": row["id"],
+            "application_status": row["application_status"],
+        }
+        if is_newer(newest, after.get(application)):
+            after[application] = newest
+    deleted = {
+        (row["company_name"], row["job_title"])
+        for row in removed
+        if after.get((row["company_name"], row["job_title"]), {}).get("last_id") == row["id"]
+    }
+    if deleted:
+        newest_left = select_newest_emails(session, user_id, deleted)
+        for application in deleted:
+            after[application] = newest_left.get(application)
+    changed = {application: newest for application, newest in after.items() if newest != before.get(application)}
+    store_applications(session, user_id, changed)
+    update_job_titles(session, user_id, summary, before, changed)
+    summary.updated = utc_now()
+
+
+def rebuild_user_email_summary(session: Session, user_id: str) -> None:
+    """Replaces the user's summary with one built from their emails."""
+    summary = select_user_email_summary(session, user_id, lock=True)
+    if summary is None:
+        create_user_email_summary(session, user_id)
+        return
+    fields, applications = build_user_email_summary(session, user_id)
+    for field, value in fields.items():
+        setattr(summary, field, value)
+    replace_applications(session, user_id, applications)
+    summary.updated = utc_now()
+
+
+def check_user_email_summary(session: Session, user_id: str, fix: bool = False) -> List[str]:
+    """
+    The differences between the user's stored summary and one built from
+    their emails, which replaces it if fix is set. A user without a summary
+    has none, theirs is built when it is first needed.
+    """
+    summary = select_user_email_summary(session, user_id, lock=fix)
+    if summary is None:
+        return []
+    rebuilt, applications = build_user_email_summary(session, user_id)
+    differences = [
+        f"user_id:{user_id} {field} is {getattr(summary, field)!r}, should be {rebuilt[field]!r}"
+        for field in SUMMARY_FIELDS
+        if getattr(summary, field) != rebuilt[field]
+    ]
+    stored = select_applications(session, user_id)
+    if stored != applications:
+        differing = sorted(
+            application
+            for application in stored.keys() | applications.keys()
+            if stored.get(application) != applications.get(application)
+        )
+        differences.append(f"user_id:{user_id} applications {differing!r} have another newest email")
+    if differences and fix:
+        logger.info(f"user_id:{user_id} rebuilding the email summary")
+        rebuild_user_email_summary(session, user_id)
+    return differences
+
+
+def get_response_counts_by_job_title(summary: UserEmailSummaries) -> List[Tuple[str, int, int]]:
+    """(job title, responses, applications), the job title with the newest email first."""
+    job_titles = sorted(
+        summary.job_titles.items(),
+        key=lambda item: (item[1]["last_received_at"], item[1]["last_id"]),
+        reverse=True,
+    )
+    return [(job_title, counts["responses"], counts["applications"]) for job_title, counts in job_titles]
+
+
+def count_interview_requests(summary: UserEmailSummaries) -> Tuple[int, int]:
+    """The number of emails, and of those requesting the user's availability."""
+    interview_requests = sum(
+        count for status, count in summary.status_counts.items() if status.lower() == INTERVIEW_REQUEST_STATUS
+    )
+    return summary.email_count, interview_requests
+
+
+def count_statuses(summary: UserEmailSummaries) -> Dict[str, int]:
+    """Emails by application status, stripped and lowercased."""
+    counts = {}
+    for status, count in summary.status_counts.items():
+        status = status.strip().lower()
+        counts[status] = counts.get(status, 0) + count
+    return counts
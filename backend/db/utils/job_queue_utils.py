@@ -0,0 +1,172 @@
+"""
+Postgres backed queue of email ingestion jobs. The web app only enqueues;
+worker.py claims jobs with SELECT ... FOR UPDATE SKIP LOCKED, so any number
+of workers can poll the same table without running a job twice.
+"""
+
+import logging
+from datetime import timedelta
+from typing import Optional
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, select
+
+from db.ingestion_jobs import FAILED, FINISHED, MAX_ATTEMPTS, QUEUED, RUNNING, IngestionJobs, utc_now
+
+logger = logging.getLogger(__name__)
+
+JOB_VISIBILITY_TIMEOUT_SECONDS = 5 * 60  # a running job is reclaimed once its lock is this old
+JOB_RETRY_BASE_SECONDS = 60  # delay before the first retry, doubled for every further one
+JOB_RETRY_MAX_SECONDS = 60 * 60
+
+
+def enqueue_ingestion_job(session: Session, user_id: str, payload: dict) -> int:
+    """
+    Queues an ingestion job for the user and returns its id. If the user
+    already has a queued job, that job is reused with the new payload.
+    The caller commits the session.
+    """
+    now = utc_now()
+    statement = insert(IngestionJobs).values(
+        user_id=user_id,
+        status=QUEUED,
+        payload=payload,
+        attempts=0,
+        max_attempts=MAX_ATTEMPTS,
+        run_after=now,
+        created=now,
+        updated=now,
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=["user_id"],
+        index_where=sa.text("status = 'queued'"),
+        set_={"payload": statement.excluded.payload, "updated": now},
+    ).returning(IngestionJobs.id)
+    return session.execute(statement).scalar_one()
+
+
+def claim_job(
+    session: Session, worker_id: str, visibility_timeout: int = JOB_VISIBILITY_TIMEOUT_SECONDS
+) -> Optional[IngestionJobs]:
+    """
+    Locks the next due job for worker_id and commits, or returns None when
+    no job is due. Due jobs are queued ones whose run_after has passed and
+    running ones whose lock expired. A queued job is not due while the same
+    user has a job running, so a user's jobs never run at the same time.
+    """
+    while True:
+        now = utc_now()
+        running = aliased(IngestionJobs)
+        user_has_running_job = (
+            select(running.id)
+            .where(
+                (running.user_id == IngestionJobs.user_id)
+                & (running.status == RUNNING)
+                & (running.locked_until > now)
+            )
+            .exists()
+        )
+        statement = (
+            select(IngestionJobs)
+            .where(
+                ((IngestionJobs.status == QUEUED) & (IngestionJobs.run_after <= now) & ~user_has_running_job)
+                | ((IngestionJobs.status == RUNNING) & (IngestionJobs.locked_until <= now))
+            )
+            .order_by(IngestionJobs.run_after)
+            .limit(1)
+            .with_for_update(skip_locked=True, of=IngestionJobs)
+        )
+        job = session.execute(statement).scalars().first()
+        if job is None:
+            session.rollback()
+            return None
+
+        if job.status == RUNNING:
+            logger.warning(f"Job {job.id} was abandoned by worker {job.locked_by}")
+            if job.attempts >= job.max_attempts:
+                fail_job(session, job, "abandoned by its worker")
+                continue
+        job.status = RUNNING
+        job.attempts += 1
+        job.locked_by = worker_id
+        job.locked_until = now + timedelta(seconds=visibility_timeout)
+        job.updated = now
+        session.commit()
+        return job
+
+
+def extend_job_lock(
+    session: Session, job_id: int, worker_id: str, visibility_timeout: int = JOB_VISIBILITY_TIMEOUT_SECONDS
+) -> bool:
+    """
+    Pushes back the lock expiry of a job the worker is still running. Returns
+    False if the job was reclaimed by another worker in the meantime.
+    """
+    now = utc_now()
+    result = session.execute(
+        sa.update(IngestionJobs)
+        .where(
+            (IngestionJobs.id == job_id)
+            & (IngestionJobs.status == RUNNING)
+            & (IngestionJobs.locked_by == worker_id)
+        )
+        .values(locked_until=now + timedelta(seconds=visibility_timeout), updated=now)
+    )
+    session.commit()
+    return result.rowcount == 1
+
+
+def complete_job(session: Session, job: IngestionJobs) -> None:
+    job.status = FINISHED
+    job.payload = None  # do not keep the credentials around
+    job.locked_until = None
+    job.updated = utc_now()
+    session.commit()
+
+
+def get_retry_delay(attempts: int) -> int:
+    return min(JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1), JOB_RETRY_MAX_SECONDS)
+
+
+def fail_job(session: Session, job: IngestionJobs, error: str) -> None:
+    """
+    Queues the job again after an exponential backoff, or marks it failed
+    once it has used up its attempts.
+    """
+    now = utc_now()
+    job.last_error = error
+    job.locked_until = None
+    job.updated = now
+    if job.attempts >= job.max_attempts:
+        logger.error(f"Job {job.id} failed after {job.attempts} attempts: {error}")
+        job.status = FAILED
+        job.payload = None
+        session.commit()
+        return
+
+    delay = get_retry_delay(job.attempts)
+    logger.warning(f"Job {job.id} failed (attempt {job.attempts}), retrying in {delay} seconds: {error}")
+    queued_job = session.execute(
+        select(IngestionJobs).where(
+            (IngestionJobs.user_id == job.user_id) & (IngestionJobs.status == QUEUED)
+        )
+    ).scalars().first()
+    if queued_job is None:
+        job.status = QUEUED
+        job.run_after = now + timedelta(seconds=delay)
+        try:
+            session.commit()
+            return
+        except IntegrityError:
+            # a job was enqueued for the user in the meantime
+            session.rollback()
+            job.last_error = error
+            job.locked_until = None
+            job.updated = now
+    # the user asked again in the meantime, the queued job runs instead
+    job.status = FAILED
+    job.payload = None
+    session.commit()
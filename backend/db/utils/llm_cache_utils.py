@@ -0,0 +1,135 @@
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable
+
+from cachetools import LRUCache
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, select
+
+from db.llm_extraction_cache import LlmExtractionCache
+from utils.llm_utils import PROMPT_VERSION
+from utils.metrics_utils import increment
+
+logger = logging.getLogger(__name__)
+
+MEMORY_CACHE_SIZE = 10000
+
+
+def normalize_email_text(email_text: str) -> str:
+    """
+    Collapses runs of whitespace so that emails differing only in line breaks
+    or indentation share a cache entry.
+    """
+    return " ".join((email_text or "").split())
+
+
+def get_content_hash(email_text: str) -> str:
+    key = f"{PROMPT_VERSION}\n{normalize_email_text(email_text)}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    """
+    Remembers LLM extraction results by email content, so that identical emails
+    (e.g. ATS confirmation templates) are only ever sent to the model once.
+
+    Lookups go to an in-process LRU first and then to the llm_extraction_cache
+    table. Hits and misses are counted in the metrics as llm_cache.*.
+    """
+
+    def __init__(self, maxsize: int = MEMORY_CACHE_SIZE):
+        self.memory = LRUCache(maxsize=maxsize)
+        self.lock = threading.Lock()
+
+    def get_many(self, email_texts: Iterable[str]) -> Dict[str, dict]:
+        """Returns the cached results for the given texts, keyed by text."""
+        from database import engine
+
+        hashes = {}
+        for email_text in email_texts:
+            hashes.setdefault(get_content_hash(email_text), []).append(email_text)
+
+        found = {}
+        with self.lock:
+            for content_hash in hashes:
+                if content_hash in self.memory:
+                    found[content_hash] = self.memory[content_hash]
+        memory_hits = len(found)
+
+        missing = [x for x in hashes if x not in found]
+        if missing:
+            try:
+                with Session(engine) as session:
+                    rows = session.exec(
+                        select(LlmExtractionCache).where(
+                            LlmExtractionCache.content_hash.in_(missing)
+                        )
+                    ).all()
+            except Exception as e:
+                logger.error(f"Error reading LLM extraction cache: {e}")
+                rows = []
+            with self.lock:
+                for row in rows:
+                    self.memory[row.content_hash] = row.result
+                    found[row.content_hash] = row.result
+
+        increment("llm_cache.memory_hits", memory_hits)
+        increment("llm_cache.db_hits", len(found) - memory_hits)
+        increment("llm_cache.misses", len(hashes) - len(found))
+
+        # hand out copies so callers cannot modify the cached results
+        return {
+            email_text: dict(result)
+            for content_hash, result in found.items()
+            for email_text in hashes[content_hash]
+        }
+
+    def put_many(self, results: Dict[str, Any]) -> None:
+        """
+        Stores results keyed by email text. Failed extractions (None) and
+        results that are not JSON objects (the model may answer with any
+        JSON, e.g. a string or a list) are not cached.
+        """
+        from database import engine
+
+        rows = {
+            get_content_hash(email_text): dict(result)
+            for email_text, result in results.items()
+            if isinstance(result, dict)
+        }
+        if not rows:
+            return
+
+        with self.lock:
+            self.memory.update(rows)
+        created = datetime.now(timezone.utc)
+        try:
+            with Session(engine) as session:
+                session.exec(
+                    insert(LlmExtractionCache)
+                    .values(
+                        [
+                            {
+                                "content_hash": content_hash,
+                                "prompt_version": PROMPT_VERSION,
+                                "result": result,
+                                "created": created,
+                            }
+                            for content_hash, result in rows.items()
+                        ]
+                    )
+                    .on_conflict_do_nothing(index_elements=["content_hash"])
+                )
+                session.commit()
+        except Exception as e:
+            # the in-process cache still holds the results, so this only costs quota after a restart
+            logger.error(f"Error storing LLM extraction cache entries: {e}")
+
+    def clear_memory(self) -> None:
+        with self.lock:
+            self.memory.clear()
+
+
+extraction_cache = ExtractionCache()
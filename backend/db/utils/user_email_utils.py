@@ -1,12 +1,21 @@
 from db.user_emails import UserEmails
+from db.utils.email_summary_utils import rebuild_user_email_summary, update_user_email_summary
+from collections import defaultdict
 from datetime import datetime, timezone
+import base64
 import email.utils
+import json
 import logging
-from database import engine
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+from sqlalchemy import String, any_, bindparam, func, literal_column, tuple_
+from sqlalchemy.dialects.postgresql import ARRAY, insert
 from sqlmodel import Session, select
 
 logger = logging.getLogger(__name__)
 
+UPSERT_CHUNK_SIZE = 500  # rows per INSERT statement
+EXPORT_BATCH_SIZE = 1000  # rows fetched at a time by iter_user_email_rows
+
 def parse_email_date(date_str: str) -> datetime:
     """
     Converts an email date string into a Python datetime object
@@ -18,16 +27,196 @@ def parse_email_date(date_str: str) -> datetime:
     return dt
 
 
-def check_email_exists(user_id: str, email_id: str) -> bool:
+def get_existing_email_ids(session: Session, user_id: str, email_ids: Iterable[str]) -> Set[str]:
+    """
+    Returns the ids among email_ids that are already stored for the user,
+    using a single query however many ids are passed.
+    """
+    email_ids = list(email_ids)
+    if not email_ids:
+        return set()
+    statement = select(UserEmails.id).where(
+        (UserEmails.user_id == user_id)
+        & (UserEmails.id == any_(bindparam("email_ids", email_ids, type_=ARRAY(String))))
+    )
+    return set(session.execute(statement).scalars().all())
+
+
+def upsert_user_emails(
+    session: Session,
+    records: Iterable[UserEmails],
+    update_existing: bool = False,
+    chunk_size: int = UPSERT_CHUNK_SIZE,
+) -> Dict[str, int]:
+    """
+    Writes UserEmails records with INSERT ... ON CONFLICT (id, user_id), so rows
+    stored in the meantime by an overlapping run do not fail the whole write.
+    Existing rows are left alone, or overwritten when update_existing is set.
+    Rows are sent in chunks of chunk_size; the caller commits the session.
+    The users' summaries are updated for the rows written, see
+    db/utils/email_summary_utils.py.
+
+    Returns the number of rows inserted, updated and skipped.
+    """
+    columns = [column.name for column in UserEmails.__table__.columns]
+    counts = {"inserted": 0, "updated": 0, "skipped": 0}
+    rows: List[dict] = []
+    inserted_rows = defaultdict(list)  # user_id -> rows inserted
+    updated_user_ids = set()
+
+    def write_chunk():
+        # Postgres refuses to touch the same row twice in one statement, so the
+        # last record for an id wins
+        unique_rows = {(row["id"], row["user_id"]): row for row in rows}
+        statement = insert(UserEmails).values(list(unique_rows.values()))
+        if update_existing:
+            statement = statement.on_conflict_do_update(
+                index_elements=["id", "user_id"],
+                set_={
+                    column: statement.excluded[column]
+                    for column in columns
+                    if column not in ("id", "user_id")
+                },
+            )
+        else:
+            statement = statement.on_conflict_do_nothing(index_elements=["id", "user_id"])
+        # xmax is 0 for a freshly inserted row and set for an updated one;
+        # the rows come back as stored, for the summaries
+        written = session.execute(
+            statement.returning(*UserEmails.__table__.columns, literal_column("xmax = 0").label("is_insert"))
+        ).mappings().all()
+        for row in written:
+            if row["is_insert"]:
+                inserted_rows[row["user_id"]].append(row)
+            else:
+                updated_user_ids.add(row["user_id"])
+        inserted = sum(1 for row in written if row["is_insert"])
+        counts["inserted"] += inserted
+        counts["updated"] += len(written) - inserted
+        counts["skipped"] += len(rows) - len(written)
+        rows.clear()
+
+    for record in records:
+        rows.append({column: getattr(record, column) for column in columns})
+        if len(rows) >= chunk_size:
+            write_chunk()
+    if rows:
+        write_chunk()
+
+    for user_id in updated_user_ids:
+        # what an updated row counted for before is gone
+        rebuild_user_email_summary(session, user_id)
+    for user_id, added in inserted_rows.items():
+        if user_id not in updated_user_ids:
+            update_user_email_summary(session, user_id, added=added)
+    return counts
+
+
+def delete_user_email(session: Session, record: UserEmails) -> None:
+    """Deletes a stored email and updates the user's summary. The caller commits."""
+    removed = {column.name: getattr(record, column.name) for column in UserEmails.__table__.columns}
+    session.delete(record)
+    session.flush()
+    update_user_email_summary(session, record.user_id, removed=[removed])
+
+
+def encode_email_cursor(record: UserEmails) -> str:
+    """An opaque cursor pointing after record in the newest first order."""
+    key = json.dumps([record.received_at.isoformat(), record.id])
+    return base64.urlsafe_b64encode(key.encode()).decode("ASCII")
+
+
+def decode_email_cursor(cursor: str) -> Tuple[datetime, str]:
+    """The (received_at, id) a cursor points after. Raises ValueError if it is malformed."""
+    try:
+        received_at, email_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ASCII")))
+        return datetime.fromisoformat(received_at), str(email_id)
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def filter_user_emails(
+    statement,
+    user_id: str,
+    status: Optional[List[str]] = None,
+    company: Optional[str] = None,
+    received_after: Optional[datetime] = None,
+    received_before: Optional[datetime] = None,
+):
     """
-    Checks if an email with the given emailId and userId exists in the database.
+    Restricts statement to the user's emails with any of the application
+    statuses and the company given (both case insensitive), received from
+    received_after until before received_before.
     """
-    with Session(engine) as session:
-        statement = select(UserEmails).where(
-            (UserEmails.user_id == user_id) & (UserEmails.id == email_id)
+    statement = statement.where(UserEmails.user_id == user_id)
+    if status:
+        statement = statement.where(
+            func.lower(UserEmails.application_status).in_([x.strip().lower() for x in status])
         )
-        result = session.exec(statement).first()
-        return result is not None
+    if company:
+        statement = statement.where(func.lower(UserEmails.company_name) == company.strip().lower())
+    if received_after:
+        statement = statement.where(UserEmails.received_at >= received_after)
+    if received_before:
+        statement = statement.where(UserEmails.received_at < received_before)
+    return statement
+
+
+def get_user_emails(session: Session, user_id: str, **filters) -> List[UserEmails]:
+    """All the user's emails, newest first, see filter_user_emails for filters."""
+    statement = filter_user_emails(select(UserEmails), user_id, **filters)
+    statement = statement.order_by(UserEmails.received_at.desc(), UserEmails.id.desc())
+    return list(session.execute(statement).scalars())
+
+
+def get_user_emails_page(
+    session: Session,
+    user_id: str,
+    page_size: int,
+    cursor: Optional[str] = None,
+    **filters,
+) -> Tuple[List[UserEmails], Optional[str]]:
+    """
+    A page of the user's emails, newest first, after the cursor of the
+    previous page, and the cursor of the next page (None on the last page).
+
+    Pages are read with a keyset on (received_at, id) rather than an
+    offset, so reading a page costs the same however deep it is and
+    emails stored meanwhile do not shift the following pages.
+    """
+    statement = filter_user_emails(select(UserEmails), user_id, **filters)
+    if cursor:
+        statement = statement.where(
+            tuple_(UserEmails.received_at, UserEmails.id) < tuple_(*decode_email_cursor(cursor))
+        )
+    statement = statement.order_by(UserEmails.received_at.desc(), UserEmails.id.desc())
+    # one more row than asked for tells whether there is a next page
+    records = list(session.execute(statement.limit(page_size + 1)).scalars())
+    if len(records) <= page_size:
+        return records, None
+    records = records[:page_size]
+    return records, encode_email_cursor(records[-1])
+
+
+def count_user_emails(session: Session, user_id: str, **filters) -> int:
+    """The number of the user's emails, counted in the database."""
+    statement = filter_user_emails(select(func.count()).select_from(UserEmails), user_id, **filters)
+    return session.execute(statement).scalar_one()
+
+
+def iter_user_email_rows(
+    session: Session, user_id: str, columns: Sequence[str], batch_size: int = EXPORT_BATCH_SIZE
+) -> Iterator[Sequence[tuple]]:
+    """
+    The user's emails, newest first, as batches of (column value, ...)
+    tuples. Rows are fetched batch_size at a time from a server-side
+    cursor, so only one batch is held in memory however many there are.
+    """
+    statement = filter_user_emails(select(*(getattr(UserEmails, column) for column in columns)), user_id)
+    statement = statement.order_by(UserEmails.received_at.desc(), UserEmails.id.desc())
+    result = session.execute(statement.execution_options(yield_per=batch_size))
+    for batch in result.partitions():
+        yield [tuple(row) for row in batch]
 
 
 def create_user_email(user, message_data: dict) -> UserEmails:
@@ -37,9 +226,6 @@ def create_user_email(user, message_data: dict) -> UserEmails:
     try:
         received_at_str = message_data["received_at"]
         received_at = parse_email_date(received_at_str)  # parse_email_date function was created as different date formats were being pulled from the data
-        if check_email_exists(user.user_id, message_data["id"]):
-            logger.info(f"Email with ID {message_data['id']} already exists in the database.")
-            return None
         return UserEmails(
             id=message_data["id"],
             user_id=user.user_id,
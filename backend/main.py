@@ -15,15 +15,20 @@ from db.utils.user_utils import add_user
 from utils.config_utils import get_settings
 from session.session_layer import validate_session
 from contextlib import asynccontextmanager
+import database
 from database import create_db_and_tables
+from utils.progress_utils import ProgressListener
 
 # Import routes
-from routes import email_routes, auth_routes, file_routes, users_routes, start_date_routes
+from routes import email_routes, auth_routes, file_routes, users_routes, start_date_routes, metrics_routes
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     create_db_and_tables()
+    # pushes the progress of the runs in the workers to the progress streams
+    progress_listener = ProgressListener(database.engine).start()
     yield
+    progress_listener.stop()
 
 app = FastAPI(lifespan=lifespan)
 settings = get_settings()
@@ -37,6 +42,7 @@ app.include_router(email_routes.router)
 app.include_router(file_routes.router)
 app.include_router(users_routes.router)
 app.include_router(start_date_routes.router)
+app.include_router(metrics_routes.router)
 
 limiter = Limiter(key_func=get_remote_address)
 app.state.limiter = limiter  # Ensure limiter is assigned
@@ -63,6 +69,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow all HTTP methods (GET, POST, etc.)
     allow_headers=["*"],  # Allow all headers
+    expose_headers=["X-Total-Count", "X-Next-Cursor"],  # /get-emails pagination
 )
 
 app.add_middleware(
@@ -71,6 +78,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow all HTTP methods (GET, POST, etc.)
     allow_headers=["*"],  # Allow all headers
+    expose_headers=["X-Total-Count", "X-Next-Cursor"],  # /get-emails pagination
 )
 
 # Set up Jinja2 templates
@@ -1,22 +1,62 @@
+import asyncio
 import logging
-from typing import List, Optional
-from fastapi import APIRouter, Depends, Request, HTTPException, BackgroundTasks
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
-from sqlmodel import Session, select, desc
+from typing import Annotated, Callable, List, Optional, Set, Tuple
+from fastapi import APIRouter, Depends, Query, Request, Response, HTTPException
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlmodel import Session, select
 from googleapiclient.discovery import build
 from db.user_emails import UserEmails
 from db import processing_tasks as task_models
-from db.utils.user_email_utils import create_user_email
+from db.backfill_windows import BackfillWindows
+from db.utils.backfill_utils import (
+    delete_backfill_windows,
+    fail_backfill_window,
+    finish_backfill_window,
+    get_unfinished_backfill_windows,
+    plan_backfill_windows,
+    start_backfill_window,
+)
+from db.utils.user_email_utils import (
+    count_user_emails,
+    create_user_email,
+    delete_user_email,
+    get_existing_email_ids,
+    get_user_emails,
+    get_user_emails_page,
+    upsert_user_emails,
+)
+from db.utils.job_queue_utils import enqueue_ingestion_job
+from db.utils.llm_cache_utils import extraction_cache
 from utils.auth_utils import AuthenticatedUser
-from utils.email_utils import get_email_ids, get_email
-from utils.llm_utils import process_email
+from utils.email_utils import (
+    get_added_message_ids,
+    get_email_id_pages,
+    get_email_id_pages_sharded,
+    get_emails_batched,
+    get_history_id,
+)
+from utils.llm_utils import classify_emails, llm_scheduler
 from utils.config_utils import get_settings
+from utils.metrics_utils import increment
+from utils.pipeline_utils import run_in_thread
+from utils.progress_utils import (
+    ProgressReporter,
+    get_progress,
+    notify_progress,
+    publish_progress,
+    subscribe,
+    unsubscribe,
+)
+from utils.checkpoint_utils import PageCheckpoint
 from session.session_layer import validate_session
 import database
 from google.oauth2.credentials import Credentials
 import json
-from start_date.storage import get_start_date_email_filter
-from constants import QUERY_APPLIED_EMAIL_FILTER
+from start_date.storage import (
+    get_start_date_email_filter,
+    parse_start_date,
+)
 from datetime import datetime, timedelta
 from slowapi import Limiter
 from slowapi.util import get_remote_address
@@ -31,6 +71,14 @@ settings = get_settings()
 APP_URL = settings.APP_URL
 
 SECONDS_BETWEEN_FETCHING_EMAILS = 1 * 60 * 60  # 1 hour
+SECONDS_BEFORE_RUN_IS_STALE = 15 * 60  # a started run without progress for this long is resumed
+
+# ingestion pipeline: queue sizes between stages and rows written per commit
+LIST_QUEUE_SIZE = 500  # message ids
+FETCH_QUEUE_SIZE = 100  # parsed emails
+CLASSIFY_QUEUE_SIZE = 100  # classified emails
+EMAIL_WRITE_CHUNK_SIZE = 50
+PROGRESS_STREAM_KEEPALIVE_SECONDS = 15
 
 # FastAPI router for email routes
 router = APIRouter()
@@ -42,50 +90,167 @@ async def processing(request: Request, db_session: database.DBSession, user_id:
         logger.info("user_id: not found, redirecting to login")
         return RedirectResponse("/logout", status_code=303)
 
-    process_task_run: task_models.TaskRuns = db_session.get(task_models.TaskRuns, user_id)
-
-    if process_task_run is None:
+    progress = get_processing_progress(db_session, user_id)
+    if progress is None:
         raise HTTPException(
             status_code=404, detail="Processing has not started."
         )
 
-    if process_task_run.status == task_models.FINISHED:
+    if progress["status"] == task_models.FINISHED:
         logger.info("user_id: %s processing complete", user_id)
-        return JSONResponse(
-            content={
-                "message": "Processing complete",
-                "processed_emails": process_task_run.processed_emails,
-                "total_emails": process_task_run.total_emails,
-            }
-        )
     else:
         logger.info("user_id: %s processing not complete for file", user_id)
-        return JSONResponse(
-            content={
-                "message": "Processing in progress",
-                "processed_emails": process_task_run.processed_emails,
-                "total_emails": process_task_run.total_emails,
-            }
+    return JSONResponse(content=get_processing_content(progress))
+
+
+@router.get("/processing/stream")
+async def processing_stream(request: Request, db_session: database.DBSession, user_id: str = Depends(validate_session)):
+    """
+    Server-sent events with the progress of the user's email processing: the
+    current progress first, then every change published by the run, until it
+    finishes or fails. GET /processing stays available for clients that
+    cannot keep the stream open.
+    """
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    # subscribe before reading the current progress so no change is missed in between
+    updates = subscribe(user_id)
+    progress = get_processing_progress(db_session, user_id)
+    if progress is None:
+        unsubscribe(user_id, updates)
+        raise HTTPException(
+            status_code=404, detail="Processing has not started."
         )
 
+    async def events():
+        nonlocal progress
+        try:
+            yield f"data: {json.dumps(get_processing_content(progress))}\n\n"
+            while progress["status"] == task_models.STARTED:
+                try:
+                    progress = await asyncio.wait_for(
+                        updates.get(), timeout=PROGRESS_STREAM_KEEPALIVE_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    if get_progress(user_id) is None:
+                        # nothing was published or notified for the run yet, e.g. its
+                        # job waits for a worker: check the database in case it was missed
+                        progress = await run_in_threadpool(read_processing_progress, user_id)
+                        if progress is None:
+                            return
+                        yield f"data: {json.dumps(get_processing_content(progress))}\n\n"
+                    else:
+                        yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {json.dumps(get_processing_content(progress))}\n\n"
+        finally:
+            unsubscribe(user_id, updates)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def get_processing_progress(db_session: Session, user_id: str) -> Optional[dict]:
+    """
+    Progress of the user's email processing, as published in memory by a run
+    in this process or notified by one in a worker (see ProgressListener), or
+    else as last saved in processing_task_runs.
+    """
+    # progress published in memory saves a query per poll
+    progress = get_progress(user_id)
+    if progress is not None:
+        return progress
+    process_task_run: task_models.TaskRuns = db_session.get(task_models.TaskRuns, user_id)
+    if process_task_run is None:
+        return None
+    return {
+        "status": process_task_run.status,
+        "processed_emails": process_task_run.processed_emails,
+        "total_emails": process_task_run.total_emails,
+    }
+
+
+def read_processing_progress(user_id: str) -> Optional[dict]:
+    with Session(database.engine) as db_session:
+        return get_processing_progress(db_session, user_id)
+
+
+def get_processing_content(progress: dict) -> dict:
+    if progress["status"] == task_models.FINISHED:
+        message = "Processing complete"
+    elif progress["status"] == task_models.FAILED:
+        message = "Processing failed"
+    else:
+        message = "Processing in progress"
+    return {
+        "message": message,
+        "status": progress["status"],
+        "processed_emails": progress["processed_emails"],
+        "total_emails": progress["total_emails"],
+    }
+
 
 @router.get("/get-emails", response_model=List[UserEmails])
-@limiter.limit("5/minute")
-def query_emails(request: Request, db_session: database.DBSession, user_id: str = Depends(validate_session)) -> None:
+@limiter.limit("60/minute")
+def query_emails(
+    request: Request,
+    response: Response,
+    db_session: database.DBSession,
+    user_id: str = Depends(validate_session),
+    cursor: Annotated[Optional[str], Query()] = None,
+    page_size: Annotated[Optional[int], Query(ge=1, le=settings.EMAILS_MAX_PAGE_SIZE)] = None,
+    status: Annotated[Optional[List[str]], Query()] = None,
+    company: Annotated[Optional[str], Query()] = None,
+    received_after: Annotated[Optional[datetime], Query()] = None,
+    received_before: Annotated[Optional[datetime], Query()] = None,
+    unpaginated: Annotated[bool, Query()] = False,
+):
+    """
+    A page of the user's emails, newest first, optionally filtered by
+    application status (repeatable), company and date range.
+
+    The X-Next-Cursor header holds the cursor to pass for the next page and
+    is left out on the last one. The first page (without a cursor) also has
+    the number of matching emails in X-Total-Count. With unpaginated set,
+    every matching email is returned at once.
+    """
+    filters = {
+        "status": status,
+        "company": company,
+        "received_after": received_after,
+        "received_before": received_before,
+    }
     try:
         logger.info(f"Fetching emails for user_id: {user_id}")
-
-        # Query emails sorted by date (newest first)
-        statement = select(UserEmails).where(UserEmails.user_id == user_id).order_by(desc(UserEmails.received_at))
-        user_emails = db_session.exec(statement).all()
+        if unpaginated:
+            user_emails = get_user_emails(db_session, user_id, **filters)
+            response.headers["X-Total-Count"] = str(len(user_emails))
+        else:
+            user_emails, next_cursor = get_user_emails_page(
+                db_session, user_id, page_size or settings.EMAILS_PAGE_SIZE, cursor, **filters
+            )
+            if next_cursor:
+                response.headers["X-Next-Cursor"] = next_cursor
+            if not cursor:
+                # later pages leave the count out, it was read with the first one
+                total = len(user_emails) if not next_cursor else count_user_emails(db_session, user_id, **filters)
+                response.headers["X-Total-Count"] = str(total)
 
         logger.info(f"Found {len(user_emails)} emails for user_id: {user_id}")
         return user_emails  # Return empty list if no emails exist
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching emails for user_id {user_id}: {e}")
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
-        
+
 
 @router.delete("/delete-email/{email_id}")
 async def delete_email(request: Request, db_session: database.DBSession, email_id: str, user_id: str = Depends(validate_session)):
@@ -106,9 +271,8 @@ async def delete_email(request: Request, db_session: database.DBSession, email_i
                 status_code=404, detail=f"Email with id {email_id} not found"
             )
 
-        # Delete the email record
-        db_session.delete(email_record)
-        db_session.flush()
+        # Delete the email record, and count it out of the user's summary
+        delete_user_email(db_session, email_record)
 
         logger.info(f"Email with id {email_id} deleted successfully for user_id {user_id}")
         return {"message": "Item deleted successfully"}
@@ -123,7 +287,7 @@ async def delete_email(request: Request, db_session: database.DBSession, email_i
 @router.post("/fetch-emails")
 @limiter.limit("5/minute")
 async def start_fetch_emails(
-    request: Request, background_tasks: BackgroundTasks, user_id: str = Depends(validate_session)
+    request: Request, user_id: str = Depends(validate_session)
 ):
     """Starts the background task for fetching and processing emails."""
     
@@ -140,12 +304,12 @@ async def start_fetch_emails(
         # Convert JSON string back to Credentials object
         creds_dict = json.loads(creds_json)
         creds = Credentials.from_authorized_user_info(creds_dict)  # Convert dict to Credentials
-        user = AuthenticatedUser(creds)
+        user = AuthenticatedUser(creds, user_id=user_id)
 
         logger.info(f"Starting email fetching process for user_id: {user_id}")
 
-        # Start email fetching in the background
-        background_tasks.add_task(fetch_emails_to_db, user, request, user_id=user_id)
+        # a worker (see worker.py) picks the job up
+        enqueue_fetch_emails(request, user.creds, user_id)
 
         return JSONResponse(content={"message": "Email fetching started"}, status_code=200)
     except Exception as e:
@@ -153,7 +317,75 @@ async def start_fetch_emails(
         raise HTTPException(status_code=500, detail="Failed to authenticate user")
 
 
-def fetch_emails_to_db(user: AuthenticatedUser, request: Request, last_updated: Optional[datetime] = None, *, user_id: str) -> None:
+def enqueue_fetch_emails(
+    request: Request, creds: Credentials, user_id: str, last_updated: Optional[datetime] = None
+) -> Optional[int]:
+    """
+    Queues fetch_emails_to_db for a worker, with what it needs from the web
+    session, and returns the job id, or None if the user's emails were
+    fetched less than an hour ago.
+
+    The user's run is marked started in the same transaction, so /processing
+    does not report the previous run as complete while the job waits for a
+    worker.
+    """
+    payload = {
+        "creds": creds.to_json(),
+        "session": {
+            "start_date": request.session.get("start_date"),
+            "is_new_user": request.session.get("is_new_user"),
+        },
+        "last_updated": last_updated.isoformat() if last_updated else None,
+    }
+    with Session(database.engine) as db_session:
+        process_task_run = db_session.get(task_models.TaskRuns, user_id, with_for_update=True)
+        if process_task_run is None:
+            process_task_run = task_models.TaskRuns(user_id=user_id, status=task_models.STARTED)
+            db_session.add(process_task_run)
+        elif process_task_run.status == task_models.FINISHED and fetched_recently(process_task_run):
+            # limit how frequently emails can be fetched by a specific user
+            logger.warning(f"user_id:{user_id} Less than an hour since last fetch of emails, not queued")
+            request.session["is_new_user"] = False
+            return None
+        elif not is_resumable(process_task_run, exclusive=True):
+            # a run resuming from its checkpoint carries on with its counts
+            process_task_run.processed_emails = 0
+            process_task_run.total_emails = 0
+        process_task_run.status = task_models.STARTED
+        job_id = enqueue_ingestion_job(db_session, user_id, payload)
+        db_session.commit()
+        # replaces the previous run's progress held in memory by the web processes
+        progress = {
+            "status": process_task_run.status,
+            "processed_emails": process_task_run.processed_emails,
+            "total_emails": process_task_run.total_emails,
+        }
+        publish_progress(user_id, **progress)
+        notify_progress(database.engine, user_id, progress)
+    logger.info(f"user_id:{user_id} queued ingestion job {job_id}")
+    # Update session to remove "new user" status
+    request.session["is_new_user"] = False
+    return job_id
+
+
+def fetch_emails_to_db(
+    user: AuthenticatedUser,
+    session_data: dict,
+    last_updated: Optional[datetime] = None,
+    *,
+    user_id: str,
+    exclusive: bool = False,
+) -> None:
+    """
+    Fetches, classifies and stores the user's job application emails.
+    session_data holds the start_date and is_new_user values of the user's
+    web session. exclusive is set by callers that guarantee no other run for
+    the user is active (the job queue does), so that a run left started by
+    a worker that died is resumed right away.
+
+    A backfill reaching back further than BACKFILL_WINDOW_DAYS is split into
+    date windows that are processed newest first, see ingest_backfill_windows.
+    """
     logger.info(f"Fetching emails to db for user_id: {user_id}")
 
     with Session(database.engine) as db_session:
@@ -165,123 +397,411 @@ def fetch_emails_to_db(user: AuthenticatedUser, request: Request, last_updated:
             # if this is the first time running the task for the user, create a record
             process_task_run = task_models.TaskRuns(user_id=user_id)
             db_session.add(process_task_run)
-        elif datetime.now() - process_task_run.updated < timedelta(
-            seconds=SECONDS_BETWEEN_FETCHING_EMAILS
-        ):
-            # limit how frequently emails can be fetched by a specific user
+        elif is_resumable(process_task_run, exclusive):
+            logger.info(
+                f"user_id:{user_id} resuming interrupted email fetching from its checkpoint"
+            )
+        elif not exclusive and fetched_recently(process_task_run):
+            # limit how frequently emails can be fetched by a specific user; a
+            # queued job was already limited by enqueue_fetch_emails
             logger.warning(
                 "Less than an hour since last fetch of emails for user",
                 extra={"user_id": user_id},
             )
             return
 
-        # this is helpful if the user applies for a new job and wants to rerun the analysis during the same session
-        process_task_run.processed_emails = 0
-        process_task_run.total_emails = 0
+        resuming = is_resumable(process_task_run, exclusive)
+        if resuming:
+            query = process_task_run.query
+            checkpoint = PageCheckpoint(
+                process_task_run.page_token, process_task_run.processed_message_ids or []
+            )
+        else:
+            query = get_email_query(session_data, last_updated, user_id)
+            checkpoint = PageCheckpoint()
+            # this is helpful if the user applies for a new job and wants to rerun the analysis during the same session
+            process_task_run.processed_emails = 0
+            process_task_run.total_emails = 0
+            process_task_run.query = query
+            process_task_run.page_token = None
+            process_task_run.processed_message_ids = []
         process_task_run.status = task_models.STARTED
 
+        backfill_windows = []
+        if resuming:
+            # an interrupted backfill carries on with its unfinished windows
+            backfill_windows = get_unfinished_backfill_windows(db_session, user_id)
+        elif is_long_backfill(session_data, last_updated):
+            backfill_windows = plan_backfill_windows(
+                db_session,
+                user_id,
+                session_data.get("start_date"),
+                settings.BACKFILL_WINDOW_DAYS,
+                settings.GMAIL_LIST_MAX_QUERY_LENGTH if settings.GMAIL_LIST_CONCURRENCY > 1 else None,
+            )
+        else:
+            delete_backfill_windows(db_session, user_id)
+
         db_session.commit()  # sync with the database so calls in the future reflect the task is already started
+        # progress is published in memory for every email but saved to the database in batches
+        progress = ProgressReporter(db_session, process_task_run)
 
-        start_date = request.session.get("start_date")
-        logger.info(f"start_date: {start_date}")
-        start_date_query = get_start_date_email_filter(start_date)
-        is_new_user = request.session.get("is_new_user")
-
-        query = start_date_query
-        # check for users last updated email
-        if last_updated:
-            # this converts our date time to number of seconds 
-            additional_time = int(last_updated.timestamp())
-            # we append it to query so we get only emails recieved after however many seconds
-            # for example, if the newest email you’ve stored was received at 2025‑03‑20 14:32 UTC, we convert that to 1710901920s 
-            # and tell Gmail to fetch only messages received after March 20, 2025 at 14:32 UTC.
-            if not start_date or not is_new_user:
-                query = QUERY_APPLIED_EMAIL_FILTER
-                query += f" after:{additional_time}"
-            
-                logger.info(f"user_id:{user_id} Fetching emails after {last_updated.isoformat()}")
-        else:
-            logger.info(f"user_id:{user_id} Fetching all emails (no last_date maybe with start date)")
-            logger.info(
-                f"user_id:{user_id} Fetching all emails (no last_date maybe with start date)"
+        service = build("gmail", "v1", credentials=user.creds)
+        # a resumed run keeps the stored history id, so the next sync still
+        # covers everything added since the last finished run
+        history_id, added_ids = None, None
+        if not resuming:
+            history_id, added_ids = get_mailbox_changes(
+                service, process_task_run, session_data, last_updated, user_id
             )
 
-        service = build("gmail", "v1", credentials=user.creds)
+        # A resumed run continues the counts of the interrupted one. failed and
+        # bytes_downloaded are filled in by the fetch stage: emails that could
+        # not be downloaded and bytes downloaded.
+        processed_before = process_task_run.processed_emails
+        counts = {
+            "processed": processed_before,
+            "listed": processed_before,
+            "failed": 0,
+            "bytes_downloaded": 0,
+            "written": 0,
+        }
+
+        def save_run_checkpoint(state: dict) -> None:
+            process_task_run.page_token = state["page_token"]
+            process_task_run.processed_message_ids = state["processed_message_ids"]
+
+        try:
+            if backfill_windows:
+                ingest_backfill_windows(
+                    user, db_session, service, progress, counts, backfill_windows,
+                    user_id=user_id, incremental=last_updated is not None,
+                )
+            else:
+                ingest_emails(
+                    user, db_session, service, progress, counts, query, checkpoint, save_run_checkpoint,
+                    user_id=user_id, added_ids=added_ids, incremental=last_updated is not None,
+                )
+        except Exception:
+            # keep everything processed so far and leave the checkpoint for the next run
+            progress.finish(task_models.FAILED)
+            raise
+
+        if not counts["listed"]:
+            logger.info(f"user_id:{user_id} No job application emails found.")
 
-        messages = get_email_ids(
-            query=query, gmail_instance=service
+        process_task_run.query = None
+        process_task_run.page_token = None
+        process_task_run.processed_message_ids = None
+        if history_id:
+            process_task_run.history_id = history_id
+        progress.finish(task_models.FINISHED)
+
+        logger.info(
+            f"user_id:{user_id} Email fetching complete, {counts['written']} emails added, "
+            f"{counts['failed']} could not be downloaded, "
+            f"{counts['bytes_downloaded']} bytes downloaded from Gmail."
         )
-        # Update session to remove "new user" status
-        request.session["is_new_user"] = False
 
-        if not messages:
-            logger.info(f"user_id:{user_id} No job application emails found.")
-            process_task_run = db_session.get(task_models.TaskRuns, user_id)
-            process_task_run.status = task_models.FINISHED
-            db_session.commit()
-            return
 
-        logger.info(f"user_id:{user.user_id} Found {len(messages)} emails.")
-        process_task_run.total_emails = len(messages)
+def ingest_emails(
+    user: AuthenticatedUser,
+    db_session: Session,
+    service,
+    progress: ProgressReporter,
+    counts: dict,
+    query: str,
+    checkpoint: PageCheckpoint,
+    save_checkpoint: Callable[[dict], None],
+    *,
+    user_id: str,
+    shard_queries: Optional[List[str]] = None,
+    added_ids: Optional[Set[str]] = None,
+    incremental: bool = False,
+) -> None:
+    """
+    Lists the messages matching query, or its shard_queries at the same time,
+    then downloads, classifies and stores them. Only messages in added_ids
+    are kept, if given.
+
+    counts holds the run's processed, listed, failed, bytes_downloaded and
+    written emails, carried over from call to call so that the progress of
+    a backfill spans all its windows. save_checkpoint is given the state of
+    checkpoint to store, and committed together with the records it covers.
+    If a stage fails, what was processed is stored before the error is raised.
+    """
+    # Ingestion runs as a pipeline: listing id pages, downloading messages and
+    # classifying them each run in their own thread, handing work over through
+    # bounded queues, while this thread writes the results in chunks. Memory
+    # use does not grow with the size of the mailbox.
+    def get_total_emails():
+        return counts["listed"] - counts["failed"]
+
+    def list_email_ids():
+        # messages already stored for the user are dropped here, with one
+        # query per page, so they are neither downloaded nor classified again
+        if added_ids is not None and not added_ids:
+            logger.info(f"user_id:{user_id} no messages added since the last sync")
+            return
+        if shard_queries:
+            logger.info(f"user_id:{user_id} listing {len(shard_queries)} query shards")
+            # pages of different shards interleave, so there is no page token
+            # to resume from: the shards are listed again, skipping what was
+            # processed
+            pages = (
+                (page, None)
+                for page in get_email_id_pages_sharded(
+                    shard_queries,
+                    lambda: build("gmail", "v1", credentials=user.creds),
+                    settings.GMAIL_LIST_CONCURRENCY,
+                )
+            )
+        else:
+            pages = get_email_id_pages(
+                query=query, gmail_instance=service, page_token=checkpoint.page_token
+            )
+        with Session(database.engine) as list_session:
+            for page_number, (page, next_page_token) in enumerate(pages):
+                page_ids = [message["id"] for message in page]
+                if added_ids is not None:
+                    # matches that were already in the mailbox at the last sync
+                    page_ids = [x for x in page_ids if x in added_ids]
+                existing_ids = get_existing_email_ids(list_session, user_id, page_ids)
+                if existing_ids:
+                    logger.info(
+                        f"user_id:{user_id} skipping {len(existing_ids)} emails already in the database"
+                    )
+                    increment("ingestion.skipped_existing", len(existing_ids))
+                new_ids = checkpoint.page_listed(
+                    page_number,
+                    next_page_token,
+                    [x for x in page_ids if x not in existing_ids],
+                )
+                counts["listed"] += len(new_ids)
+                yield from new_ids
+
+    message_ids = run_in_thread(list_email_ids(), maxsize=LIST_QUEUE_SIZE, name="gmail-list")
+    fetched_emails = run_in_thread(
+        get_emails_batched(
+            message_ids, gmail_instance=service, stats=counts, on_failure=checkpoint.message_failed
+        ),
+        maxsize=FETCH_QUEUE_SIZE,
+        name="gmail-fetch",
+    )
+    classified_emails = run_in_thread(
+        classify_emails(
+            fetched_emails,
+            cache=extraction_cache,
+            scheduler=llm_scheduler,
+            tenant=user_id,
+            incremental=incremental,
+        ),
+        maxsize=CLASSIFY_QUEUE_SIZE,
+        name="llm-classify",
+    )
+    email_records = []  # records waiting to be written in the next chunk
+
+    def write_email_records():
+        # the checkpoint is committed together with the records it covers
+        nonlocal email_records
+        if email_records:
+            upserted = upsert_user_emails(db_session, email_records)
+            logger.info(
+                f"Added {upserted['inserted']} email records for user {user_id}, "
+                f"{upserted['skipped']} were already stored"
+            )
+            counts["written"] += upserted["inserted"]
+            email_records = []
+        save_checkpoint(checkpoint.get_state())
+        progress.total_emails = get_total_emails()
+        progress.save(commit=False)
         db_session.commit()
 
-        email_records = []  # list to collect email records
-
-        for idx, message in enumerate(messages):
+    try:
+        for idx, (msg, result) in enumerate(classified_emails, start=counts["processed"]):
             message_data = {}
             # (email_subject, email_from, email_domain, company_name, email_dt)
-            msg_id = message["id"]
+            msg_id = msg["id"]
+            total_emails = get_total_emails()
             logger.info(
-                f"user_id:{user_id} begin processing for email {idx + 1} of {len(messages)} with id {msg_id}"
+                f"user_id:{user_id} begin processing for email {idx + 1} of {total_emails} with id {msg_id}"
             )
-            process_task_run.processed_emails = idx + 1
-            db_session.commit()
+            progress.update(idx + 1, total_emails)
+
+            try:
+                # if values are empty strings or null, set them to "unknown"
+                for key in result.keys():
+                    if not result[key]:
+                        result[key] = "unknown"
+            except Exception as e:
+                logger.error(
+                    f"user_id:{user_id} Error processing email {idx + 1} of {total_emails} with id {msg_id}: {e}"
+                )
+
+            if not isinstance(result, str) and result:
+                logger.info(
+                    f"user_id:{user_id} successfully extracted email {idx + 1} of {total_emails} with id {msg_id}"
+                )
+            else:
+                logger.warning(
+                    f"user_id:{user_id} failed to extract email {idx + 1} of {total_emails} with id {msg_id}"
+                )
+                result = {"company_name": "unknown", "application_status": "unknown", "job_title": "unknown"}
+
+            message_data = {
+                "id": msg_id,
+                "company_name": result.get("company_name", "unknown"),
+                "application_status": result.get("application_status", "unknown"),
+                "received_at": msg.get("date", "unknown"),
+                "subject": msg.get("subject", "unknown"),
+                "job_title": result.get("job_title", "unknown"),
+                "from": msg.get("from", "unknown"),
+            }
+            email_record = create_user_email(user, message_data)
+            if email_record:
+                email_records.append(email_record)
+            checkpoint.message_processed(msg_id)
+            if len(email_records) >= EMAIL_WRITE_CHUNK_SIZE:
+                write_email_records()
+            counts["processed"] = idx + 1
+    except Exception:
+        write_email_records()
+        raise
+
+    write_email_records()
+
+
+def ingest_backfill_windows(
+    user: AuthenticatedUser,
+    db_session: Session,
+    service,
+    progress: ProgressReporter,
+    counts: dict,
+    windows: List[BackfillWindows],
+    *,
+    user_id: str,
+    incremental: bool = False,
+) -> None:
+    """
+    Runs ingest_emails for every window of a backfill, newest first, so the
+    user's most recent applications are stored within seconds while older
+    windows fill in. Each window has its own checkpoint: a window that fails
+    keeps it for the next run while the older windows are still processed,
+    and the first error is raised once every window was tried.
+    """
+    first_error = None
+    for window in windows:
+        start_backfill_window(window)
+        db_session.commit()
+        logger.info(
+            f"user_id:{user_id} backfilling emails from {window.window_start.date()} "
+            f"to {window.window_end.date() if window.window_end else 'now'}"
+        )
+        checkpoint = PageCheckpoint(window.page_token, window.processed_message_ids or [])
 
-            msg = get_email(message_id=msg_id, gmail_instance=service)
+        def save_window_checkpoint(state: dict, window: BackfillWindows = window) -> None:
+            window.page_token = state["page_token"]
+            window.processed_message_ids = state["processed_message_ids"]
 
-            if msg:
-                try:
-                    result = process_email(msg["text_content"])
-                    # if values are empty strings or null, set them to "unknown"
-                    for key in result.keys():
-                        if not result[key]:
-                            result[key] = "unknown"
-                except Exception as e:
-                    logger.error(
-                        f"user_id:{user_id} Error processing email {idx + 1} of {len(messages)} with id {msg_id}: {e}"
-                    )
-
-                if not isinstance(result, str) and result:
-                    logger.info(
-                        f"user_id:{user_id} successfully extracted email {idx + 1} of {len(messages)} with id {msg_id}"
-                    )
-                else:
-                    logger.warning(
-                        f"user_id:{user_id} failed to extract email {idx + 1} of {len(messages)} with id {msg_id}"
-                    )
-                    result = {"company_name": "unknown", "application_status": "unknown", "job_title": "unknown"}
-
-                message_data = {
-                    "id": msg_id,
-                    "company_name": result.get("company_name", "unknown"),
-                    "application_status": result.get("application_status", "unknown"),
-                    "received_at": msg.get("date", "unknown"),
-                    "subject": msg.get("subject", "unknown"),
-                    "job_title": result.get("job_title", "unknown"),
-                    "from": msg.get("from", "unknown"),
-                }
-                email_record = create_user_email(user, message_data)
-                if email_record:
-                    email_records.append(email_record)
-
-        # batch insert all records at once
-        if email_records:
-            db_session.add_all(email_records)
-            logger.info(
-                f"Added {len(email_records)} email records for user {user_id}"
+        processed_before = counts["processed"]
+        try:
+            ingest_emails(
+                user, db_session, service, progress, counts, window.query, checkpoint, save_window_checkpoint,
+                user_id=user_id, shard_queries=window.shard_queries, incremental=incremental,
             )
-
-        process_task_run.status = task_models.FINISHED
+        except Exception as e:
+            logger.error(f"user_id:{user_id} backfill window {window.window_start.date()} failed: {e}")
+            increment("ingestion.backfill_windows_failed")
+            window.processed_emails += counts["processed"] - processed_before
+            fail_backfill_window(window, str(e))
+            db_session.commit()
+            first_error = first_error or e
+            continue
+        window.processed_emails += counts["processed"] - processed_before
+        finish_backfill_window(window)
         db_session.commit()
+    if first_error is not None:
+        raise first_error
+
+
+def fetched_recently(process_task_run: task_models.TaskRuns) -> bool:
+    return datetime.now() - process_task_run.updated < timedelta(seconds=SECONDS_BETWEEN_FETCHING_EMAILS)
+
 
-        logger.info(f"user_id:{user_id} Email fetching complete.")
+def is_resumable(process_task_run: task_models.TaskRuns, exclusive: bool = False) -> bool:
+    """
+    A run that failed, or that stopped updating its progress without finishing
+    (e.g. the worker died), is resumed from its checkpoint by the next run.
+    With exclusive set, a started run is known to be dead and resumed at once.
+    """
+    if not process_task_run.query:
+        return False
+    if process_task_run.status == task_models.FAILED:
+        return True
+    return process_task_run.status == task_models.STARTED and (
+        exclusive
+        or datetime.now() - process_task_run.updated > timedelta(seconds=SECONDS_BEFORE_RUN_IS_STALE)
+    )
+
+
+def get_mailbox_changes(
+    service,
+    process_task_run: task_models.TaskRuns,
+    session_data: dict,
+    last_updated: Optional[datetime],
+    user_id: str,
+) -> Tuple[Optional[str], Optional[Set[str]]]:
+    """
+    Returns the mailbox's current history id, to be stored when the run
+    finishes, and for an incremental sync after a finished run the ids of the
+    messages added to the mailbox since then, read from the Gmail history.
+    The ids are None when the run has to list everything matching its query,
+    as does an incremental sync whose stored history id has expired.
+    """
+    if process_task_run.history_id and is_incremental_sync(session_data, last_updated):
+        changes = get_added_message_ids(process_task_run.history_id, gmail_instance=service)
+        if changes is not None:
+            added_ids, history_id = changes
+            logger.info(f"user_id:{user_id} {len(added_ids)} messages added since the last sync")
+            increment("ingestion.history_syncs")
+            return history_id, set(added_ids)
+        logger.info(f"user_id:{user_id} history expired, listing everything matching the query")
+        increment("ingestion.history_expired")
+    return get_history_id(service), None
+
+
+def is_incremental_sync(session_data: dict, last_updated: Optional[datetime]) -> bool:
+    # a new user who chose a start date gets everything since then
+    return bool(last_updated) and (
+        not session_data.get("start_date") or not session_data.get("is_new_user")
+    )
+
+
+def is_long_backfill(session_data: dict, last_updated: Optional[datetime]) -> bool:
+    """A first sync reaching back further than one backfill window."""
+    if is_incremental_sync(session_data, last_updated):
+        return False
+    days = (datetime.now().date() - parse_start_date(session_data.get("start_date")).date()).days
+    return days > settings.BACKFILL_WINDOW_DAYS
+
+
+def get_email_query(session_data: dict, last_updated: Optional[datetime], user_id: str) -> str:
+    start_date = session_data.get("start_date")
+    logger.info(f"start_date: {start_date}")
+    start_date_query = get_start_date_email_filter(start_date)
+
+    query = start_date_query
+    # check for users last updated email
+    if last_updated:
+        # this converts our date time to number of seconds 
+        additional_time = int(last_updated.timestamp())
+        # we append it to query so we get only emails recieved after however many seconds
+        # for example, if the newest email you’ve stored was received at 2025‑03‑20 14:32 UTC, we convert that to 1710901920s 
+        # and tell Gmail to fetch only messages received after March 20, 2025 at 14:32 UTC.
+        if is_incremental_sync(session_data, last_updated):
+            query = get_start_date_email_filter(after_timestamp=additional_time)
+        
+            logger.info(f"user_id:{user_id} Fetching emails after {last_updated.isoformat()}")
+    else:
+        logger.info(f"user_id:{user_id} Fetching all emails (no last_date maybe with start date)")
+    return query
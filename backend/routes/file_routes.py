@@ -1,15 +1,19 @@
 import csv
 import os
 import logging
+from typing import Annotated, Iterator, Sequence
 import plotly.graph_objects as go
-from fastapi import APIRouter, HTTPException, Request, Depends
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi import APIRouter, HTTPException, Query, Request, Depends
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+from sqlmodel import Session
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 import database
+from utils.export_utils import EXPORT_FIELDS, EXPORT_FORMATS, ExportFormat
 from utils.file_utils import get_user_filepath
 from session.session_layer import validate_session
-from routes.email_routes import query_emails
+from db.utils.email_summary_utils import count_statuses, get_user_email_summary
+from db.utils.user_email_utils import get_user_emails, iter_user_email_rows
 
 
 # Logger setup
@@ -38,7 +42,7 @@ async def write_to_csv(request: Request, db_session: database.DBSession, user_id
         return RedirectResponse("/logout", status_code=303)
 
     # Get job related email data from DB
-    emails = query_emails(request, db_session=db_session, user_id=user_id)
+    emails = get_user_emails(db_session, user_id)
     if not emails:
         raise HTTPException(status_code=400, detail="No data found to write")
 
@@ -76,58 +80,33 @@ async def write_to_csv(request: Request, db_session: database.DBSession, user_id
     return {"message": f"CSV file written successfully at {filepath}"}
 
 
-# Write and download csv
+def stream_user_email_rows(user_id: str) -> Iterator[Sequence[tuple]]:
+    # the request's session is closed before the response body is sent
+    with Session(database.engine) as session:
+        yield from iter_user_email_rows(session, user_id, list(EXPORT_FIELDS))
+
+
+# Download the user's emails, encoded as they are read from the DB
 @router.get("/process-csv")
 @limiter.limit("2/minute")
-async def process_csv(request: Request, db_session: database.DBSession, user_id: str = Depends(validate_session)):
+async def process_csv(
+    request: Request,
+    db_session: database.DBSession,
+    user_id: str = Depends(validate_session),
+    export_format: Annotated[ExportFormat, Query(alias="format")] = "csv",
+):
     if not user_id:
         return RedirectResponse("/logout", status_code=303)
-
-    directory = get_user_filepath(user_id)
-    filename = "emails.csv"
-    filepath = os.path.join(directory, filename)
-    
-    # Get job related email data from DB
-    emails = query_emails(request, db_session=db_session, user_id=user_id)
-    if not emails:
+    if not get_user_email_summary(db_session, user_id).email_count:
         raise HTTPException(status_code=400, detail="No data found to write")
-    # Ensure the directory exists
-    os.makedirs(directory, exist_ok=True)
-
-    # Key: DB field name; Value: Human-readable field name
-    field_mapping = {
-        "company_name": "Company Name",
-        "application_status": "Application Status",
-        "received_at": "Received At",
-        "job_title": "Job Title",
-        "subject": "Subject",
-        "email_from": "Sender"
-    }
-
-    selected_fields = list(field_mapping.keys())
-    headers = list(field_mapping.values())
 
-    # Filter out unwanted fields
-    processed_emails = [
-        {key: value for key, value in email if key in selected_fields} for email in emails
-    ]
-
-    # Write to CSV
-    with open(filepath, mode="w", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow(headers)
-        for row in processed_emails:
-            writer.writerow([row[field] for field in selected_fields])
-
-    logger.info("CSV file created at %s", filepath)
-    
-    # Download CSV
-    if os.path.exists(filepath):
-        logger.info("user_id:%s downloading from filepath %s", user_id, filepath)
-        return FileResponse(filepath)
-    
-    # File not found error
-    raise HTTPException(status_code=400, detail="File not found")
+    media_type, encode = EXPORT_FORMATS[export_format]
+    logger.info(f"user_id:{user_id} downloading emails as {export_format}")
+    return StreamingResponse(
+        encode(stream_user_email_rows(user_id)),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="emails.{export_format}"'},
+    )
 
 
 # Write and download sankey diagram
@@ -138,32 +117,19 @@ async def process_sankey(request: Request, db_session: database.DBSession, user_
     if not user_id:
         return RedirectResponse("/logout", status_code=303)
     
-    num_applications = 0
-    num_offers = 0
-    num_rejected = 0
-    num_request_for_availability = 0
-    num_interview_scheduled = 0
-    num_no_response = 0
-
-    # Get job related email data from DB
-    emails = query_emails(request, db_session=db_session, user_id=user_id)
-    if not emails:
+    # Get the user's email counts by status from their summary
+    summary = get_user_email_summary(db_session, user_id)
+    if not summary.email_count:
         raise HTTPException(status_code=400, detail="No data found to write")
- 
-    for email in emails:
-        # normalize the output
-        status = email.application_status.strip().lower()
-        num_applications += 1   
-        if status == "offer":
-            num_offers += 1
-        elif status == "rejected":
-            num_rejected += 1
-        elif status == "request for availability":
-            num_request_for_availability += 1
-        elif status == "interview scheduled":
-            num_interview_scheduled += 1
-        elif status == "no response":
-            num_no_response += 1
+
+    # the statuses are normalized
+    status_counts = count_statuses(summary)
+    num_applications = summary.email_count
+    num_offers = status_counts.get("offer", 0)
+    num_rejected = status_counts.get("rejected", 0)
+    num_request_for_availability = status_counts.get("request for availability", 0)
+    num_interview_scheduled = status_counts.get("interview scheduled", 0)
+    num_no_response = status_counts.get("no response", 0)
 
     # Create the Sankey diagram
     fig = go.Figure(go.Sankey(
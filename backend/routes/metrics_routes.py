@@ -0,0 +1,28 @@
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Request
+from session.session_layer import validate_session
+from utils.metrics_utils import get_metrics
+
+# Logger setup
+logger = logging.getLogger(__name__)
+
+# FastAPI router for metrics routes
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def metrics(request: Request, user_id: str = Depends(validate_session)):
+    """
+    Returns the process wide ingestion counters, e.g. llm_cache.misses is the
+    number of emails that actually had to be sent to the LLM.
+    """
+    if not user_id:
+        raise HTTPException(status_code=401, detail="No user id found in session")
+    metrics = get_metrics()
+    preclassified = metrics.get("preclassifier.resolved", 0) + metrics.get("preclassifier.escalated", 0)
+    if preclassified:
+        # share of emails the rules classified without calling the LLM
+        metrics["preclassifier.resolved_fraction"] = round(
+            metrics.get("preclassifier.resolved", 0) / preclassified, 3
+        )
+    return metrics
@@ -1,10 +1,12 @@
 import logging
 from fastapi import APIRouter, Depends, Request, HTTPException
-from sqlmodel import select
-from db.user_emails import UserEmails
 from utils.config_utils import get_settings
 from session.session_layer import validate_session
-from routes.email_routes import query_emails
+from db.utils.email_summary_utils import (
+    count_interview_requests,
+    get_response_counts_by_job_title,
+    get_user_email_summary,
+)
 import database
 from slowapi import Limiter
 from slowapi.util import get_remote_address
@@ -28,42 +30,14 @@ limiter = Limiter(key_func=get_remote_address)
 def response_rate_by_job_title(request: Request, db_session: database.DBSession, user_id: str = Depends(validate_session)):
     
     try:
-        # Get job related email data from DB
-        user_emails = query_emails(request, db_session=db_session, user_id=user_id)
-
-        index = 0
-
-        # Tracks all job titles and their index in response_rate
-        job_titles = {}
-
-        # Store (company, job_title) tuples to avoid duplicates
-        companies = []
-
-        # List of dictionaries to store job titles and their response rates
-        response_rate_data = []
-
-        for email in user_emails:
-            if email.job_title not in job_titles:
-                status = email.application_status.strip().lower()
-                if status == "request for availability" or status == "offer" or status == "interview scheduled":
-                    response_rate_data.append({"title": email.job_title, "responses": 1, "total": 1})
-                else:
-                    response_rate_data.append({"title": email.job_title, "responses": 0, "total": 1})
-                companies.append((email.company_name, email.job_title))
-                job_titles[email.job_title] = index
-                index += 1
-            elif (email.company_name, email.job_title) not in companies:
-                status = email.application_status.strip().lower()
-                if status == "request for availability" or status == "offer" or status == "interview scheduled":
-                    response_rate_data[job_titles[email.job_title]]["responses"] += 1
-                response_rate_data[job_titles[email.job_title]]["total"] += 1
-                companies.append((email.company_name, email.job_title))
-
+        # the user's summary holds, per job title, its applications (company
+        # and job title pairs) and how many of them got a response
+        summary = get_user_email_summary(db_session, user_id)
         response_rate = []
-        for data in response_rate_data:
+        for job_title, responses, total in get_response_counts_by_job_title(summary):
             response_rate.append({
-                "title": data["title"],
-                "rate": round(data["responses"] / data["total"] * 100, 2)
+                "title": job_title,
+                "rate": round(responses / total * 100, 2)
             })
 
         return response_rate
@@ -76,24 +50,13 @@ def response_rate_by_job_title(request: Request, db_session: database.DBSession,
 def calculate_response_rate(
     request: Request, db_session: database.DBSession, user_id: str = Depends(validate_session)
 ) -> None:
-    user_emails = db_session.exec(
-        select(UserEmails).where(UserEmails.user_id == user_id)
-    ).all()
+    total_apps, interview_requests = count_interview_requests(get_user_email_summary(db_session, user_id))
 
     # if user has no application just return 0.0
-    total_apps = len(user_emails)
     if total_apps == 0:
         return 0.0
 
-    interview_requests = 0
-    for email in user_emails:
-        # using request for avalability as an interview request as it should come before the offer and scheduled interview
-        if (
-            email.application_status
-            and email.application_status.lower() == "request for availability"
-        ):
-            interview_requests += 1
-
+    # using request for avalability as an interview request as it should come before the offer and scheduled interview
     response_rate_percent = (interview_requests / total_apps) * 100
     return {"value": round(response_rate_percent, 1)}
     
@@ -0,0 +1,186 @@
+"""
+Replays synthetic arrivals of users whose emails need classifying and reports
+how long each user waits for their emails, comparing first come first served
+with the fair scheduler (utils/scheduler_utils.FairQueue).
+
+    python simulate_scheduler.py --users 50 --backfill-fraction 0.1 --pattern burst
+"""
+
+import argparse
+import heapq
+import math
+import random
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List
+
+from utils.scheduler_utils import FairQueue
+
+BATCH_SIZE = 10  # emails per LLM request, as utils.llm_utils.BATCH_MAX_EMAILS
+SMALL_SYNC_EMAILS = 30
+BACKFILL_EMAILS = 5000
+
+
+@dataclass
+class SimulatedUser:
+    user_id: str
+    arrival: float  # seconds since the start
+    emails: int
+    incremental: bool = False
+
+
+def make_arrivals(
+    users: int,
+    backfill_fraction: float,
+    pattern: str = "burst",
+    window: float = 60.0,
+    seed: int = 0,
+) -> List[SimulatedUser]:
+    """
+    burst: every user logs in within window seconds, e.g. after a newsletter.
+    steady: logins are spread evenly (Poisson) over window seconds.
+    A backfill_fraction of the users are new and need a full backfill, the
+    others an incremental sync.
+    """
+    rng = random.Random(seed)
+    arrivals = []
+    for i in range(users):
+        if pattern == "burst":
+            arrival = rng.uniform(0, window)
+        else:
+            arrival = (arrivals[-1].arrival if arrivals else 0) + rng.expovariate(users / window)
+        backfill = rng.random() < backfill_fraction
+        arrivals.append(
+            SimulatedUser(
+                user_id=f"user{i}",
+                arrival=arrival,
+                emails=BACKFILL_EMAILS if backfill else SMALL_SYNC_EMAILS,
+                incremental=not backfill,
+            )
+        )
+    return sorted(arrivals, key=lambda user: user.arrival)
+
+
+class FifoQueue:
+    """Serves batches in the order they arrived, like one executor per job."""
+
+    def __init__(self):
+        self.items = deque()
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def push(self, tenant_id: str, item, cost: int = 1, incremental: bool = False) -> None:
+        self.items.append((tenant_id, item))
+
+    def pop(self):
+        return self.items.popleft()
+
+
+def simulate(
+    users: List[SimulatedUser],
+    policy: str = "fair",
+    requests_per_minute: int = 30,
+    llm_workers: int = 4,
+    latency: float = 2.0,
+) -> Dict[str, float]:
+    """
+    Returns the seconds each user waited from arrival until their last batch
+    was classified. Requests are limited by a token bucket refilled at
+    requests_per_minute and by llm_workers requests in flight, each taking
+    latency seconds.
+    """
+    queue = FairQueue() if policy == "fair" else FifoQueue()
+    rate = requests_per_minute / 60
+    capacity = max(1, requests_per_minute // 10)
+    tokens, refilled_at = float(capacity), 0.0
+    remaining = {user.user_id: math.ceil(user.emails / BATCH_SIZE) for user in users}
+    arrival = {user.user_id: user.arrival for user in users}
+    pending_arrivals = deque(users)
+    in_flight = []  # (finish time, user id)
+    completion = {}
+    now = 0.0
+
+    while pending_arrivals or in_flight or len(queue):
+        while pending_arrivals and pending_arrivals[0].arrival <= now:
+            user = pending_arrivals.popleft()
+            for _ in range(remaining[user.user_id]):
+                queue.push(user.user_id, None, cost=BATCH_SIZE, incremental=user.incremental)
+        while in_flight and in_flight[0][0] <= now:
+            _, user_id = heapq.heappop(in_flight)
+            remaining[user_id] -= 1
+            if remaining[user_id] == 0:
+                completion[user_id] = now - arrival[user_id]
+
+        tokens = min(capacity, tokens + (now - refilled_at) * rate)
+        refilled_at = now
+        # (with a little slack, so rounding cannot stall the clock)
+        while len(queue) and len(in_flight) < llm_workers and tokens >= 1 - 1e-9:
+            tokens -= 1
+            user_id, _ = queue.pop()
+            heapq.heappush(in_flight, (now + latency, user_id))
+
+        # jump to the next event: an arrival, a finished request or a new token
+        next_times = []
+        if pending_arrivals:
+            next_times.append(pending_arrivals[0].arrival)
+        if in_flight:
+            next_times.append(in_flight[0][0])
+        if len(queue) and len(in_flight) < llm_workers:
+            next_times.append(now + max(1 - tokens, 1e-6) / rate)
+        if not next_times:
+            break
+        now = max(now, min(next_times))
+    return completion
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    index = min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(users: List[SimulatedUser], completion: Dict[str, float]) -> Dict[str, Dict[str, float]]:
+    """Completion time percentiles of the incremental syncs and the backfills."""
+    summary = {}
+    for label, incremental in (("incremental", True), ("backfill", False)):
+        times = [completion[user.user_id] for user in users if user.incremental == incremental]
+        if times:
+            summary[label] = {
+                "users": len(times),
+                "p50": percentile(times, 50),
+                "p90": percentile(times, 90),
+                "p99": percentile(times, 99),
+            }
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--backfill-fraction", type=float, default=0.1)
+    parser.add_argument("--pattern", choices=["burst", "steady"], default="burst")
+    parser.add_argument("--window", type=float, default=60.0, help="seconds over which users arrive")
+    parser.add_argument("--requests-per-minute", type=int, default=30)
+    parser.add_argument("--llm-workers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=2.0, help="seconds per LLM request")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    users = make_arrivals(args.users, args.backfill_fraction, args.pattern, args.window, args.seed)
+    for policy in ("fifo", "fair"):
+        completion = simulate(
+            users, policy, args.requests_per_minute, args.llm_workers, args.latency
+        )
+        print(f"{policy}:")
+        for label, stats in summarize(users, completion).items():
+            print(
+                f"  {label:<12} users={stats['users']:<4} p50={stats['p50']:8.0f}s "
+                f"p90={stats['p90']:8.0f}s p99={stats['p99']:8.0f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
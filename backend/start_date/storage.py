@@ -1,21 +1,81 @@
 """
 This file contains the main constants used in the application.
 """
-from pathlib import Path
-from utils.filter_utils import (
-    parse_base_filter_config,
-)
-from constants import QUERY_APPLIED_EMAIL_FILTER
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
 
-APPLIED_FILTER_PATH = (
-    Path(__file__).parent.parent / "email_query_filters" / "applied_email_filter.yaml"
-)
+from utils.filter_utils import compile_filter
+from constants import APPLIED_FILTER_PATH, DEFAULT_DAYS_AGO
 
-def get_start_date_email_filter(start_date: str) -> str:
+# what a date window adds to a query: " after:<unix time> before:<unix time>"
+DATE_WINDOW_QUERY_LENGTH = 36
+
+
+def get_default_start_date() -> str:
+    """DEFAULT_DAYS_AGO days before today, in the format Gmail expects (YYYY/MM/DD)."""
+    return (datetime.now() - timedelta(days=DEFAULT_DAYS_AGO)).strftime("%Y/%m/%d")
+
+
+def parse_start_date(start_date: Optional[str] = None) -> datetime:
+    """The start date as YYYY/MM/DD or YYYY-MM-DD, the default start date if not given."""
+    return datetime.strptime((start_date or get_default_start_date()).replace("-", "/"), "%Y/%m/%d")
+
+
+def get_start_date_email_filter(start_date: Optional[str] = None, after_timestamp: Optional[int] = None) -> str:
+    """
+    The Gmail query for applied emails received after start_date (the default
+    start date if not given) and, if given, after a unix timestamp.
+
+    The filter YAML is compiled once and only reloaded when it changes, see
+    utils.filter_utils.compile_filter.
+    """
     if not start_date:
-        return QUERY_APPLIED_EMAIL_FILTER
+        start_date = get_default_start_date()
+    return compile_filter(APPLIED_FILTER_PATH).query(start_date, after_timestamp)
 
-    START_DATE_EMAIL_FILTER = (
-        f"after:{start_date} AND ({parse_base_filter_config(APPLIED_FILTER_PATH)})"
-    )
-    return START_DATE_EMAIL_FILTER
\ No newline at end of file
+
+def get_date_windows(start: datetime, end: datetime, days: int) -> List[Tuple[int, Optional[int]]]:
+    """
+    Splits start..end into windows of at most days days, newest first, as
+    (after, before) unix timestamps for Gmail's after:/before: operators.
+    The newest window has no end, so nothing arriving meanwhile is missed.
+    Consecutive windows overlap by a second, so a message sent right on a
+    boundary is in one of them.
+    """
+    windows = []
+    window_end = end
+    while True:
+        window_start = max(start, window_end - timedelta(days=days))
+        before = int(window_end.timestamp()) + 1 if windows else None
+        windows.append((int(window_start.timestamp()), before))
+        if window_start <= start:
+            return windows
+        window_end = window_start
+
+
+def add_date_window(query: str, window: Tuple[int, Optional[int]]) -> str:
+    after, before = window
+    query += f" after:{after}"
+    if before is not None:
+        query += f" before:{before}"
+    return query
+
+
+def get_start_date_email_filter_shards(
+    start_date: Optional[str],
+    windows: List[Tuple[int, Optional[int]]],
+    max_length: Optional[int] = None,
+) -> List[str]:
+    """
+    get_start_date_email_filter split into queries that together match the
+    same emails, so they can be listed at the same time: by filter block
+    (see CompiledFilter.shard_queries) and by the given date windows (see
+    get_date_windows). No query is longer than max_length, unless a single
+    filter term makes it so.
+    """
+    if not start_date:
+        start_date = get_default_start_date()
+    if max_length is not None:
+        max_length -= DATE_WINDOW_QUERY_LENGTH
+    queries = compile_filter(APPLIED_FILTER_PATH).shard_queries(start_date, None, max_length)
+    return [add_date_window(query, window) for window in windows for query in queries]
@@ -0,0 +1,151 @@
+"""
+Job search emails for tests and benchmark_email_parsing.py: a generated
+corpus shaped like real ones (ATS confirmations, heavy newsletter-style job
+alerts, rejections with legal footers, interview invites with calendar
+attachments and applications with a resume attached), and the labelled
+emails in sample_compaction_emails.yaml.
+"""
+
+import base64
+import email
+import random
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from pathlib import Path
+from typing import Dict, List
+
+import yaml
+from bs4 import BeautifulSoup
+
+from tests.fake_gmail import make_payload
+from utils.email_utils import get_email_content
+
+SAMPLE_EMAILS_PATH = Path(__file__).parent / "sample_compaction_emails.yaml"
+
+WORDS = (
+    "team role engineer apply remote hybrid senior data platform product growth "
+    "opportunity position experience benefits salary location review candidate"
+).split()
+
+STYLE = "<style>" + "".join(f".c{i}{{color:#{i:03x};padding:{i % 9}px}}" for i in range(300)) + "</style>"
+FOOTER = (
+    '<p style="font-size:10px;color:#999">You are receiving this email because you applied '
+    "for a position. This message and any attachments are confidential and intended solely "
+    "for the addressee. If you received it in error, notify the sender and delete it. "
+    '<a href="https://example.com/unsubscribe?u=123456">Unsubscribe</a> | '
+    '<a href="https://example.com/privacy">Privacy policy</a></p>'
+)
+
+
+def sentence(rng: random.Random, words: int = 12) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def html_page(body: str) -> str:
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Notification</title>'
+        f"{STYLE}<script>window.dataLayer=[];</script></head><body>"
+        f'<table width="100%" cellpadding="0" cellspacing="0"><tr><td>{body}</td></tr></table>'
+        f'{FOOTER}<img src="https://example.com/open.gif?id=42" width="1" height="1"></body></html>'
+    )
+
+
+def with_headers(mime_msg, subject: str, sender: str):
+    mime_msg["From"] = sender
+    mime_msg["To"] = "appuser@gmail.com"
+    mime_msg["Subject"] = subject
+    mime_msg["Date"] = "Thu, 13 Feb 2025 21:30:24 +0000"
+    return mime_msg
+
+
+def alternative(text: str, html: str) -> MIMEMultipart:
+    mime_msg = MIMEMultipart("alternative")
+    mime_msg.attach(MIMEText(text, "plain"))
+    mime_msg.attach(MIMEText(html, "html"))
+    return mime_msg
+
+
+def attachment(data: bytes, subtype: str, filename: str) -> MIMEApplication:
+    part = MIMEApplication(data, subtype)
+    part.add_header("Content-Disposition", "attachment", filename=filename)
+    return part
+
+
+def make_corpus(seed: int = 0) -> Dict[str, str]:
+    """Email name -> base64url encoded MIME message, as fetched with format="raw"."""
+    rng = random.Random(seed)
+    corpus = {}
+
+    text = "Thanks for applying for the Software Engineer position at Acme Corp. " + sentence(rng)
+    html = html_page(f'<h1 class="c1">Acme Corp</h1><p class="c2">{text}</p>')
+    corpus["ats_confirmation"] = with_headers(
+        alternative(text, html), "Thank you for applying to Acme Corp!", "no-reply@us.greenhouse-mail.io"
+    )
+
+    jobs = "".join(
+        f'<tr><td class="c{i % 300}"><a href="https://example.com/jobs/{i}?utm_source=alert">'
+        f"<b>{sentence(rng, 4)}</b></a><br><span>{sentence(rng, 30)}</span></td>"
+        f'<td><img src="https://example.com/logo/{i}.png" alt="Company {i}"></td></tr>'
+        for i in range(600)
+    )
+    html = html_page(f"<h1>Jobs you may be interested in</h1><table>{jobs}</table>")
+    corpus["job_alert_newsletter"] = with_headers(
+        alternative("View this email in your browser.", html), "Your application to Globex", "jobs-noreply@linkedin.com"
+    )
+
+    legal = "".join(f"<p>{sentence(rng, 60)}</p>" for _ in range(40))
+    html = html_page(
+        "<p>Dear Jane,</p><p>Unfortunately, we have decided to move forward with other candidates "
+        f"for the Data Analyst role at Initech.</p>{legal}"
+    )
+    corpus["rejection_with_legal_footer"] = with_headers(
+        MIMEText(html, "html"), "Your application for Data Analyst", "do-not-reply@myworkday.com"
+    )
+
+    invite = MIMEMultipart("mixed")
+    text = "We would like to invite you to an interview for the Backend Engineer role at Hooli."
+    invite.attach(alternative(text, html_page(f"<p>{text}</p>")))
+    invite.attach(MIMEText("BEGIN:VCALENDAR\nVERSION:2.0\n" + "X-PAD:" + "x" * 20000 + "\nEND:VCALENDAR", "calendar"))
+    invite.attach(attachment(rng.randbytes(30_000), "ics", "invite.ics"))
+    corpus["interview_invite"] = with_headers(invite, "Interview invitation", "recruiting@hooli.com")
+
+    applied = MIMEMultipart("mixed")
+    text = "Your application to Umbrella Health was sent. " + sentence(rng)
+    applied.attach(alternative(text, html_page(f"<p>{text}</p>")))
+    applied.attach(attachment(rng.randbytes(500_000), "pdf", "resume.pdf"))
+    corpus["resume_attached"] = with_headers(applied, "Application submitted", "notifications@smartrecruiters.com")
+
+    return {
+        name: base64.urlsafe_b64encode(mime_msg.as_bytes()).decode("ASCII")
+        for name, mime_msg in corpus.items()
+    }
+
+
+def to_full_format(message_id: str, raw: str) -> dict:
+    """The message as fetched with format="full", where Gmail has parsed the MIME."""
+    mime_msg = email.message_from_bytes(base64.urlsafe_b64decode(raw))
+    return {"id": message_id, "threadId": message_id, "payload": make_payload(mime_msg)}
+
+
+def beautifulsoup_to_text(html: str, max_chars=None) -> str:
+    return BeautifulSoup(html, "html.parser").get_text(separator=" ", strip=True)
+
+
+def load_sample_emails() -> List[dict]:
+    with open(SAMPLE_EMAILS_PATH, "r") as fid:
+        return yaml.safe_load(fid)
+
+
+def text_before(sample: dict) -> str:
+    """The text the LLM saw of a sample email before compaction: subject, plain text and all of the HTML."""
+    text = sample["subject"] + "\n" + sample["text"]
+    if sample.get("html"):
+        text += "\n" + beautifulsoup_to_text(sample["html"])
+    return text
+
+
+def text_after(sample: dict) -> str:
+    return get_email_content(
+        {"subject": sample["subject"], "text_content": sample["text"], "html_content": sample.get("html")}
+    )
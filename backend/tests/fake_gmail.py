@@ -0,0 +1,331 @@
+"""
+In-memory stand-in for the Gmail API client returned by googleapiclient's
+build("gmail", "v1", ...), so email fetching can be tested offline.
+
+Only the calls the backend makes are implemented. Request objects are lazy
+like the real client: nothing happens until execute() is called, either
+directly or through a batch request.
+"""
+
+import base64
+import email
+import email.utils
+import re
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Dict, List, Optional
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+def make_raw_message(
+    subject: str,
+    sender: str = "no-reply@us.greenhouse-mail.io",
+    text: Optional[str] = "Thank you for applying.",
+    html: Optional[str] = None,
+    date: str = "Thu, 13 Feb 2025 21:30:24 +0000",
+) -> str:
+    """Builds a base64url encoded MIME message as returned by format="raw"."""
+    if text is not None and html is not None:
+        mime_msg = MIMEMultipart("alternative")
+        mime_msg.attach(MIMEText(text, "plain"))
+        mime_msg.attach(MIMEText(html, "html"))
+    elif html is not None:
+        mime_msg = MIMEText(html, "html")
+    else:
+        mime_msg = MIMEText(text or "", "plain")
+    mime_msg["From"] = sender
+    mime_msg["To"] = "appuser@gmail.com"
+    mime_msg["Subject"] = subject
+    mime_msg["Date"] = date
+    return base64.urlsafe_b64encode(mime_msg.as_bytes()).decode("ASCII")
+
+
+def make_payload(mime_part) -> dict:
+    """Converts a MIME part into the payload Gmail returns with format="full"."""
+    payload = {
+        "mimeType": mime_part.get_content_type(),
+        "filename": mime_part.get_filename() or "",
+        "headers": [{"name": name, "value": value} for name, value in mime_part.items()],
+    }
+    if mime_part.is_multipart():
+        payload["body"] = {"size": 0}
+        payload["parts"] = [make_payload(part) for part in mime_part.get_payload()]
+        return payload
+    data = mime_part.get_payload(decode=True) or b""
+    if payload["filename"]:
+        # attachments only come with an id to fetch them by
+        payload["body"] = {"attachmentId": f"attachment-{len(data)}", "size": len(data)}
+    else:
+        payload["body"] = {"size": len(data), "data": base64.urlsafe_b64encode(data).decode("ASCII")}
+    return payload
+
+
+@lru_cache(maxsize=None)
+def get_search_fields(raw: str) -> tuple:
+    """The lowercased subject and sender and the send time of a raw message."""
+    mime_msg = email.message_from_bytes(base64.urlsafe_b64decode(raw))
+    sent = email.utils.parsedate_to_datetime(mime_msg["Date"]).timestamp()
+    return (mime_msg["Subject"] or "").lower(), (mime_msg["From"] or "").lower(), sent
+
+
+@lru_cache(maxsize=None)
+def parse_query(query: str) -> tuple:
+    """The included and excluded (field, term) pairs and the after/before timestamps of a query."""
+    return (
+        [(field, term.lower()) for field, term in re.findall(r'(?<!-)\b(subject|from):"([^"]*)"', query)],
+        [(field, term.lower()) for field, term in re.findall(r'-(subject|from):"([^"]*)"', query)],
+        [int(x) for x in re.findall(r"\bafter:(\d+)(?![\d/])", query)],
+        [int(x) for x in re.findall(r"\bbefore:(\d+)(?![\d/])", query)],
+    )
+
+
+def matches_query(query: str, raw: str) -> bool:
+    """
+    The part of Gmail search the backend's queries rely on: a message matches
+    if any quoted subject:/from: term is in its subject or sender, none of the
+    excluded (-subject:/-from:) ones is, and it was sent between the after:
+    and before: unix timestamps. Dates (after:YYYY/MM/DD) are ignored and
+    wildcard groups count as separate terms.
+    """
+    subject, sender, sent = get_search_fields(raw)
+    fields = {"subject": subject, "from": sender}
+
+    includes, excludes, after, before = parse_query(query)
+    if includes and not any(term in fields[field] for field, term in includes):
+        return False
+    if any(term in fields[field] for field, term in excludes):
+        return False
+    return all(sent > x for x in after) and all(sent < x for x in before)
+
+
+def matches_labels(query: str, labels: List[str]) -> bool:
+    """
+    The label operators the backend's queries use: -in:drafts, and
+    (in:inbox OR -in:sent) to leave out sent messages not in the inbox.
+    """
+    if "-in:drafts" in query and "DRAFT" in labels:
+        return False
+    if "(in:inbox OR -in:sent)" in query and "SENT" in labels and "INBOX" not in labels:
+        return False
+    return True
+
+
+def make_http_error(status: int) -> HttpError:
+    return HttpError(httplib2.Response({"status": status}), b"", uri="fake")
+
+
+class FakeRequest:
+    def __init__(self, func, *args, **kwargs):
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+
+    def execute(self):
+        return self._func(*self._args, **self._kwargs)
+
+
+class FakeBatchRequest:
+    def __init__(self, service: "FakeGmailService", callback):
+        self._service = service
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request: FakeRequest, request_id: str):
+        self._requests.append((request_id, request))
+
+    def execute(self):
+        self._service.batch_calls += 1
+        self._service.batch_sizes.append(len(self._requests))
+        for request_id, request in self._requests:
+            try:
+                response = request.execute()
+            except HttpError as e:
+                self._callback(request_id, None, e)
+            else:
+                self._callback(request_id, response, None)
+
+
+class FakeHistory:
+    def __init__(self, service: "FakeGmailService"):
+        self._service = service
+
+    def list(self, userId: str, startHistoryId: str, historyTypes=None, pageToken=None):
+        return FakeRequest(self._service._list_history, startHistoryId, pageToken)
+
+
+class FakeGmailService:
+    """
+    messages: message id -> raw message string (see make_raw_message)
+    failures: message id -> HTTP statuses to fail with, one per get() call,
+        before the message is finally returned
+    page_size: number of ids returned per messages().list() and
+        history().list() page
+    failing_page: index of a messages().list() page that fails with a 500
+    labels: message id -> Gmail label ids, INBOX by default
+    search: whether messages().list() only returns the messages matching
+        the query (see matches_query) rather than all of them; the label
+        operators of a query (see matches_labels) are always applied
+    max_query_length: longer queries fail with a 400, like Gmail's limit
+    list_latency: seconds every messages().list() call takes
+
+    messages().get() supports the raw, full and metadata formats and records
+    the formats requested for every message in formats.
+
+    Listed queries are recorded in list_queries, and the most list calls
+    running at the same time in max_active_lists.
+
+    Every message added gets the next history id, starting at 1 for the
+    initial messages. History before expire_history() was called is gone,
+    so listing it fails with a 404 like Gmail does for old history ids.
+    """
+
+    def __init__(
+        self,
+        messages: Dict[str, str],
+        failures: Optional[Dict[str, List[int]]] = None,
+        page_size: int = 100,
+        failing_page: Optional[int] = None,
+        labels: Optional[Dict[str, List[str]]] = None,
+        search: bool = False,
+        max_query_length: Optional[int] = None,
+        list_latency: float = 0,
+    ):
+        self.raw_messages = dict(messages)
+        self.failures = {k: list(v) for k, v in (failures or {}).items()}
+        self.page_size = page_size
+        self.failing_page = failing_page
+        self.labels = dict(labels or {})
+        self.search = search
+        self.max_query_length = max_query_length
+        self.list_latency = list_latency
+        self.list_queries = []
+        self.active_lists = 0
+        self.max_active_lists = 0
+        self.lock = threading.Lock()
+        self.formats = defaultdict(list)  # message id -> formats requested
+        self.get_calls = defaultdict(int)
+        self.list_calls = 0
+        self.batch_calls = 0
+        self.batch_sizes = []
+        self.history_records = list(enumerate(self.raw_messages, start=1))  # (history id, message id)
+        self.history_id = len(self.history_records)
+        self.first_history_id = 1
+        self.history_list_calls = 0
+
+    def add_message(self, message_id: str, raw: str):
+        self.raw_messages[message_id] = raw
+        self.history_id += 1
+        self.history_records.append((self.history_id, message_id))
+
+    def expire_history(self):
+        self.first_history_id = self.history_id + 1
+
+    # mimic the chained resource interface: service.users().messages().get(...)
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def history(self):
+        return FakeHistory(self)
+
+    def getProfile(self, userId: str):
+        return FakeRequest(lambda: {"emailAddress": "appuser@gmail.com", "historyId": str(self.history_id)})
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatchRequest(self, callback)
+
+    def get(self, userId: str, id: str, format: str = "full", metadataHeaders=None):
+        return FakeRequest(self._get, id, format, metadataHeaders)
+
+    def list(self, userId: str, q: str = None, includeSpamTrash=False, pageToken=None):
+        return FakeRequest(self._list, q, pageToken)
+
+    def _get(self, message_id: str, format: str, metadata_headers: Optional[List[str]]):
+        self.get_calls[message_id] += 1
+        self.formats[message_id].append(format)
+        if self.failures.get(message_id):
+            raise make_http_error(self.failures[message_id].pop(0))
+        if message_id not in self.raw_messages:
+            raise make_http_error(404)
+        raw = self.raw_messages[message_id]
+        message = {
+            "id": message_id,
+            "threadId": message_id,
+            "labelIds": self.labels.get(message_id, ["INBOX"]),
+            "sizeEstimate": len(raw) * 3 // 4,
+        }
+        if format == "raw":
+            message["raw"] = raw
+            return message
+        payload = make_payload(email.message_from_bytes(base64.urlsafe_b64decode(raw)))
+        if format == "metadata":
+            wanted = {name.lower() for name in metadata_headers or []}
+            payload = {
+                "mimeType": payload["mimeType"],
+                "headers": [x for x in payload["headers"] if not wanted or x["name"].lower() in wanted],
+            }
+        message["payload"] = payload
+        return message
+
+    def _list(self, query: Optional[str], page_token: Optional[str]):
+        with self.lock:
+            self.list_calls += 1
+            self.list_queries.append(query)
+            self.active_lists += 1
+            self.max_active_lists = max(self.max_active_lists, self.active_lists)
+        try:
+            time.sleep(self.list_latency)
+            return self._list_page(query, page_token)
+        finally:
+            with self.lock:
+                self.active_lists -= 1
+
+    def _list_page(self, query: Optional[str], page_token: Optional[str]):
+        if self.max_query_length is not None and len(query or "") > self.max_query_length:
+            raise make_http_error(400)
+        ids = list(self.raw_messages)
+        if query:
+            ids = [x for x in ids if matches_labels(query, self.labels.get(x, ["INBOX"]))]
+        if self.search and query:
+            ids = [x for x in ids if matches_query(query, self.raw_messages[x])]
+        start = int(page_token or 0)
+        if self.failing_page is not None and start == self.failing_page * self.page_size:
+            raise make_http_error(500)
+        end = start + self.page_size
+        response = {
+            "messages": [{"id": x, "threadId": x} for x in ids[start:end]],
+            "resultSizeEstimate": len(ids),
+        }
+        if end < len(ids):
+            response["nextPageToken"] = str(end)
+        return response
+
+    def _list_history(self, start_history_id: str, page_token: Optional[str]):
+        self.history_list_calls += 1
+        if int(start_history_id) + 1 < self.first_history_id:
+            raise make_http_error(404)
+        records = [x for x in self.history_records if x[0] > int(start_history_id)]
+        start = int(page_token or 0)
+        end = start + self.page_size
+        response = {
+            "history": [
+                {
+                    "id": str(history_id),
+                    "messages": [{"id": message_id, "threadId": message_id}],
+                    "messagesAdded": [{"message": {"id": message_id, "threadId": message_id}}],
+                }
+                for history_id, message_id in records[start:end]
+            ],
+            "historyId": str(self.history_id),
+        }
+        if end < len(records):
+            response["nextPageToken"] = str(end)
+        return response
@@ -0,0 +1,71 @@
+"""
+Stand-in for google.generativeai.GenerativeModel so the email classifier can be
+tested without calling Gemini. It can simulate response latency and 429s.
+"""
+
+import json
+import re
+import threading
+import time
+from typing import Callable, Optional
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+    def resolve(self):
+        pass
+
+
+ACME_RESULT = {"company_name": "Acme", "application_status": "no response", "job_title": "Engineer"}
+
+
+def classify_as_acme(prompt: str) -> str:
+    """Answers single and batch prompts alike, classifying every email with ACME_RESULT."""
+    email_ids = re.findall(r"^\s*Email id: (.+)$", prompt, flags=re.MULTILINE)
+    if email_ids:
+        return json.dumps([{"id": email_id, **ACME_RESULT} for email_id in email_ids])
+    return json.dumps(ACME_RESULT)
+
+
+class FakeGenerativeModel:
+    """
+    respond: maps the prompt to the response text, classify_as_acme by default
+    latency: seconds each generate_content call takes
+    rate_limited_calls: number of calls, counted from the first one, that fail with 429
+    """
+
+    def __init__(
+        self,
+        respond: Optional[Callable[[str], str]] = None,
+        latency: float = 0,
+        rate_limited_calls: int = 0,
+    ):
+        self.respond = respond or classify_as_acme
+        self.latency = latency
+        self.rate_limited_calls = rate_limited_calls
+        self.calls = 0
+        self.prompts = []
+        self.call_times = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def generate_content(self, prompt: str) -> FakeResponse:
+        with self.lock:
+            self.calls += 1
+            call_number = self.calls
+            self.prompts.append(prompt)
+            self.call_times.append(time.monotonic())
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            # quota errors come back straight away, successful calls take a while
+            if call_number <= self.rate_limited_calls:
+                raise Exception("429 Resource has been exhausted (e.g. check quota).")
+            time.sleep(self.latency)
+            return FakeResponse(self.respond(prompt))
+        finally:
+            with self.lock:
+                self.active -= 1
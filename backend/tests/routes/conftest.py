@@ -7,6 +7,19 @@ from fastapi.testclient import TestClient
 from db.users import Users
 import database
 import main
+from routes import auth_routes
+from utils.progress_utils import clear_progress
+
+
+@pytest.fixture(autouse=True)
+def clean_progress():
+    clear_progress()
+
+
+@pytest.fixture(autouse=True)
+def reset_login_rate_limit():
+    # every logged_in_user logs in
+    auth_routes.limiter.reset()
 
 
 @pytest.fixture
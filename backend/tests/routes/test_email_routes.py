@@ -1,14 +1,35 @@
+import json
+import subprocess
+import sys
+import threading
+
 from utils import auth_utils
 from unittest import mock
-from datetime import datetime
+from datetime import datetime, timedelta
 
+import pytest
+import sqlalchemy as sa
 from fastapi import Request
+from googleapiclient.errors import HttpError
 from sqlalchemy.orm import Session
 from google.oauth2.credentials import Credentials
 
+from db.backfill_windows import BackfillWindows
+from db.ingestion_jobs import QUEUED, IngestionJobs
+from db.user_emails import UserEmails
 from db.users import Users
-from db.processing_tasks import TaskRuns, FINISHED, STARTED
-from routes.email_routes import fetch_emails_to_db
+from db.utils.user_email_utils import upsert_user_emails
+from db.processing_tasks import TaskRuns, FAILED, FINISHED, STARTED
+from routes import email_routes
+from routes.email_routes import enqueue_fetch_emails, fetch_emails_to_db, ingest_emails
+from start_date.storage import get_start_date_email_filter
+from tests.fake_gmail import FakeGmailService, get_search_fields, make_http_error, make_raw_message
+from tests.fake_llm import FakeGenerativeModel
+from tests.test_filter_utils import make_backfill_mailbox
+from tests.test_user_email_utils import make_user_email
+from utils.email_utils import get_email_id_pages
+from utils.llm_utils import RateLimiter
+from utils.progress_utils import ProgressListener, publish_progress
 
 
 def test_processing(db_session, client, logged_in_user):
@@ -23,6 +44,163 @@ def test_processing(db_session, client, logged_in_user):
     assert resp.json()["processed_emails"] == 0
 
 
+def test_processing_reads_progress_published_in_memory(db_session, client, logged_in_user):
+    publish_progress(logged_in_user.user_id, STARTED, 40, 100)
+
+    # no TaskRuns row is needed while the run reports its progress in this process
+    resp = client.get("/processing", follow_redirects=False)
+
+    assert resp.status_code == 200
+    assert resp.json() == {
+        "message": "Processing in progress",
+        "status": STARTED,
+        "processed_emails": 40,
+        "total_emails": 100,
+    }
+
+
+def test_processing_stream_sends_progress_until_the_run_finishes(db_session, client, logged_in_user):
+    publish_progress(logged_in_user.user_id, STARTED, 40, 100)
+    # the test client only returns once the stream has ended
+    threading.Timer(
+        0.2, publish_progress, args=(logged_in_user.user_id, FINISHED, 100, 100)
+    ).start()
+
+    resp = client.get("/processing/stream")
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    events = [
+        json.loads(line.removeprefix("data: "))
+        for line in resp.text.splitlines()
+        if line.startswith("data: ")
+    ]
+    assert [(event["status"], event["processed_emails"]) for event in events] == [
+        (STARTED, 40),
+        (FINISHED, 100),
+    ]
+    assert events[-1]["message"] == "Processing complete"
+
+
+def test_processing_stream_gets_progress_notified_by_another_process(db_session, engine, client, logged_in_user):
+    user_id = logged_in_user.user_id
+    db_session.add(TaskRuns(user=logged_in_user, status=STARTED, total_emails=100))
+    db_session.flush()
+    # a worker process, publishing nothing in this one
+    notify = (
+        "import json, sys\n"
+        "import sqlalchemy as sa\n"
+        "from utils.progress_utils import notify_progress\n"
+        "engine = sa.create_engine(sa.URL.create('postgresql', **json.loads(sys.argv[1])))\n"
+        "progress = {'status': 'finished', 'processed_emails': 100, 'total_emails': 100}\n"
+        "notify_progress(engine, sys.argv[2], progress)\n"
+    )
+    url = {
+        key: getattr(engine.url, key) for key in ("username", "password", "host", "port", "database")
+    }
+    worker = threading.Timer(
+        0.3,
+        subprocess.run,
+        args=([sys.executable, "-c", notify, json.dumps(url), user_id],),
+        kwargs={"check": True},
+    )
+    # ends the stream if the notification never arrives
+    timeout = threading.Timer(20, publish_progress, args=(user_id, FAILED, 0, 100))
+    listener = ProgressListener(engine, poll_seconds=0.1).start()
+    try:
+        assert listener.listening.wait(5)
+        worker.start()
+        timeout.start()
+        resp = client.get("/processing/stream")
+    finally:
+        timeout.cancel()
+        listener.stop()
+
+    events = [
+        json.loads(line.removeprefix("data: "))
+        for line in resp.text.splitlines()
+        if line.startswith("data: ")
+    ]
+    assert [(event["status"], event["processed_emails"]) for event in events] == [
+        (STARTED, 0),
+        (FINISHED, 100),
+    ]
+
+
+def test_processing_stream_ends_after_one_event_for_a_finished_run(db_session, client, logged_in_user):
+    db_session.add(TaskRuns(user=logged_in_user, status=FINISHED, processed_emails=3, total_emails=3))
+    db_session.flush()
+
+    resp = client.get("/processing/stream")
+
+    assert resp.status_code == 200
+    assert resp.text == (
+        'data: {"message": "Processing complete", "status": "finished", '
+        '"processed_emails": 3, "total_emails": 3}\n\n'
+    )
+
+
+def test_processing_stream_404(db_session, client, logged_in_user):
+    resp = client.get("/processing/stream")
+    assert resp.status_code == 404
+
+
+def test_enqueue_fetch_emails_queues_job_with_session_values(db_session):
+    db_session.add(Users(user_id="123", user_email="user123@example.com", start_date=datetime(2000, 1, 1)))
+    db_session.commit()
+    request = Request({"type": "http", "session": {"start_date": "2025-01-01", "is_new_user": True}})
+    creds = Credentials("abc", refresh_token="def", client_id="client", client_secret="secret")
+
+    job_id = enqueue_fetch_emails(request, creds, "123", datetime(2025, 3, 20))
+
+    job = db_session.get(IngestionJobs, job_id)
+    assert job.status == QUEUED
+    assert job.payload["session"] == {"start_date": "2025-01-01", "is_new_user": True}
+    assert job.payload["last_updated"] == "2025-03-20T00:00:00"
+    assert json.loads(job.payload["creds"])["refresh_token"] == "def"
+    assert request.session["is_new_user"] is False
+
+
+def test_enqueue_fetch_emails_marks_a_finished_run_started(db_session):
+    user = Users(user_id="123", user_email="user123@example.com", start_date=datetime(2000, 1, 1))
+    db_session.add(user)
+    db_session.add(TaskRuns(user=user, status=FINISHED, processed_emails=7, total_emails=7))
+    db_session.commit()
+    db_session.execute(
+        sa.update(TaskRuns).values(updated=datetime.now() - timedelta(hours=2))
+    )
+    db_session.commit()
+    request = Request({"type": "http", "session": {}})
+
+    job_id = enqueue_fetch_emails(request, Credentials("abc"), "123")
+
+    assert job_id is not None
+    db_session.expire_all()
+    task_run = db_session.get(TaskRuns, "123")
+    # /processing does not report the last run as complete until a worker runs the job
+    assert (task_run.status, task_run.processed_emails, task_run.total_emails) == (STARTED, 0, 0)
+
+    # the worker runs the job even though the run was just updated
+    with mock.patch("routes.email_routes.get_email_id_pages"):
+        fetch_emails_to_db(auth_utils.AuthenticatedUser(Credentials("abc")), {}, user_id="123", exclusive=True)
+    db_session.expire_all()
+    assert db_session.get(TaskRuns, "123").status == FINISHED
+
+
+def test_enqueue_fetch_emails_at_most_once_an_hour(db_session):
+    user = Users(user_id="123", user_email="user123@example.com", start_date=datetime(2000, 1, 1))
+    db_session.add(user)
+    db_session.add(TaskRuns(user=user, status=FINISHED, processed_emails=7, total_emails=7))
+    db_session.commit()
+    request = Request({"type": "http", "session": {}})
+
+    assert enqueue_fetch_emails(request, Credentials("abc"), "123") is None
+
+    db_session.expire_all()
+    assert db_session.get(TaskRuns, "123").status == FINISHED
+    assert db_session.query(IngestionJobs).count() == 0
+
+
 def test_processing_404(db_session, client, logged_in_user):
     resp = client.get("/processing", follow_redirects=False)
     assert resp.status_code == 404
@@ -40,10 +218,10 @@ def test_fetch_emails_to_db(db_session: Session):
     )
     db_session.commit()
 
-    with mock.patch("routes.email_routes.get_email_ids"):
+    with mock.patch("routes.email_routes.get_email_id_pages"):
         fetch_emails_to_db(
             auth_utils.AuthenticatedUser(Credentials("abc")),
-            Request({"type": "http", "session": {}}),
+            {},
             user_id=test_user_id,
         )
 
@@ -63,13 +241,587 @@ def test_fetch_emails_to_db_in_progress_rate_limited_no_processing(db_session: S
     db_session.add(TaskRuns(user=user, status=STARTED))
     db_session.commit()
 
-    with mock.patch("routes.email_routes.get_email_ids") as mock_get_email_ids:
+    with mock.patch("routes.email_routes.get_email_id_pages") as mock_get_email_id_pages:
         fetch_emails_to_db(
             auth_utils.AuthenticatedUser(Credentials("abc")),
-            Request({"type": "http", "session": {}}),
+            {},
             user_id=test_user_id,
         )
 
-    mock_get_email_ids.assert_not_called()
+    mock_get_email_id_pages.assert_not_called()
     task_run = db_session.get(TaskRuns, test_user_id)
     assert task_run.status == STARTED
+
+
+def test_fetch_emails_to_db_fetches_messages_in_batches(db_session: Session):
+    test_user_id = "123"
+
+    db_session.add(
+        Users(
+            user_id=test_user_id,
+            user_email="user123@example.com",
+            start_date=datetime(2000, 1, 1),
+        )
+    )
+    db_session.commit()
+
+    service = FakeGmailService(
+        {f"id{i}": make_raw_message(f"Application {i} received") for i in range(5)},
+        failures={"id3": [429]},
+    )
+    with (
+        mock.patch("routes.email_routes.build", return_value=service),
+        mock.patch("utils.llm_utils.model", FakeGenerativeModel()),
+        mock.patch("utils.email_utils.time.sleep"),
+    ):
+        fetch_emails_to_db(
+            auth_utils.AuthenticatedUser(Credentials("abc")),
+            {},
+            user_id=test_user_id,
+        )
+
+    task_run = db_session.get(TaskRuns, test_user_id)
+    assert task_run.status == FINISHED
+    assert task_run.processed_emails == 5
+    # all 5 at once, then a retry of the one rate limited
+    assert service.batch_sizes == [5, 1]
+    stored = db_session.query(UserEmails).all()
+    assert sorted(email.id for email in stored) == [f"id{i}" for i in range(5)]
+
+
+def test_fetch_emails_to_db_keeps_emails_processed_before_a_failure(db_session: Session):
+    test_user_id = "123"
+
+    db_session.add(
+        Users(
+            user_id=test_user_id,
+            user_email="user123@example.com",
+            start_date=datetime(2000, 1, 1),
+        )
+    )
+    db_session.commit()
+
+    # the third page of message ids cannot be listed
+    service = FakeGmailService(
+        {f"id{i}": make_raw_message(f"Application {i} received") for i in range(30)},
+        page_size=7,
+        failing_page=2,
+    )
+    with (
+        mock.patch("routes.email_routes.build", return_value=service),
+        mock.patch("utils.llm_utils.model", FakeGenerativeModel()),
+        mock.patch("routes.email_routes.EMAIL_WRITE_CHUNK_SIZE", 5),
+        pytest.raises(HttpError),
+    ):
+        fetch_emails_to_db(
+            auth_utils.AuthenticatedUser(Credentials("abc")),
+            {},
+            user_id=test_user_id,
+        )
+
+    db_session.expire_all()
+    stored = db_session.query(UserEmails).all()
+    assert sorted(email.id for email in stored) == sorted(f"id{i}" for i in range(14))
+    task_run = db_session.get(TaskRuns, test_user_id)
+    assert task_run.status == FAILED
+    assert task_run.processed_emails == 14
+
+
+def test_fetch_emails_to_db_resumes_a_failed_run_from_its_checkpoint(db_session: Session):
+    test_user_id = "123"
+
+    db_session.add(
+        Users(
+            user_id=test_user_id,
+            user_email="user123@example.com",
+            start_date=datetime(2000, 1, 1),
+        )
+    )
+    db_session.commit()
+
+    messages = {f"id{i}": make_raw_message(f"Application {i} received") for i in range(30)}
+    failing_service = FakeGmailService(messages, page_size=7, failing_page=2)
+    service = FakeGmailService(messages, page_size=7)
+    for gmail_service in (failing_service, service):
+        with (
+            mock.patch("routes.email_routes.build", return_value=gmail_service),
+            mock.patch("utils.llm_utils.model", FakeGenerativeModel()),
+                mock.patch("routes.email_routes.EMAIL_WRITE_CHUNK_SIZE", 5),
+        ):
+            try:
+                fetch_emails_to_db(
+                    auth_utils.AuthenticatedUser(Credentials("abc")),
+                    {},
+                    user_id=test_user_id,
+                )
+            except HttpError:
+                pass
+
+    # the second run picks up after the 14 messages the first one processed
+    assert sorted(failing_service.get_calls) == sorted(f"id{i}" for i in range(14))
+    assert sorted(service.get_calls) == sorted(f"id{i}" for i in range(14, 30))
+    db_session.expire_all()
+    stored = db_session.query(UserEmails).all()
+    assert sorted(email.id for email in stored) == sorted(messages)
+    task_run = db_session.get(TaskRuns, test_user_id)
+    assert task_run.status == FINISHED
+    assert task_run.processed_emails == 30
+    assert task_run.total_emails == 30
+    assert task_run.page_token is None
+    assert task_run.processed_message_ids is None
+
+
+def test_fetch_emails_to_db_resumes_with_a_message_retried_after_the_next_page(db_session: Session):
+    test_user_id = "123"
+    db_session.add(Users(user_id=test_user_id, user_email="user123@example.com", start_date=datetime(2000, 1, 1)))
+    db_session.commit()
+
+    messages = {f"id{i}": make_raw_message(f"Application {i} received") for i in range(30)}
+    # the last message of the first page is rate limited, so it is fetched
+    # again after the messages of the next pages in its batch
+    failing_service = FakeGmailService(messages, page_size=7, failures={"id6": [429]})
+    service = FakeGmailService(messages, page_size=7)
+    writes = []
+
+    def upsert_then_die(*args, **kwargs):
+        # the run dies after its second chunk, which has messages of the
+        # second page but not the retried one, was committed
+        if len(writes) == 2:
+            raise RuntimeError("killed")
+        writes.append(args)
+        return upsert_user_emails(*args, **kwargs)
+
+    for gmail_service, upsert in ((failing_service, upsert_then_die), (service, upsert_user_emails)):
+        with (
+            mock.patch("routes.email_routes.build", return_value=gmail_service),
+            mock.patch("routes.email_routes.upsert_user_emails", side_effect=upsert),
+            mock.patch("utils.llm_utils.model", FakeGenerativeModel()),
+            mock.patch("utils.email_utils.time.sleep"),
+            mock.patch("routes.email_routes.EMAIL_WRITE_CHUNK_SIZE", 5),
+        ):
+            try:
+                fetch_emails_to_db(auth_utils.AuthenticatedUser(Credentials("abc")), {}, user_id=test_user_id)
+            except RuntimeError:
+                pass
+
+    assert failing_service.get_calls["id7"] == 1 and "id6" in service.get_calls
+    db_session.expire_all()
+    assert sorted(email.id for email in db_session.query(UserEmails)) == sorted(messages)
+    assert db_session.get(TaskRuns, test_user_id).status == FINISHED
+
+
+def test_fetch_emails_to_db_skips_emails_already_stored(db_session: Session):
+    test_user_id = "123"
+
+    db_session.add(
+        Users(
+            user_id=test_user_id,
+            user_email="user123@example.com",
+            start_date=datetime(2000, 1, 1),
+        )
+    )
+    db_session.add_all(make_user_email(f"id{i}", test_user_id) for i in range(6))
+    db_session.commit()
+
+    service = FakeGmailService(
+        {f"id{i}": make_raw_message(f"Application {i} received") for i in range(10)},
+        page_size=4,
+    )
+    model = FakeGenerativeModel()
+    with (
+        mock.patch("routes.email_routes.build", return_value=service),
+        mock.patch("utils.llm_utils.model", model),
+    ):
+        fetch_emails_to_db(
+            auth_utils.AuthenticatedUser(Credentials("abc")),
+            {},
+            user_id=test_user_id,
+        )
+
+    assert sorted(service.get_calls) == ["id6", "id7", "id8", "id9"]
+    assert not any(f"Email id: id{i}\n" in prompt for prompt in model.prompts for i in range(6))
+    task_run = db_session.get(TaskRuns, test_user_id)
+    assert task_run.status == FINISHED
+    assert task_run.total_emails == 4
+    assert db_session.query(UserEmails).count() == 10
+
+
+def test_fetch_emails_to_db_tolerates_emails_stored_by_an_overlapping_run(db_session: Session):
+    test_user_id = "123"
+    user = auth_utils.AuthenticatedUser(Credentials("abc"))
+
+    db_session.add(
+        Users(
+            user_id=test_user_id,
+            user_email="user123@example.com",
+            start_date=datetime(2000, 1, 1),
+        )
+    )
+    db_session.commit()
+
+    service = FakeGmailService(
+        {f"id{i}": make_raw_message(f"Application {i} received") for i in range(6)}
+    )
+
+    def store_during_listing(session, user_id, email_ids):
+        # another run stores some of the emails after they were checked
+        db_session.add_all(make_user_email(f"id{i}", user.user_id) for i in range(3))
+        db_session.commit()
+        return set()
+
+    with (
+        mock.patch("routes.email_routes.build", return_value=service),
+        mock.patch("utils.llm_utils.model", FakeGenerativeModel()),
+        mock.patch("routes.email_routes.get_existing_email_ids", store_during_listing),
+    ):
+        fetch_emails_to_db(user, {}, user_id=test_user_id)
+
+    task_run = db_session.get(TaskRuns, test_user_id)
+    assert task_run.status == FINISHED
+    assert db_session.query(UserEmails).count() == 6
+    # the rows stored by the other run are kept as they are
+    assert db_session.get(UserEmails, ("id0", user.user_id)).job_title == "Software Engineer"
+
+
+def test_fetch_emails_to_db_saves_progress_in_batches(db_session: Session, engine):
+    test_user_id = "123"
+
+    db_session.add(
+        Users(
+            user_id=test_user_id,
+            user_email="user123@example.com",
+            start_date=datetime(2000, 1, 1),
+        )
+    )
+    db_session.commit()
+
+    service = FakeGmailService(
+        {f"id{i}": make_raw_message(f"Application {i} received") for i in range(250)}
+    )
+    progress_writes = []
+
+    def count_progress_write(conn, cursor, statement, *args):
+        if statement.startswith("UPDATE processing_task_runs"):
+            progress_writes.append(statement)
+
+    sa.event.listen(engine, "before_cursor_execute", count_progress_write)
+    try:
+        with (
+            mock.patch("routes.email_routes.build", return_value=service),
+            mock.patch("utils.llm_utils.model", FakeGenerativeModel()),
+            mock.patch("utils.llm_utils.rate_limiter", RateLimiter(60000, burst=100)),
+        ):
+            fetch_emails_to_db(
+                auth_utils.AuthenticatedUser(Credentials("abc")),
+                {},
+                user_id=test_user_id,
+            )
+    finally:
+        sa.event.remove(engine, "before_cursor_execute", count_progress_write)
+
+    # one write per chunk of 50 emails plus the final one, instead of one per email
+    assert len(progress_writes) <= 250 // 50 + 2
+    task_run = db_session.get(TaskRuns, test_user_id)
+    assert task_run.status == FINISHED
+    assert task_run.processed_emails == 250
+    assert task_run.total_emails == 250
+
+
+def run_fetch_emails_again(db_session, service, test_user_id, last_updated):
+    # past the limit of one fetch per hour
+    task_run = db_session.get(TaskRuns, test_user_id)
+    task_run.updated = datetime.now() - timedelta(hours=2)
+    db_session.commit()
+    service.get_calls.clear()
+    service.list_calls = 0
+    with (
+        mock.patch("routes.email_routes.build", return_value=service),
+        mock.patch("utils.llm_utils.model", FakeGenerativeModel()),
+    ):
+        fetch_emails_to_db(
+            auth_utils.AuthenticatedUser(Credentials("abc"), user_id=test_user_id),
+            {},
+            last_updated,
+            user_id=test_user_id,
+        )
+    db_session.expire_all()
+    return db_session.get(TaskRuns, test_user_id)
+
+
+@pytest.fixture
+def synced_mailbox(db_session):
+    """A user whose 5 emails were fetched by a full run, and their mailbox."""
+    test_user_id = "123"
+    db_session.add(
+        Users(
+            user_id=test_user_id,
+            user_email="user123@example.com",
+            start_date=datetime(2000, 1, 1),
+        )
+    )
+    db_session.commit()
+
+    service = FakeGmailService(
+        {f"id{i}": make_raw_message(f"Application {i} received") for i in range(5)}
+    )
+    with (
+        mock.patch("routes.email_routes.build", return_value=service),
+        mock.patch("utils.llm_utils.model", FakeGenerativeModel()),
+    ):
+        fetch_emails_to_db(
+            auth_utils.AuthenticatedUser(Credentials("abc"), user_id=test_user_id),
+            {},
+            user_id=test_user_id,
+        )
+    assert db_session.get(TaskRuns, test_user_id).history_id == "5"
+    return test_user_id, service
+
+
+def test_fetch_emails_to_db_syncs_only_messages_added_since_the_last_run(db_session, synced_mailbox):
+    test_user_id, service = synced_mailbox
+    service.add_message("id5", make_raw_message("Application 5 received"))
+    service.add_message("id6", make_raw_message("Application 6 received"))
+
+    task_run = run_fetch_emails_again(db_session, service, test_user_id, datetime(2025, 2, 13))
+
+    assert sorted(service.get_calls) == ["id5", "id6"]
+    assert task_run.status == FINISHED
+    assert task_run.total_emails == 2
+    assert task_run.history_id == "7"
+    assert db_session.query(UserEmails).count() == 7
+
+
+def test_fetch_emails_to_db_does_not_search_when_nothing_was_added(db_session, synced_mailbox):
+    test_user_id, service = synced_mailbox
+
+    task_run = run_fetch_emails_again(db_session, service, test_user_id, datetime(2025, 2, 13))
+
+    assert service.list_calls == 0
+    assert not service.get_calls
+    assert task_run.status == FINISHED
+    assert task_run.history_id == "5"
+
+
+def test_fetch_emails_to_db_falls_back_to_the_query_when_history_expired(db_session, synced_mailbox):
+    test_user_id, service = synced_mailbox
+    service.add_message("id5", make_raw_message("Application 5 received"))
+    service.expire_history()
+    service.history_list_calls = 0
+
+    task_run = run_fetch_emails_again(db_session, service, test_user_id, datetime(2025, 2, 13))
+
+    assert service.history_list_calls == 1
+    assert service.list_calls == 1
+    # the stored emails are still skipped, by the check against the database
+    assert sorted(service.get_calls) == ["id5"]
+    assert task_run.status == FINISHED
+    assert task_run.history_id == "6"
+
+
+def test_fetch_emails_to_db_does_not_download_the_users_own_emails(db_session: Session):
+    test_user_id = "123"
+
+    db_session.add(
+        Users(
+            user_id=test_user_id,
+            user_email="user123@example.com",
+            start_date=datetime(2000, 1, 1),
+        )
+    )
+    db_session.commit()
+
+    service = FakeGmailService(
+        {f"id{i}": make_raw_message(f"Application {i} received") for i in range(4)},
+        labels={"id1": ["SENT"], "id2": ["DRAFT"]},
+    )
+    with (
+        mock.patch("routes.email_routes.build", return_value=service),
+        mock.patch("utils.llm_utils.model", FakeGenerativeModel()),
+    ):
+        fetch_emails_to_db(
+            auth_utils.AuthenticatedUser(Credentials("abc"), user_id=test_user_id),
+            {},
+            user_id=test_user_id,
+        )
+
+    assert service.formats["id1"] == service.formats["id2"] == []
+    assert service.formats["id0"] == service.formats["id3"] == ["full"]
+    task_run = db_session.get(TaskRuns, test_user_id)
+    assert task_run.status == FINISHED
+    assert task_run.processed_emails == task_run.total_emails == 2
+    assert sorted(email.id for email in db_session.query(UserEmails)) == ["id0", "id3"]
+
+
+def test_fetch_emails_to_db_lists_a_backfill_in_query_shards(db_session: Session):
+    test_user_id = "123"
+    db_session.add(Users(user_id=test_user_id, user_email="user123@example.com", start_date=datetime(2000, 1, 1)))
+    db_session.commit()
+
+    start_date = (datetime.now() - timedelta(days=365)).strftime("%Y-%m-%d")
+    messages = make_backfill_mailbox(datetime.now() - timedelta(days=364), 60)
+    expected = [
+        m["id"]
+        for page, _ in get_email_id_pages(get_start_date_email_filter(start_date), FakeGmailService(messages, search=True))
+        for m in page
+    ]
+    service = FakeGmailService(messages, search=True, max_query_length=1500)
+    with (
+        mock.patch("routes.email_routes.build", return_value=service),
+        mock.patch("utils.llm_utils.model", FakeGenerativeModel()),
+        mock.patch("utils.llm_utils.rate_limiter", RateLimiter(60000, burst=100)),
+    ):
+        fetch_emails_to_db(
+            auth_utils.AuthenticatedUser(Credentials("abc"), user_id=test_user_id),
+            {"start_date": start_date, "is_new_user": True},
+            user_id=test_user_id,
+        )
+
+    assert len(set(service.list_queries)) > 5
+    assert sorted(email.id for email in db_session.query(UserEmails)) == sorted(expected)
+    task_run = db_session.get(TaskRuns, test_user_id)
+    assert task_run.status == FINISHED
+    assert task_run.total_emails == len(expected)
+
+
+def backfill_window_number(raw: str, window_days: int) -> int:
+    """Which of the backfill windows, newest first, a message falls in."""
+    return int((datetime.now().timestamp() - get_search_fields(raw)[2]) // (window_days * 24 * 60 * 60))
+
+
+def test_fetch_emails_to_db_backfills_the_newest_window_first(db_session: Session):
+    test_user_id = "123"
+    db_session.add(Users(user_id=test_user_id, user_email="user123@example.com", start_date=datetime(2000, 1, 1)))
+    db_session.commit()
+
+    start_date = (datetime.now() - timedelta(days=365)).strftime("%Y-%m-%d")
+    messages = make_backfill_mailbox(datetime.now() - timedelta(days=364), 60)
+    service = FakeGmailService(messages, search=True)
+    with (
+        mock.patch("routes.email_routes.build", return_value=service),
+        mock.patch("utils.llm_utils.model", FakeGenerativeModel()),
+        mock.patch("utils.llm_utils.rate_limiter", RateLimiter(60000, burst=100)),
+        mock.patch("routes.email_routes.settings.GMAIL_LIST_CONCURRENCY", 1),
+    ):
+        fetch_emails_to_db(
+            auth_utils.AuthenticatedUser(Credentials("abc"), user_id=test_user_id),
+            {"start_date": start_date, "is_new_user": True},
+            user_id=test_user_id,
+        )
+
+    fetched_windows = [backfill_window_number(messages[x], 30) for x in service.get_calls]
+    assert len(set(fetched_windows)) > 5
+    assert fetched_windows == sorted(fetched_windows)
+    windows = db_session.query(BackfillWindows).all()
+    assert len(windows) == 13
+    assert all(window.status == FINISHED for window in windows)
+    assert sum(window.processed_emails for window in windows) == len(service.get_calls)
+    task_run = db_session.get(TaskRuns, test_user_id)
+    assert task_run.status == FINISHED
+    assert task_run.processed_emails == task_run.total_emails == db_session.query(UserEmails).count()
+
+
+def test_fetch_emails_to_db_retries_only_the_backfill_window_that_failed(db_session: Session):
+    test_user_id = "123"
+    db_session.add(Users(user_id=test_user_id, user_email="user123@example.com", start_date=datetime(2000, 1, 1)))
+    db_session.commit()
+
+    start_date = (datetime.now() - timedelta(days=120)).strftime("%Y-%m-%d")
+    messages = make_backfill_mailbox(datetime.now() - timedelta(days=119), 40)
+    expected = [
+        m["id"]
+        for page, _ in get_email_id_pages(get_start_date_email_filter(start_date), FakeGmailService(messages, search=True))
+        for m in page
+    ]
+    window_queries = []
+
+    def ingest_failing_the_second_window(*args, **kwargs):
+        window_queries.append(args[5])
+        if len(window_queries) == 2:
+            raise make_http_error(500)
+        return ingest_emails(*args, **kwargs)
+
+    services = [FakeGmailService(messages, search=True) for _ in range(2)]
+    with (
+        mock.patch("utils.llm_utils.model", FakeGenerativeModel()),
+        mock.patch("utils.llm_utils.rate_limiter", RateLimiter(60000, burst=100)),
+    ):
+        with (
+            mock.patch("routes.email_routes.build", return_value=services[0]),
+            mock.patch("routes.email_routes.ingest_emails", ingest_failing_the_second_window),
+            pytest.raises(HttpError),
+        ):
+            fetch_emails_to_db(
+                auth_utils.AuthenticatedUser(Credentials("abc"), user_id=test_user_id),
+                {"start_date": start_date, "is_new_user": True},
+                user_id=test_user_id,
+            )
+
+        # the older windows were still processed
+        assert len(window_queries) == 5
+        failed_window = db_session.query(BackfillWindows).filter_by(status=FAILED).one()
+        assert failed_window.query == window_queries[1]
+        assert failed_window.attempts == 1 and "500" in failed_window.last_error
+        stored = {email.id for email in db_session.query(UserEmails)}
+        assert stored < set(expected)
+        assert db_session.get(TaskRuns, test_user_id).status == FAILED
+
+        with mock.patch("routes.email_routes.build", return_value=services[1]):
+            fetch_emails_to_db(
+                auth_utils.AuthenticatedUser(Credentials("abc"), user_id=test_user_id),
+                {"start_date": start_date, "is_new_user": True},
+                user_id=test_user_id,
+            )
+
+    # the rerun only lists the failed window and fetches what it missed
+    after = failed_window.query.split(" after:")[1]
+    assert services[1].list_queries and all(f" after:{after}" in query for query in services[1].list_queries)
+    assert not stored & set(services[1].get_calls)
+    db_session.expire_all()
+    assert sorted(email.id for email in db_session.query(UserEmails)) == sorted(expected)
+    assert all(window.status == FINISHED for window in db_session.query(BackfillWindows))
+    assert failed_window.attempts == 2
+    task_run = db_session.get(TaskRuns, test_user_id)
+    assert task_run.status == FINISHED
+    assert task_run.processed_emails == len(expected)
+
+
+def test_get_emails_pages_with_cursors(db_session, client, logged_in_user):
+    for i in range(5):
+        record = make_user_email(f"id{i}", logged_in_user.user_id)
+        record.received_at = datetime(2025, 1, 1 + i)
+        db_session.add(record)
+    db_session.flush()
+
+    first = client.get("/get-emails", params={"page_size": 2})
+    second = client.get("/get-emails", params={"page_size": 2, "cursor": first.headers["X-Next-Cursor"]})
+    last = client.get("/get-emails", params={"page_size": 2, "cursor": second.headers["X-Next-Cursor"]})
+
+    assert [email["id"] for email in first.json() + second.json() + last.json()] == [f"id{i}" for i in range(4, -1, -1)]
+    assert first.headers["X-Total-Count"] == "5"
+    assert "X-Total-Count" not in second.headers
+    assert "X-Next-Cursor" not in last.headers
+
+    filtered = client.get("/get-emails", params={"received_after": "2025-01-02", "received_before": "2025-01-04"})
+    assert [email["id"] for email in filtered.json()] == ["id2", "id1"]
+    assert filtered.headers["X-Total-Count"] == "2"
+
+    everything = client.get("/get-emails", params={"unpaginated": True, "page_size": 2})
+    assert len(everything.json()) == 5 and "X-Next-Cursor" not in everything.headers
+
+    assert client.get("/get-emails", params={"cursor": "not a cursor"}).status_code == 400
+
+
+def test_get_emails_rate_limit_counts_every_page(db_session, client, logged_in_user):
+    for i in range(3):
+        db_session.add(make_user_email(f"id{i}", logged_in_user.user_id))
+    db_session.flush()
+    email_routes.limiter.reset()
+
+    try:
+        first = client.get("/get-emails", params={"page_size": 1})
+        next_page = {"page_size": 1, "cursor": first.headers["X-Next-Cursor"]}
+        for _ in range(59):
+            assert client.get("/get-emails", params=next_page).status_code == 200
+        assert client.get("/get-emails", params=next_page).status_code == 429
+    finally:
+        email_routes.limiter.reset()
@@ -0,0 +1,76 @@
+import csv
+import gzip
+import io
+from datetime import datetime, timedelta
+
+import pyarrow.parquet
+import pytest
+
+from db.utils.user_email_utils import iter_user_email_rows, upsert_user_emails
+from routes import file_routes
+from tests.test_user_email_utils import make_user_email
+from utils.export_utils import EXPORT_FIELDS
+
+
+@pytest.fixture(autouse=True)
+def reset_rate_limits():
+    file_routes.limiter.reset()
+
+
+def add_user_emails(db_session, count: int):
+    records = []
+    for i in range(count):
+        record = make_user_email(f"id{i}", "123")
+        record.received_at = datetime(2025, 1, 1) + timedelta(hours=i)
+        records.append(record)
+    upsert_user_emails(db_session, records)
+    db_session.commit()
+
+
+def test_process_csv_streams_every_email_newest_first(db_session, client, logged_in_user, monkeypatch):
+    # several batches
+    monkeypatch.setattr(file_routes, "iter_user_email_rows", lambda *args: iter_user_email_rows(*args, batch_size=7))
+    add_user_emails(db_session, 25)
+
+    resp = client.get("/process-csv")
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/csv")
+    assert resp.headers["content-disposition"] == 'attachment; filename="emails.csv"'
+    rows = list(csv.reader(io.StringIO(resp.text)))
+    assert rows[0] == list(EXPORT_FIELDS.values())
+    assert [row[2] for row in rows[1:]] == [
+        str(datetime(2025, 1, 1) + timedelta(hours=i)) for i in reversed(range(25))
+    ]
+
+
+def test_process_csv_can_gzip(db_session, client, logged_in_user):
+    add_user_emails(db_session, 3)
+    csv_resp = client.get("/process-csv")
+
+    resp = client.get("/process-csv", params={"format": "csv.gz"})
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/gzip"
+    # not decoded by the client, the file itself is compressed
+    assert gzip.decompress(resp.content) == csv_resp.content
+
+
+def test_process_csv_can_write_parquet(db_session, client, logged_in_user, monkeypatch):
+    monkeypatch.setattr(file_routes, "iter_user_email_rows", lambda *args: iter_user_email_rows(*args, batch_size=2))
+    add_user_emails(db_session, 5)
+
+    resp = client.get("/process-csv", params={"format": "parquet"})
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/vnd.apache.parquet"
+    parquet_file = pyarrow.parquet.ParquetFile(io.BytesIO(resp.content))
+    assert parquet_file.metadata.num_row_groups == 3
+    rows = parquet_file.read().to_pylist()
+    assert [row["received_at"] for row in rows] == [datetime(2025, 1, 1) + timedelta(hours=i) for i in reversed(range(5))]
+    assert rows[0]["company_name"] == "Acme" and list(rows[0]) == list(EXPORT_FIELDS)
+
+
+def test_process_csv_rejects_unknown_formats_and_no_emails(client, logged_in_user):
+    assert client.get("/process-csv", params={"format": "xlsx"}).status_code == 422
+    assert client.get("/process-csv").status_code == 400
@@ -0,0 +1,23 @@
+from tests.test_user_email_utils import make_user_email
+
+
+def test_response_rates(db_session, client, logged_in_user):
+    for i, (company, title, status) in enumerate(
+        [
+            ("Acme", "Software Engineer", "Request for availability"),
+            ("Acme", "Software Engineer", "rejected"),  # older email of the same application
+            ("Globex", "Software Engineer", "no response"),
+            ("Initech", "Data Analyst", "offer"),
+        ]
+    ):
+        record = make_user_email(f"id{i}", logged_in_user.user_id)
+        record.company_name, record.job_title, record.application_status = company, title, status
+        record.received_at = record.received_at.replace(day=28 - i)
+        db_session.add(record)
+    db_session.flush()
+
+    by_title = client.get("/get-response-rate")
+    overall = client.get("/user-response-rate")
+
+    assert by_title.json() == [{"title": "Software Engineer", "rate": 50.0}, {"title": "Data Analyst", "rate": 100.0}]
+    assert overall.json() == {"value": 25.0}
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+from db.backfill_windows import FAILED, FINISHED, PENDING, BackfillWindows
+from db.users import Users
+from db.utils.backfill_utils import (
+    fail_backfill_window,
+    finish_backfill_window,
+    get_unfinished_backfill_windows,
+    plan_backfill_windows,
+    start_backfill_window,
+)
+
+
+def add_user(db_session, user_id="123"):
+    db_session.add(Users(user_id=user_id, user_email=f"user{user_id}@example.com", start_date=datetime(2000, 1, 1)))
+    db_session.commit()
+
+
+def test_plan_backfill_windows_newest_first(db_session):
+    add_user(db_session)
+    start_date = (datetime.now() - timedelta(days=100)).strftime("%Y/%m/%d")
+
+    windows = plan_backfill_windows(db_session, "123", start_date, 30, shard_max_length=1500)
+    db_session.commit()
+
+    assert len(windows) == 4
+    assert windows[0].window_end is None
+    assert all(newer.window_start > older.window_start for newer, older in zip(windows, windows[1:]))
+    assert all(window.status == PENDING for window in windows)
+    assert f"after:{int(windows[0].window_start.timestamp())}" in windows[0].query
+    assert "before:" not in windows[0].query
+    assert f"before:{int(windows[0].window_start.timestamp()) + 1}" in windows[1].query
+    assert all(
+        shard.endswith(f"after:{int(windows[1].window_start.timestamp())} before:{int(windows[0].window_start.timestamp()) + 1}")
+        and len(shard) <= 1500
+        for shard in windows[1].shard_queries
+    )
+
+
+def test_plan_backfill_windows_replaces_the_previous_plan(db_session):
+    add_user(db_session)
+    plan_backfill_windows(db_session, "123", "2020/01/01", 30)
+    db_session.commit()
+
+    windows = plan_backfill_windows(db_session, "123", None, 30)
+    db_session.commit()
+
+    assert db_session.query(BackfillWindows).count() == len(windows)
+    assert all(window.shard_queries is None for window in windows)
+
+
+def test_unfinished_backfill_windows_keep_failed_ones_and_their_checkpoint(db_session):
+    add_user(db_session)
+    newest, failed, finished = plan_backfill_windows(db_session, "123", "2020/01/01", 30)[:3]
+    for window in (newest, failed, finished):
+        start_backfill_window(window)
+    failed.page_token = "page-2"
+    failed.processed_message_ids = ["id1"]
+    fail_backfill_window(failed, "HttpError 500")
+    finish_backfill_window(finished)
+    db_session.commit()
+
+    unfinished = get_unfinished_backfill_windows(db_session, "123")
+
+    assert newest in unfinished and failed in unfinished and finished not in unfinished
+    assert failed.status == FAILED and failed.attempts == 1 and failed.last_error == "HttpError 500"
+    assert (failed.page_token, failed.processed_message_ids) == ("page-2", ["id1"])
+    assert finished.status == FINISHED and finished.page_token is None
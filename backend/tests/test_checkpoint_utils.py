@@ -0,0 +1,27 @@
+from utils.checkpoint_utils import PageCheckpoint
+
+
+def test_page_checkpoint_moves_past_a_page_once_all_its_messages_are_done():
+    checkpoint = PageCheckpoint()
+    checkpoint.page_listed(0, "tok1", ["a", "b"])
+    checkpoint.page_listed(1, "tok2", ["c", "d"])
+
+    # b is still being retried when a message of the next page is processed
+    checkpoint.message_processed("a")
+    checkpoint.message_processed("c")
+    assert checkpoint.get_state() == {"page_token": None, "processed_message_ids": ["a", "c"]}
+
+    checkpoint.message_processed("b")
+    assert checkpoint.get_state() == {"page_token": "tok1", "processed_message_ids": ["c"]}
+
+    checkpoint.message_failed("d")
+    assert checkpoint.get_state() == {"page_token": "tok2", "processed_message_ids": []}
+
+
+def test_page_checkpoint_keeps_the_last_page_of_the_listing():
+    checkpoint = PageCheckpoint("tok1", ["b"])
+
+    assert checkpoint.page_listed(0, None, ["a", "b"]) == ["a"]
+    checkpoint.message_processed("a")
+
+    assert checkpoint.get_state() == {"page_token": "tok1", "processed_message_ids": ["a", "b"]}
@@ -0,0 +1,83 @@
+"""
+measures compaction against the labeled emails in sample_compaction_emails.yaml:
+the text sent to the LLM has to shrink while still naming the company and the
+job, and the rule based preclassifier has to come to the same result.
+"""
+
+import pytest
+
+from tests.email_corpus import load_sample_emails, text_after, text_before
+from utils.compaction_utils import (
+    CHARS_PER_TOKEN,
+    compact_email_text,
+    split_sentences,
+    strip_quoted_reply,
+    strip_signature,
+)
+from utils.preclassifier_utils import preclassify_email
+
+SAMPLE_EMAILS = load_sample_emails()
+
+
+@pytest.mark.parametrize("sample", SAMPLE_EMAILS, ids=lambda x: x["subject"])
+def test_compacted_text_names_company_and_job(sample):
+    text = text_after(sample)
+
+    assert text.startswith(sample["subject"])
+    assert sample["label"]["company_name"] in text
+    assert sample["label"]["job_title"] in text
+
+
+def test_compaction_shrinks_prompts_and_keeps_preclassifier_results():
+    before = [text_before(sample) for sample in SAMPLE_EMAILS]
+    after = [text_after(sample) for sample in SAMPLE_EMAILS]
+
+    reduction = 1 - sum(len(x) for x in after) / sum(len(x) for x in before)
+    assert reduction > 0.5
+
+    for sample, text, compacted in zip(SAMPLE_EMAILS, before, after):
+        email_data = {"from": sample["from"], "subject": sample["subject"], "raw_text_content": sample["text"]}
+        assert preclassify_email({**email_data, "text_content": compacted}) == preclassify_email(
+            {**email_data, "text_content": text}
+        )
+
+
+def test_strip_quoted_reply():
+    text = "Tuesday works.\n\nOn Mon, Feb 10, 2025 at 9:14 AM Jane Doe\n<jane@example.com> wrote:\n> Hi Sam"
+    assert strip_quoted_reply(text).strip() == "Tuesday works."
+    assert strip_quoted_reply("See below.\n> quoted line\nThanks") == "See below.\nThanks"
+    assert strip_quoted_reply("Tuesday works. On Mon, Feb 10 Jane wrote: Hi Sam") == "Tuesday works. "
+
+
+def test_strip_signature():
+    assert strip_signature("Thanks,\nSam\n--\nSam Lee | Recruiter") == "Thanks,\nSam\n"
+    assert strip_signature("Good luck!\n\nSent from my iPhone") == "Good luck!\n\n"
+    assert strip_signature("No signature here.") == "No signature here."
+
+
+def test_split_sentences_joins_wrapped_lines():
+    assert split_sentences("Thanks for applying\nto Acme. We will\nbe in touch.\n\nBest,\nAcme") == [
+        (0, "Thanks for applying to Acme."),
+        (0, "We will be in touch."),
+        (1, "Best, Acme"),
+    ]
+
+
+def test_compact_email_text_merges_plain_text_and_html_versions():
+    plain = "Hi Jane,\n\nThanks for applying to Acme.\nWe will be in touch."
+    html_text = "Hi Jane, Thanks for applying to Acme. We will be in touch. Manage your email preferences."
+
+    assert compact_email_text("Acme", [plain, html_text], 1000) == (
+        "Acme\nHi Jane,\nThanks for applying to Acme. We will be in touch."
+    )
+
+
+def test_compact_email_text_keeps_status_sentences_within_the_budget():
+    filler = " ".join(f"Paragraph {i} of our culture deck." for i in range(200))
+    body = f"Hello Jane,\n\n{filler}\n\nUnfortunately, we will not move forward with your application."
+
+    text = compact_email_text("Update from Acme", [body], max_tokens=50)
+
+    assert len(text) <= 50 * CHARS_PER_TOKEN
+    assert text.startswith("Update from Acme\nHello Jane,")
+    assert text.endswith("Unfortunately, we will not move forward with your application.")
@@ -0,0 +1,153 @@
+import random
+from datetime import datetime, timedelta
+from typing import List
+from unittest import mock
+
+import pytest
+
+from db.user_email_summaries import UserEmailApplications, UserEmailSummaries
+from db.user_emails import UserEmails
+from db.utils import email_summary_utils
+from db.utils.email_summary_utils import (
+    check_user_email_summary,
+    count_interview_requests,
+    count_statuses,
+    get_response_counts_by_job_title,
+    get_user_email_summary,
+)
+from db.utils.user_email_utils import delete_user_email, get_user_emails, upsert_user_emails
+from tests.test_user_email_utils import make_user_email
+
+
+def response_counts_in_python(user_emails: List[UserEmails]) -> list:
+    """How routes/users_routes.response_rate_by_job_title counted before, on the emails newest first."""
+    index = 0
+    job_titles = {}
+    companies = []
+    response_rate_data = []
+    for email in user_emails:
+        if email.job_title not in job_titles:
+            status = email.application_status.strip().lower()
+            if status == "request for availability" or status == "offer" or status == "interview scheduled":
+                response_rate_data.append({"title": email.job_title, "responses": 1, "total": 1})
+            else:
+                response_rate_data.append({"title": email.job_title, "responses": 0, "total": 1})
+            companies.append((email.company_name, email.job_title))
+            job_titles[email.job_title] = index
+            index += 1
+        elif (email.company_name, email.job_title) not in companies:
+            status = email.application_status.strip().lower()
+            if status == "request for availability" or status == "offer" or status == "interview scheduled":
+                response_rate_data[job_titles[email.job_title]]["responses"] += 1
+            response_rate_data[job_titles[email.job_title]]["total"] += 1
+            companies.append((email.company_name, email.job_title))
+    return [(data["title"], data["responses"], data["total"]) for data in response_rate_data]
+
+
+def interview_requests_in_python(user_emails: List[UserEmails]) -> tuple:
+    """How routes/users_routes.calculate_response_rate counted before."""
+    interview_requests = 0
+    for email in user_emails:
+        if email.application_status and email.application_status.lower() == "request for availability":
+            interview_requests += 1
+    return len(user_emails), interview_requests
+
+
+def make_random_user_emails(rng: random.Random, user_id: str, count: int) -> List[UserEmails]:
+    """Few companies, titles and days, so pairs repeat and dates tie; statuses vary in case and spacing."""
+    statuses = [
+        "request for availability", "Request for Availability", " offer\n", "OFFER",
+        "interview scheduled", "interview scheduled\t", "rejected", "no response", "unknown", "",
+        "request for availability please",
+    ]
+    records = []
+    for _ in range(count):
+        record = make_user_email(f"id{rng.randint(0, 80)}", user_id)
+        record.company_name = rng.choice(["Acme", "acme", "Globex", "Initech", "unknown"])
+        record.job_title = rng.choice(["Software Engineer", "software engineer", "Data Analyst", "unknown"])
+        record.application_status = rng.choice(statuses)
+        record.received_at = datetime(2025, 1, 1) + timedelta(days=rng.randint(0, 5))
+        records.append(record)
+    return records
+
+
+def assert_summary_matches_emails(db_session, user_id: str) -> None:
+    user_emails = get_user_emails(db_session, user_id)
+    summary = get_user_email_summary(db_session, user_id)
+    assert get_response_counts_by_job_title(summary) == response_counts_in_python(user_emails)
+    assert count_interview_requests(summary) == interview_requests_in_python(user_emails)
+    assert check_user_email_summary(db_session, user_id) == []
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_summary_kept_up_to_date_matches_the_python_counts(db_session, seed):
+    rng = random.Random(seed)
+    for _ in range(4):
+        for user_id in ("123", "456"):
+            records = make_random_user_emails(rng, user_id, rng.randint(0, 30))
+            upsert_user_emails(db_session, records, update_existing=rng.random() < 0.3, chunk_size=7)
+            stored = get_user_emails(db_session, user_id)
+            for record in rng.sample(stored, rng.randint(0, min(len(stored), 5))):
+                delete_user_email(db_session, record)
+            db_session.commit()
+            assert_summary_matches_emails(db_session, user_id)
+
+
+def test_summary_is_built_for_emails_stored_before_it(db_session):
+    db_session.add_all(make_user_email(f"id{i}", "123") for i in range(3))
+    db_session.commit()
+
+    summary = get_user_email_summary(db_session, "123")
+
+    assert summary.email_count == 3
+    assert count_statuses(summary) == {"no response": 3}
+    assert (summary.first_received_at, summary.last_received_at) == (datetime(2025, 2, 13), datetime(2025, 2, 13))
+    assert get_user_email_summary(db_session, "456").email_count == 0
+
+
+def test_check_user_email_summary_finds_and_fixes_differences(db_session):
+    upsert_user_emails(db_session, [make_user_email(f"id{i}", "123") for i in range(3)])
+    db_session.commit()
+    summary = db_session.get(UserEmailSummaries, "123")
+    summary.email_count = 7
+    summary.status_counts = {"offer": 1}
+    db_session.commit()
+
+    differences = check_user_email_summary(db_session, "123", fix=True)
+    db_session.commit()
+
+    assert [difference.split(" ")[1] for difference in differences] == ["email_count", "status_counts"]
+    assert check_user_email_summary(db_session, "123") == []
+    assert db_session.get(UserEmailSummaries, "123").email_count == 3
+
+
+def test_storing_emails_reads_only_the_newest_email_of_their_applications(db_session):
+    upsert_user_emails(db_session, make_random_user_emails(random.Random(0), "123", 30))
+    db_session.commit()
+
+    records = make_random_user_emails(random.Random(1), "123", 30)
+    for record in records:
+        record.id = f"new-{record.id}"
+    with mock.patch.object(
+        email_summary_utils, "select_newest_emails", wraps=email_summary_utils.select_newest_emails
+    ) as select_newest_emails:
+        upsert_user_emails(db_session, records, chunk_size=7)
+        db_session.commit()
+
+    # the user's emails are not read again, only the stored newest ones
+    select_newest_emails.assert_not_called()
+    assert_summary_matches_emails(db_session, "123")
+
+
+def test_check_user_email_summary_finds_a_wrong_newest_email(db_session):
+    upsert_user_emails(db_session, [make_user_email(f"id{i}", "123") for i in range(3)])
+    db_session.commit()
+    application = db_session.query(UserEmailApplications).one()
+    application.last_id = "id0"
+    db_session.commit()
+
+    differences = check_user_email_summary(db_session, "123", fix=True)
+    db_session.commit()
+
+    assert len(differences) == 1 and "applications" in differences[0]
+    assert check_user_email_summary(db_session, "123") == []
@@ -1,6 +1,16 @@
+import base64
+import os
+from email.mime.application import MIMEApplication
+from email.mime.message import MIMEMessage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
 from unittest import mock
 import pytest
+from googleapiclient.errors import HttpError
 
+from tests.email_corpus import beautifulsoup_to_text, make_corpus, to_full_format
+from utils.compaction_utils import CHARS_PER_TOKEN
+from tests.fake_gmail import FakeGmailService, make_raw_message
 from tests.test_constants import SAMPLE_MESSAGE, SUBJECT_LINE
 import utils.email_utils as email_utils
 import db.utils.user_email_utils as user_email_utils
@@ -156,9 +166,239 @@ def message_data_with_list_values():
     }
 
 
-@mock.patch('db.utils.user_email_utils.check_email_exists')
-def test_create_user_email_with_list_values(mock_check_email, mock_user, message_data_with_list_values, caplog):
+def test_create_user_email_with_list_values(mock_user, message_data_with_list_values, caplog):
     """Test that create_user_email handles message_data_with_list_values correctly"""
-    mock_check_email.return_value = False
     result = user_email_utils.create_user_email(mock_user, message_data_with_list_values)
     assert result is not None  # user email created successfully
+
+
+def test_get_emails_batched_parses_messages_in_batches():
+    service = FakeGmailService(
+        {f"id{i}": make_raw_message(f"Application {i} received") for i in range(7)}
+    )
+
+    emails = list(
+        email_utils.get_emails_batched(
+            [f"id{i}" for i in range(7)], gmail_instance=service, batch_size=3
+        )
+    )
+
+    assert [x["id"] for x in emails] == [f"id{i}" for i in range(7)]
+    assert emails[0]["subject"] == "Application 0 received"
+    assert emails[0]["text_content"] == "Application 0 received\nThank you for applying."
+    assert service.batch_sizes == [3, 3, 1]
+
+
+def test_get_emails_batched_isolates_and_retries_failed_messages():
+    service = FakeGmailService(
+        {f"id{i}": make_raw_message(f"Application {i} received") for i in range(4)},
+        failures={"id1": [429], "id2": [503, 500]},
+    )
+
+    emails = list(
+        email_utils.get_emails_batched(
+            ["id0", "id1", "id2", "id3", "missing"],
+            gmail_instance=service,
+            retry_delay=0,
+        )
+    )
+
+    assert sorted(x["id"] for x in emails) == ["id0", "id1", "id2", "id3"]
+    # only the failed sub-requests are sent again
+    assert service.batch_sizes == [5, 2, 1]
+    assert service.get_calls["id0"] == 1
+    assert service.get_calls["id2"] == 3
+    # a 404 is not retried
+    assert service.get_calls["missing"] == 1
+
+
+def test_get_emails_batched_gives_up_after_max_retries():
+    service = FakeGmailService(
+        {"id0": make_raw_message("Application received")},
+        failures={"id0": [429] * 10},
+    )
+
+    emails = list(
+        email_utils.get_emails_batched(
+            ["id0"], gmail_instance=service, max_retries=2, retry_delay=0
+        )
+    )
+
+    assert emails == []
+    assert service.get_calls["id0"] == 3
+
+
+def test_get_added_message_ids_reads_every_history_page():
+    service = FakeGmailService(
+        {f"id{i}": make_raw_message(f"Application {i} received") for i in range(3)},
+        page_size=2,
+    )
+    for i in range(3, 8):
+        service.add_message(f"id{i}", make_raw_message(f"Application {i} received"))
+
+    added_ids, history_id = email_utils.get_added_message_ids("3", gmail_instance=service)
+
+    assert added_ids == [f"id{i}" for i in range(3, 8)]
+    assert history_id == "8"
+    assert service.history_list_calls == 3
+
+
+def test_get_added_message_ids_returns_none_for_an_expired_history_id():
+    service = FakeGmailService({"id0": make_raw_message("Application received")})
+    service.add_message("id1", make_raw_message("Application received"))
+    service.expire_history()
+
+    assert email_utils.get_added_message_ids("1", gmail_instance=service) is None
+    assert email_utils.get_history_id(service) == "2"
+
+
+def test_get_email_id_pages_sharded_lists_queries_at_the_same_time():
+    subjects = ["Application received", "Interview invitation", "Application: interview", "Newsletter"]
+    service = FakeGmailService(
+        {f"id{i}": make_raw_message(subject) for i, subject in enumerate(subjects * 5)},
+        page_size=3,
+        search=True,
+        list_latency=0.02,
+    )
+    queries = ['subject:"application"', 'subject:"interview"', 'subject:"invitation"']
+    timings = []
+
+    pages = list(email_utils.get_email_id_pages_sharded(queries, lambda: service, 3, timings))
+
+    listed = [message["id"] for page in pages for message in page]
+    assert sorted(listed) == sorted(f"id{i}" for i in range(20) if i % 4 != 3)
+    assert len(listed) == len(set(listed))
+    assert service.max_active_lists == 3
+    assert sorted(timing["shard"] for timing in timings) == [0, 1, 2]
+    assert sum(timing["messages"] for timing in timings) == 10 + 10 + 5
+
+
+def test_get_email_id_pages_sharded_reraises_listing_errors():
+    service = FakeGmailService({"id0": make_raw_message("Application received")}, failing_page=0)
+
+    with pytest.raises(HttpError):
+        list(email_utils.get_email_id_pages_sharded(["q1", "q2"], lambda: service, 2))
+
+
+def test_get_emails_batched_downloads_every_message_once_and_counts_failures():
+    service = FakeGmailService(
+        {f"id{i}": make_raw_message(f"Application {i} received") for i in range(4)},
+        failures={"id1": [404], "id2": [500] * 4},
+    )
+    stats = {}
+    failed = []
+
+    emails = list(
+        email_utils.get_emails_batched(
+            [f"id{i}" for i in range(4)],
+            gmail_instance=service,
+            retry_delay=0,
+            stats=stats,
+            on_failure=failed.append,
+        )
+    )
+
+    assert [x["id"] for x in emails] == ["id0", "id3"]
+    assert service.formats["id0"] == service.formats["id3"] == ["full"]
+    assert stats["failed"] == 2
+    assert sorted(failed) == ["id1", "id2"]
+    assert stats["bytes_downloaded"] > 0
+
+
+def test_get_emails_batched_does_not_download_attachments():
+    mime_msg = MIMEMultipart("mixed")
+    mime_msg.attach(MIMEText("Thank you for applying to Acme.", "plain"))
+    resume = MIMEApplication(os.urandom(200_000), "pdf")
+    resume.add_header("Content-Disposition", "attachment", filename="resume.pdf")
+    mime_msg.attach(resume)
+    mime_msg["From"] = "no-reply@acme.com"
+    mime_msg["To"] = "appuser@gmail.com"
+    mime_msg["Subject"] = "Application received"
+    mime_msg["Date"] = "Thu, 13 Feb 2025 21:30:24 +0000"
+    raw = base64.urlsafe_b64encode(mime_msg.as_bytes()).decode("ASCII")
+    service = FakeGmailService({"id0": raw})
+    stats = {}
+
+    with mock.patch.object(email_utils, "increment") as increment:
+        emails = list(
+            email_utils.get_emails_batched(["id0"], gmail_instance=service, stats=stats)
+        )
+
+    assert emails[0]["raw_text_content"] == "Thank you for applying to Acme."
+    assert emails[0]["subject"] == "Application received"
+    assert stats["bytes_downloaded"] < 5_000 < len(raw)
+    downloaded = sum(c.args[1] for c in increment.call_args_list if c.args[0] == "gmail.bytes_downloaded")
+    assert downloaded == stats["bytes_downloaded"]
+
+
+def html_bodies():
+    messages = [to_full_format(name, raw) for name, raw in make_corpus().items()]
+    return [
+        email_utils.decode_part_body(part)
+        for message in messages
+        for part in email_utils.walk_payload(message["payload"])
+        if part["mimeType"] == "text/html" and not email_utils.is_attachment(part)
+    ]
+
+
+@pytest.mark.parametrize("converter", list(email_utils.HTML_TO_TEXT_CONVERTERS))
+def test_html_to_text_converters_match_beautifulsoup(converter):
+    convert = email_utils.HTML_TO_TEXT_CONVERTERS[converter]
+    for html in html_bodies():
+        assert convert(html) == beautifulsoup_to_text(html)
+
+
+@pytest.mark.parametrize("converter", list(email_utils.HTML_TO_TEXT_CONVERTERS))
+def test_html_to_text_converters_stop_soon_after_max_chars(converter):
+    convert = email_utils.HTML_TO_TEXT_CONVERTERS[converter]
+    html = "<table>" + "".join(f"<tr><td>Job {i}</td></tr>" for i in range(20000)) + "</table>"
+
+    text = convert(html, max_chars=1000)
+
+    assert 1000 < len(text) < 1000 + email_utils.HTML_FEED_CHARS
+    assert convert(html).startswith(text)
+
+
+def test_get_email_content_keeps_to_the_character_budget():
+    email_data = {
+        "subject": "Your application",
+        "text_content": "Thanks for applying.",
+        "html_content": "<p>" + "word " * 10000 + "</p>",
+    }
+
+    text = email_utils.get_email_content(email_data, max_chars=100)
+
+    assert text == email_utils.get_email_content(email_data, max_chars=10**6)[:100]
+    assert text.startswith("Your application\nThanks for applying.\nword word")
+    # by default the text is compacted to a token budget, well below the character cap
+    assert len(email_utils.get_email_content(email_data)) == (
+        email_utils.settings.EMAIL_MAX_TOKENS * CHARS_PER_TOKEN
+    )
+
+
+def test_parse_email_message_reads_the_first_text_parts_only():
+    forwarded = MIMEMultipart("mixed")
+    forwarded.attach(MIMEText("See the invite below.", "plain"))
+    invite = MIMEMultipart("alternative")
+    invite.attach(MIMEText("Interview with Hooli on Monday.", "plain"))
+    invite.attach(MIMEText("<p>Interview with Hooli on Monday.</p>", "html"))
+    invite["Subject"] = "Interview invitation"
+    forwarded.attach(MIMEMessage(invite))
+    forwarded.attach(MIMEText("BEGIN:VCALENDAR\nEND:VCALENDAR", "calendar"))
+    forwarded["From"] = "friend@example.com"
+    forwarded["To"] = "appuser@gmail.com"
+    forwarded["Subject"] = "Fwd: Interview invitation"
+    raw = base64.urlsafe_b64encode(forwarded.as_bytes()).decode("ASCII")
+
+    email_data = email_utils.parse_email_message("id0", to_full_format("id0", raw))
+
+    assert email_data["raw_text_content"] == "See the invite below."
+    assert email_data["html_content"] == "<p>Interview with Hooli on Monday.</p>"
+
+
+def test_parse_email_message_keeps_corpus_emails_within_the_budget():
+    for name, raw in make_corpus().items():
+        email_data = email_utils.parse_email_message(name, to_full_format(name, raw))
+        assert email_data["subject"]
+        assert 0 < len(email_data["text_content"]) <= email_utils.settings.EMAIL_MAX_CHARS
+        assert "%PDF" not in email_data["text_content"]
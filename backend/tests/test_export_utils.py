@@ -0,0 +1,59 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+
+import pyarrow.parquet
+import pytest
+
+from utils.export_utils import EXPORT_FIELDS, encode_csv, encode_gzipped, encode_ndjson, encode_parquet
+
+ROWS = [
+    ("Acme", "offer", datetime(2025, 2, 13, 9, 30), "Software Engineer", 'Re: "offer", finally', "hr@acme.com"),
+    ("Globex", "rejected", datetime(2025, 2, 12), "Data Analyst", "Your application\nupdate", "no-reply@globex.com"),
+    ("Initech", "no response", datetime(2025, 2, 11), "unknown", "Thanks", "jobs@initech.com"),
+]
+BATCHES = [ROWS[:2], ROWS[2:]]
+
+
+def test_encode_csv_yields_a_chunk_per_batch():
+    chunks = list(encode_csv(BATCHES))
+
+    assert len(chunks) == 2
+    rows = list(csv.reader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+    assert rows[0] == list(EXPORT_FIELDS.values())
+    assert rows[1:] == [[str(value) for value in row] for row in ROWS]
+
+
+def test_encode_csv_without_rows_is_the_header():
+    assert b"".join(encode_csv([])).decode("utf-8").strip() == ",".join(EXPORT_FIELDS.values())
+
+
+def test_encode_ndjson_writes_an_object_per_line():
+    lines = b"".join(encode_ndjson(BATCHES)).decode("utf-8").splitlines()
+
+    assert [json.loads(line) for line in lines][0] == {
+        "company_name": "Acme",
+        "application_status": "offer",
+        "received_at": "2025-02-13T09:30:00",
+        "job_title": "Software Engineer",
+        "subject": 'Re: "offer", finally',
+        "email_from": "hr@acme.com",
+    }
+    assert len(lines) == 3
+
+
+@pytest.mark.parametrize("encode", [encode_csv, encode_ndjson])
+def test_encode_gzipped_is_one_gzip_file(encode):
+    compressed = b"".join(encode_gzipped(encode)(BATCHES))
+
+    assert gzip.decompress(compressed) == b"".join(encode(BATCHES))
+
+
+def test_encode_parquet_writes_a_row_group_per_batch():
+    data = b"".join(encode_parquet(BATCHES))
+
+    parquet_file = pyarrow.parquet.ParquetFile(io.BytesIO(data))
+    assert parquet_file.metadata.num_row_groups == 2
+    assert parquet_file.read().to_pylist() == [dict(zip(EXPORT_FIELDS, row)) for row in ROWS]
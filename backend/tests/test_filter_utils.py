@@ -1,15 +1,38 @@
 """
-test that the strings produced by filter utils match expectations
-
-tests for override filters have not yet been implemented.
+test that the strings produced by filter utils match expectations, and that
+compiled filters are cached and reloaded when the YAML changes
 """
 
+import email.utils
+import os
+import random
+import shutil
+from datetime import datetime, timedelta
 from typing import List, Dict, Union
+from unittest import mock
+
+import pytest
+import yaml
+from googleapiclient.errors import HttpError
 
+from constants import APPLIED_FILTER_OVERRIDES_PATH, APPLIED_FILTER_PATH
+from start_date.storage import (
+    get_date_windows,
+    get_default_start_date,
+    get_start_date_email_filter,
+    get_start_date_email_filter_shards,
+)
+from utils import filter_utils
 from utils.filter_utils import (
+    EXCLUDED_MESSAGES_QUERY,
+    compile_filter,
+    load_filter_config,
     parse_base_filter_config,
-)  # , parse_override_filter_config
+    parse_override_filter_config,
+)
+from tests.fake_gmail import FakeGmailService, make_raw_message
 from tests.test_constants import SAMPLE_FILTER_PATH, EXPECTED_SAMPLE_QUERY_STRING
+from utils.email_utils import get_email_id_pages, get_email_id_pages_sharded
 
 FilterConfigType = List[Dict[str, Union[str, int, bool, list, dict]]]
 
@@ -27,3 +50,148 @@ def test_parse_filter_config_against_sample_filter(
     assert result_str == expected_query_string, (
         "result query string doesn't match expected query string"
     )
+
+
+def test_parse_override_filter_config():
+    assert parse_override_filter_config(APPLIED_FILTER_OVERRIDES_PATH) == (
+        '(("position" AND from:"no-reply@comet.zillow.com"))'
+    )
+
+
+@pytest.fixture
+def filter_path(tmp_path):
+    path = tmp_path / "filter.yaml"
+    shutil.copy(SAMPLE_FILTER_PATH, path)
+    return path
+
+
+def rewrite(path, blocks):
+    """Writes new blocks and moves the mtime on, as a later edit would."""
+    stat = os.stat(path)
+    with open(path, "w") as fid:
+        yaml.safe_dump(blocks, fid)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def test_compile_filter_parses_the_yaml_once(filter_path):
+    with mock.patch.object(filter_utils.yaml, "safe_load", wraps=yaml.safe_load) as safe_load:
+        compiled = compile_filter(filter_path)
+        for _ in range(5):
+            assert compile_filter(filter_path) is compiled
+            compiled.query("2025/01/01", 1700000000)
+
+    assert safe_load.call_count == 1
+    assert compiled.base_query == parse_base_filter_config(SAMPLE_FILTER_PATH)
+    assert compiled.query("2025/01/01", 1700000000) == (
+        f"after:2025/01/01 AND ({compiled.base_query}) AND {EXCLUDED_MESSAGES_QUERY} after:1700000000"
+    )
+
+
+def test_compile_filter_reloads_a_changed_yaml(filter_path):
+    compiled = compile_filter(filter_path)
+    old_query = compiled.query("2025/01/01")
+
+    rewrite(filter_path, [{"logic": "any", "field": "subject", "how": "include", "terms": ["offer letter"]}])
+
+    reloaded = compile_filter(filter_path)
+    assert reloaded is not compiled
+    assert reloaded.query("2025/01/01") == (
+        f'after:2025/01/01 AND ((subject:"offer letter")) AND {EXCLUDED_MESSAGES_QUERY}'
+    )
+    assert compiled.query("2025/01/01") == old_query
+
+
+def test_compile_filter_keeps_serving_when_an_edit_is_invalid(filter_path):
+    compiled = compile_filter(filter_path)
+
+    rewrite(filter_path, [{"logic": "any", "field": "subject", "how": "exclude", "terms": ["offer"]}])
+
+    assert compile_filter(filter_path) is compiled
+
+
+@pytest.mark.parametrize(
+    "blocks",
+    [
+        [],
+        [{"logic": "any", "field": "subject", "how": "exclude", "terms": ["offer"]}],
+        [{"logic": "all", "field": "from", "how": "exclude", "terms": ["* jobs"]}],
+        [{"logic": "any", "field": "title", "how": "include", "terms": ["offer"]}],
+        [{"logic": "any", "field": "subject", "how": "include", "terms": "offer"}],
+    ],
+)
+def test_compile_filter_rejects_invalid_configs(filter_path, blocks):
+    rewrite(filter_path, blocks)
+
+    with pytest.raises(ValueError):
+        compile_filter(filter_path)
+
+
+def test_compile_filter_merges_overrides(filter_path):
+    compiled = compile_filter(filter_path, APPLIED_FILTER_OVERRIDES_PATH)
+
+    assert compiled.override_query == parse_override_filter_config(APPLIED_FILTER_OVERRIDES_PATH)
+    assert compiled.query("2025/01/01") == (
+        f"after:2025/01/01 AND ({compiled.base_query} OR {compiled.override_query}) AND {EXCLUDED_MESSAGES_QUERY}"
+    )
+    assert compile_filter(filter_path).override_query is None
+
+
+def test_get_start_date_email_filter():
+    base_query = parse_base_filter_config(APPLIED_FILTER_PATH)
+
+    assert get_start_date_email_filter("2025/01/01") == (
+        f"after:2025/01/01 AND ({base_query}) AND {EXCLUDED_MESSAGES_QUERY}"
+    )
+    assert get_start_date_email_filter(None, 1700000000) == (
+        f"after:{get_default_start_date()} AND ({base_query}) AND {EXCLUDED_MESSAGES_QUERY} after:1700000000"
+    )
+
+
+def make_backfill_mailbox(start: datetime, count: int, seed: int = 0) -> Dict[str, str]:
+    """
+    Messages spread between start and now, with subjects from the applied
+    email filter's include and exclude terms and some matching neither.
+    """
+    rng = random.Random(seed)
+    terms = [term for block in load_filter_config(APPLIED_FILTER_PATH) for term in block["terms"]]
+    now = datetime.now()
+    messages = {}
+    for i in range(count):
+        subject = rng.choice(terms + ["Weekly newsletter", "Lunch on Friday?"]).replace(" * ", " Acme ")
+        sent = start + (now - start) * rng.random()
+        messages[f"id{i}"] = make_raw_message(
+            subject.capitalize(), sender="someone@example.com", date=email.utils.format_datetime(sent)
+        )
+    return messages
+
+
+def test_get_date_windows():
+    start, end = datetime(2023, 1, 1), datetime(2023, 12, 31)
+
+    windows = get_date_windows(start, end, 90)
+
+    assert len(windows) == 5
+    assert windows[0] == (int((end - timedelta(days=90)).timestamp()), None)
+    assert windows[-1][0] == int(start.timestamp())
+    for newer, older in zip(windows, windows[1:]):
+        assert older[1] == newer[0] + 1
+    assert get_date_windows(start, start + timedelta(days=1), 90) == [(int(start.timestamp()), None)]
+
+
+def test_query_shards_match_the_same_emails_within_the_query_length_limit():
+    start_date = (datetime.now() - timedelta(days=3 * 365)).strftime("%Y/%m/%d")
+    messages = make_backfill_mailbox(datetime.now() - timedelta(days=3 * 365 - 1), 300)
+    query = get_start_date_email_filter(start_date)
+    expected = [m["id"] for page, _ in get_email_id_pages(query, FakeGmailService(messages, search=True)) for m in page]
+    assert 50 < len(expected) < 300
+
+    service = FakeGmailService(messages, search=True, max_query_length=1500)
+    with pytest.raises(HttpError):
+        list(get_email_id_pages(query, service))
+    windows = get_date_windows(datetime.strptime(start_date, "%Y/%m/%d"), datetime.now(), 90)
+    shards = get_start_date_email_filter_shards(start_date, windows, max_length=1500)
+    listed = [m["id"] for page in get_email_id_pages_sharded(shards, lambda: service, 4) for m in page]
+
+    assert all(len(shard) <= 1500 for shard in shards)
+    assert len(shards) > 13  # several shards for each of the 13 date windows
+    assert sorted(listed) == sorted(expected)
@@ -0,0 +1,130 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.orm import Session
+
+from db.ingestion_jobs import FAILED, FINISHED, QUEUED, IngestionJobs, utc_now
+from db.users import Users
+from db.utils import job_queue_utils
+from db.utils.job_queue_utils import (
+    claim_job,
+    complete_job,
+    enqueue_ingestion_job,
+    extend_job_lock,
+    fail_job,
+)
+
+
+@pytest.fixture
+def users(db_session):
+    for user_id in ("123", "456"):
+        db_session.add(Users(user_id=user_id, user_email=f"user{user_id}@example.com", start_date=datetime(2000, 1, 1)))
+    db_session.commit()
+
+
+def test_enqueue_keeps_one_queued_job_per_user(db_session, users):
+    first = enqueue_ingestion_job(db_session, "123", {"creds": "old"})
+    again = enqueue_ingestion_job(db_session, "123", {"creds": "new"})
+    other = enqueue_ingestion_job(db_session, "456", {"creds": "other"})
+    db_session.commit()
+
+    assert first == again != other
+    assert db_session.get(IngestionJobs, first).payload == {"creds": "new"}
+
+    # once the job runs, a new request queues a second job for the user
+    assert claim_job(db_session, "worker-1").id == first
+    assert enqueue_ingestion_job(db_session, "123", {"creds": "newer"}) != first
+
+
+def test_concurrent_workers_claim_each_job_once(db_session, engine, users):
+    job_ids = {enqueue_ingestion_job(db_session, user_id, {}) for user_id in ("123", "456")}
+    db_session.commit()
+
+    claimed = []
+    barrier = threading.Barrier(4)
+
+    def claim(worker_id):
+        with Session(engine) as session:
+            barrier.wait()
+            job = claim_job(session, worker_id)
+            if job is not None:
+                claimed.append(job.id)
+
+    workers = [threading.Thread(target=claim, args=(f"worker-{i}",)) for i in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert sorted(claimed) == sorted(job_ids)
+
+
+def test_a_users_queued_job_waits_for_their_running_job(db_session, users):
+    running_id = enqueue_ingestion_job(db_session, "123", {})
+    db_session.commit()
+    assert claim_job(db_session, "worker-1").id == running_id
+    enqueue_ingestion_job(db_session, "123", {})
+    db_session.commit()
+
+    assert claim_job(db_session, "worker-2") is None
+
+
+def test_job_with_expired_lock_is_reclaimed(db_session, users):
+    job_id = enqueue_ingestion_job(db_session, "123", {})
+    db_session.commit()
+    job = claim_job(db_session, "worker-1", visibility_timeout=60)
+
+    assert extend_job_lock(db_session, job_id, "worker-1", visibility_timeout=60)
+    assert claim_job(db_session, "worker-2") is None
+
+    job.locked_until = utc_now() - timedelta(seconds=1)
+    db_session.commit()
+    reclaimed = claim_job(db_session, "worker-2")
+
+    assert reclaimed.id == job_id
+    assert reclaimed.attempts == 2
+    assert reclaimed.locked_by == "worker-2"
+    # the first worker finds out it lost the job
+    assert not extend_job_lock(db_session, job_id, "worker-1")
+
+
+def test_failed_job_is_retried_with_backoff_until_out_of_attempts(db_session, users, monkeypatch):
+    monkeypatch.setattr(job_queue_utils, "JOB_RETRY_BASE_SECONDS", 10)
+    job_id = enqueue_ingestion_job(db_session, "123", {"creds": "secret"})
+    db_session.commit()
+
+    job = claim_job(db_session, "worker-1")
+    fail_job(db_session, job, "Gmail is down")
+    assert job.status == QUEUED
+    assert job.last_error == "Gmail is down"
+    assert job.run_after > utc_now() + timedelta(seconds=8)
+    assert claim_job(db_session, "worker-1") is None
+
+    job.max_attempts = 2
+    job.run_after = utc_now()
+    db_session.commit()
+    job = claim_job(db_session, "worker-1")
+    assert job.attempts == 2
+    fail_job(db_session, job, "Gmail is still down")
+
+    assert job.status == FAILED
+    assert job.payload is None
+    assert claim_job(db_session, "worker-1") is None
+    assert db_session.get(IngestionJobs, job_id).status == FAILED
+
+
+def test_retry_delay_doubles_up_to_the_maximum():
+    delays = [job_queue_utils.get_retry_delay(attempts) for attempts in range(1, 9)]
+    assert delays == [60, 120, 240, 480, 960, 1920, 3600, 3600]
+
+
+def test_complete_job_drops_the_credentials(db_session, users):
+    enqueue_ingestion_job(db_session, "123", {"creds": "secret"})
+    db_session.commit()
+    job = claim_job(db_session, "worker-1")
+
+    complete_job(db_session, job)
+
+    assert job.status == FINISHED
+    assert job.payload is None
@@ -0,0 +1,68 @@
+import pytest
+
+import utils.llm_utils as llm_utils
+from db.llm_extraction_cache import LlmExtractionCache
+from db.utils.llm_cache_utils import ExtractionCache, get_content_hash
+from tests.fake_llm import ACME_RESULT, FakeGenerativeModel
+from utils import metrics_utils
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    model = FakeGenerativeModel()
+    monkeypatch.setattr(llm_utils, "model", model)
+    monkeypatch.setattr(llm_utils, "rate_limiter", llm_utils.RateLimiter(60000, burst=100))
+    return model
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics_utils.reset_metrics()
+
+
+def test_content_hash_ignores_whitespace_and_includes_prompt_version(monkeypatch):
+    assert get_content_hash("Thanks for applying\n\n to  Acme") == get_content_hash(
+        "Thanks for applying to Acme"
+    )
+    before = get_content_hash("Thanks for applying to Acme")
+    monkeypatch.setattr("db.utils.llm_cache_utils.PROMPT_VERSION", "999")
+    assert get_content_hash("Thanks for applying to Acme") != before
+
+
+def test_extraction_cache_reads_through_memory_then_database(db_session):
+    cache = ExtractionCache()
+    cache.put_many(
+        {"Thanks for applying to Acme": ACME_RESULT, "failed": None, "a string": "unknown", "a list": [1, 2]}
+    )
+
+    assert db_session.query(LlmExtractionCache).count() == 1
+    assert cache.get_many(["Thanks for applying to Acme", "unseen"]) == {
+        "Thanks for applying to Acme": ACME_RESULT
+    }
+
+    cache.clear_memory()
+    assert cache.get_many(["Thanks  for applying\nto Acme"]) == {
+        "Thanks  for applying\nto Acme": ACME_RESULT
+    }
+    assert cache.get_many(["Thanks for applying to Acme"])
+
+    assert metrics_utils.get_metrics() == {
+        "llm_cache.memory_hits": 2,
+        "llm_cache.db_hits": 1,
+        "llm_cache.misses": 1,
+    }
+
+
+def test_classify_emails_only_sends_unseen_content_to_model(db_session, fake_model):
+    cache = ExtractionCache()
+    emails = [
+        {"id": f"id{i}", "text_content": f"Application {i % 3} received"} for i in range(6)
+    ]
+
+    first_run = list(llm_utils.classify_emails(emails[:3], cache=cache))
+    calls_after_first_run = fake_model.calls
+    second_run = list(llm_utils.classify_emails(emails, cache=cache))
+
+    assert all(result == ACME_RESULT for _, result in first_run + second_run)
+    assert fake_model.calls == calls_after_first_run
+    assert metrics_utils.get_metrics()["llm_cache.memory_hits"] == 3
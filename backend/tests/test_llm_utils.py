@@ -0,0 +1,160 @@
+import json
+import re
+import time
+
+import pytest
+
+import utils.llm_utils as llm_utils
+from tests.fake_llm import ACME_RESULT, FakeGenerativeModel
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    model = FakeGenerativeModel(latency=0.05)
+    monkeypatch.setattr(llm_utils, "model", model)
+    monkeypatch.setattr(llm_utils, "rate_limiter", llm_utils.RateLimiter(60000, burst=100))
+    return model
+
+
+def make_emails(count):
+    return [{"id": f"id{i}", "text_content": f"Application {i} received"} for i in range(count)]
+
+
+def test_classify_emails_runs_concurrently_and_keeps_order(fake_model):
+    emails = make_emails(16)
+
+    start = time.monotonic()
+    results = list(llm_utils.classify_emails(iter(emails), max_workers=4, max_batch_size=1))
+    elapsed = time.monotonic() - start
+
+    assert [email["id"] for email, _ in results] == [email["id"] for email in emails]
+    assert all(result["company_name"] == "Acme" for _, result in results)
+    assert fake_model.max_active == 4
+    # 16 calls of 50ms each take 800ms serially
+    assert elapsed < 0.5
+
+
+def test_classify_emails_backs_off_on_rate_limit(fake_model, monkeypatch):
+    fake_model.rate_limited_calls = 1
+    monkeypatch.setattr(llm_utils, "RATE_LIMIT_BACKOFF_SECONDS", 0.2)
+
+    results = list(llm_utils.classify_emails(make_emails(4), max_workers=2, max_batch_size=1))
+
+    assert all(result is not None for _, result in results)
+    assert fake_model.calls == 5
+    # the 429 pauses every worker, not just the one that hit it
+    rate_limited_at = fake_model.call_times[0]
+    assert all(t >= rate_limited_at + 0.2 for t in fake_model.call_times[2:])
+
+
+def test_rate_limiter_spaces_requests():
+    limiter = llm_utils.RateLimiter(requests_per_minute=1200, burst=1)  # one every 50ms
+
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+    elapsed = time.monotonic() - start
+
+    assert elapsed >= 0.19
+
+
+def test_rate_limiter_backoff_blocks_until_pause_ends():
+    limiter = llm_utils.RateLimiter(requests_per_minute=60000, burst=10)
+    limiter.backoff(0.1)
+
+    start = time.monotonic()
+    limiter.acquire()
+
+    assert time.monotonic() - start >= 0.09
+
+
+def test_batch_emails_respects_count_and_length():
+    emails = [
+        {"id": "a", "text_content": "x" * 40},
+        {"id": "b", "text_content": "x" * 40},
+        {"id": "c", "text_content": "x" * 40},
+        {"id": "d", "text_content": "x" * 500},
+        {"id": "e", "text_content": "x"},
+        {"id": "f", "text_content": "x"},
+        {"id": "g", "text_content": "x"},
+    ]
+
+    batches = list(llm_utils.batch_emails(emails, max_batch_size=2, max_chars=100))
+
+    assert [[email["id"] for email in batch] for batch in batches] == [
+        ["a", "b"],
+        ["c"],
+        ["d"],
+        ["e", "f"],
+        ["g"],
+    ]
+
+
+def test_classify_emails_packs_emails_into_one_prompt(fake_model):
+    results = list(llm_utils.classify_emails(make_emails(5), max_batch_size=10))
+
+    assert fake_model.calls == 1
+    assert [email["id"] for email, _ in results] == [f"id{i}" for i in range(5)]
+    assert all(result == ACME_RESULT for _, result in results)
+
+
+def test_process_emails_batch_falls_back_for_missing_and_malformed_results(fake_model):
+    def respond(prompt):
+        email_ids = re.findall(r"^\s*Email id: (.+)$", prompt, flags=re.MULTILINE)
+        if not email_ids:
+            return json.dumps({"company_name": "Single", "application_status": "offer", "job_title": "Chef"})
+        return json.dumps(
+            [
+                {"id": "id0", **ACME_RESULT},
+                {"id": "id1", "company_name": "Acme"},  # malformed, keys missing
+                {"id": "id2"},  # not a job application
+                {"id": "unknown-id", **ACME_RESULT},
+                # id3 missing
+            ]
+        )
+
+    fake_model.respond = respond
+
+    results = llm_utils.process_emails_batch(make_emails(4))
+
+    assert results["id0"] == ACME_RESULT
+    assert results["id1"]["company_name"] == "Single"
+    assert results["id2"] == {}
+    assert results["id3"]["company_name"] == "Single"
+    assert fake_model.calls == 3
+
+
+def test_process_emails_batch_falls_back_when_response_is_not_an_array(fake_model):
+    fake_model.respond = lambda prompt: json.dumps(ACME_RESULT)
+
+    results = llm_utils.process_emails_batch(make_emails(3))
+
+    assert all(result == ACME_RESULT for result in results.values())
+    assert fake_model.calls == 4
+
+
+def test_parse_model_response_handles_code_fences_and_apostrophes():
+    response = '```json\n{"company_name": "O\'Reilly"}\n```'
+    assert llm_utils.parse_model_response(response) == {"company_name": "O'Reilly"}
+    assert llm_utils.parse_model_response("{'company_name': 'Acme'}") == {"company_name": "Acme"}
+
+
+def test_process_emails_batch_retries_a_rate_limited_batch_whole(fake_model, monkeypatch):
+    fake_model.rate_limited_calls = 1
+    monkeypatch.setattr(llm_utils, "RATE_LIMIT_BACKOFF_SECONDS", 0.01)
+
+    results = llm_utils.process_emails_batch(make_emails(4))
+
+    assert all(result == ACME_RESULT for result in results.values())
+    # the batch again, not an email at a time
+    assert fake_model.calls == 2
+
+
+def test_process_emails_batch_does_not_split_a_batch_still_rate_limited(fake_model, monkeypatch):
+    fake_model.rate_limited_calls = 100
+    monkeypatch.setattr(llm_utils, "RATE_LIMIT_BACKOFF_SECONDS", 0.01)
+
+    with pytest.raises(llm_utils.RateLimitError):
+        llm_utils.process_emails_batch(make_emails(4))
+
+    assert fake_model.calls == 3
@@ -0,0 +1,58 @@
+import threading
+import time
+
+import pytest
+
+from utils.pipeline_utils import run_in_thread
+
+
+def test_run_in_thread_yields_items_in_order():
+    assert list(run_in_thread(iter(range(100)), maxsize=5)) == list(range(100))
+
+
+def test_run_in_thread_applies_backpressure():
+    produced = []
+
+    def producer():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    items = run_in_thread(producer(), maxsize=3)
+    assert next(items) == 0
+    time.sleep(0.2)
+
+    # one item handed over, three queued and one waiting to be queued
+    assert len(produced) <= 5
+    items.close()
+
+
+def test_run_in_thread_reraises_producer_errors_after_earlier_items():
+    def producer():
+        yield 1
+        yield 2
+        raise ValueError("listing failed")
+
+    received = []
+    with pytest.raises(ValueError, match="listing failed"):
+        for item in run_in_thread(producer(), maxsize=10):
+            received.append(item)
+
+    assert received == [1, 2]
+
+
+def test_run_in_thread_stops_producer_when_consumer_stops():
+    finished = threading.Event()
+
+    def producer():
+        try:
+            for i in range(1000):
+                yield i
+        finally:
+            finished.set()
+
+    items = run_in_thread(producer(), maxsize=2)
+    next(items)
+    items.close()
+
+    assert finished.wait(timeout=1)
@@ -0,0 +1,68 @@
+"""
+measures the rule based preclassifier against the labeled emails in
+sample_preclassifier_emails.yaml. Every email the rules resolve has to match
+its label; everything else must be left to the LLM.
+"""
+
+from pathlib import Path
+
+import pytest
+import yaml
+
+from utils import metrics_utils
+from utils.preclassifier_utils import preclassify_email, preclassify_emails
+
+SAMPLE_EMAILS_PATH = Path(__file__).parent / "sample_preclassifier_emails.yaml"
+
+
+def load_sample_emails():
+    with open(SAMPLE_EMAILS_PATH, "r") as fid:
+        samples = yaml.safe_load(fid)
+    return [
+        (
+            {
+                "id": str(idx),
+                "from": sample["from"],
+                "subject": sample["subject"],
+                "raw_text_content": sample["text"],
+                "text_content": sample["subject"] + "\n" + sample["text"],
+            },
+            sample["label"],
+        )
+        for idx, sample in enumerate(samples)
+    ]
+
+
+SAMPLE_EMAILS = load_sample_emails()
+
+
+@pytest.mark.parametrize("email_data, label", SAMPLE_EMAILS, ids=lambda x: x.get("subject", ""))
+def test_preclassify_email_matches_label_when_resolved(email_data, label):
+    result = preclassify_email(email_data)
+    if result is not None:
+        assert result == label
+
+
+def test_preclassifier_precision_and_resolution_rate():
+    resolved = 0
+    correct = 0
+    for email_data, label in SAMPLE_EMAILS:
+        result = preclassify_email(email_data)
+        if result is not None:
+            resolved += 1
+            correct += result == label
+
+    assert correct / resolved == 1.0
+    # roughly half the corpus are plain confirmations and rejections
+    assert resolved / len(SAMPLE_EMAILS) >= 0.4
+
+
+def test_preclassify_emails_counts_resolved_and_escalated():
+    metrics_utils.reset_metrics()
+    emails = [email_data for email_data, _ in SAMPLE_EMAILS]
+
+    results = preclassify_emails(emails)
+
+    metrics = metrics_utils.get_metrics()
+    assert metrics["preclassifier.resolved"] == len(results)
+    assert metrics["preclassifier.resolved"] + metrics["preclassifier.escalated"] == len(emails)
@@ -0,0 +1,73 @@
+from unittest import mock
+
+import pytest
+
+from db.processing_tasks import FINISHED, STARTED, TaskRuns
+from utils import progress_utils
+from utils.progress_utils import ProgressReporter, get_progress
+
+
+@pytest.fixture(autouse=True)
+def clean_progress():
+    progress_utils.clear_progress()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(progress_utils.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_progress_reporter_publishes_every_update_and_saves_in_batches(clock):
+    session = mock.Mock()
+    task_run = TaskRuns(user_id="123", status=STARTED)
+    progress = ProgressReporter(session, task_run, save_every_emails=10, save_every_seconds=60)
+
+    for processed in range(1, 26):
+        progress.update(processed, 40)
+        assert get_progress("123") == {"status": STARTED, "processed_emails": processed, "total_emails": 40}
+
+    assert session.commit.call_count == 2
+    assert task_run.processed_emails == 20
+
+    clock[0] += 60
+    progress.update(26, 40)
+    assert session.commit.call_count == 3
+    assert task_run.processed_emails == 26
+
+    progress.finish(FINISHED)
+    assert session.commit.call_count == 4
+    assert get_progress("123")["status"] == FINISHED
+
+
+def test_progress_reporter_save_can_leave_the_commit_to_the_caller(clock):
+    session = mock.Mock()
+    task_run = TaskRuns(user_id="123", status=STARTED)
+    progress = ProgressReporter(session, task_run, save_every_emails=10, save_every_seconds=60)
+
+    progress.update(5, 8)
+    progress.save(commit=False)
+
+    assert task_run.processed_emails == 5
+    assert task_run.total_emails == 8
+    session.commit.assert_not_called()
+
+
+def test_progress_reporter_notifies_other_processes_at_most_every_second(clock, monkeypatch):
+    notified = []
+    monkeypatch.setattr(progress_utils, "notify_progress", lambda engine, user_id, progress: notified.append(progress))
+    task_run = TaskRuns(user_id="123", status=STARTED)
+    progress = ProgressReporter(mock.Mock(), task_run, save_every_emails=10, save_every_seconds=60)
+
+    for processed in range(1, 6):
+        progress.update(processed, 40)
+    clock[0] += 1
+    progress.update(6, 40)
+    progress.finish(FINISHED)
+
+    assert [(x["status"], x["processed_emails"]) for x in notified] == [
+        (STARTED, 0),
+        (STARTED, 6),
+        (FINISHED, 6),
+    ]
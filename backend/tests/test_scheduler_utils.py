@@ -0,0 +1,103 @@
+import threading
+
+import pytest
+
+from simulate_scheduler import SimulatedUser, percentile, simulate
+from utils.scheduler_utils import FairQueue, FairScheduler
+
+
+def drain(queue):
+    order = []
+    while len(queue):
+        order.append(queue.pop())
+    return order
+
+
+def test_fair_queue_interleaves_tenants():
+    queue = FairQueue(small_sync_emails=0)
+    for i in range(3):
+        queue.push("a", f"a{i}")
+    for i in range(3):
+        queue.push("b", f"b{i}")
+
+    assert [item for _, item in drain(queue)] == ["a0", "b0", "a1", "b1", "a2", "b2"]
+
+
+def test_fair_queue_serves_incremental_syncs_by_weight():
+    queue = FairQueue(small_sync_emails=0, small_sync_weight=4, backfill_weight=1)
+    for i in range(8):
+        queue.push("backfill", i)
+    for i in range(8):
+        queue.push("sync", i, incremental=True)
+
+    first_five = [tenant for tenant, _ in drain(queue)[:5]]
+    assert first_five.count("sync") == 4
+
+
+def test_fair_queue_lowers_weight_after_small_sync_emails():
+    queue = FairQueue(small_sync_emails=2, small_sync_weight=4, backfill_weight=1)
+    for i in range(4):
+        queue.push("big", i)
+
+    tags = [tag for tag, _ in queue.tenants["big"].items]
+    assert tags == [0.25, 0.5, 1.5, 2.5]
+
+
+def test_fair_queue_late_tenant_starts_at_virtual_time():
+    queue = FairQueue(small_sync_emails=0)
+    for i in range(10):
+        queue.push("early", i)
+    for _ in range(5):
+        queue.pop()
+    queue.push("late", 0)
+
+    # the late tenant is not owed the turns it missed before it arrived
+    assert [tenant for tenant, _ in drain(queue)[:2]] == ["early", "late"]
+
+
+def test_fair_queue_pop_raises_when_empty():
+    queue = FairQueue()
+    queue.push("a", 1)
+    queue.pop()
+
+    with pytest.raises(IndexError):
+        queue.pop()
+    assert len(queue) == 0
+
+
+def test_fair_scheduler_runs_submitted_calls():
+    scheduler = FairScheduler(max_workers=2, name="test")
+
+    futures = [scheduler.submit(f"user{i % 3}", pow, i, 2) for i in range(10)]
+
+    assert [future.result(timeout=5) for future in futures] == [i**2 for i in range(10)]
+
+
+def test_fair_scheduler_sets_exceptions_and_skips_cancelled():
+    scheduler = FairScheduler(max_workers=1, name="test")
+    release = threading.Event()
+    blocker = scheduler.submit("a", release.wait, 5)
+    cancelled = scheduler.submit("a", pytest.fail, "cancelled call ran")
+    failing = scheduler.submit("b", int, "not a number")
+
+    assert cancelled.cancel()
+    release.set()
+
+    assert blocker.result(timeout=5) is True
+    with pytest.raises(ValueError):
+        failing.result(timeout=5)
+
+
+def test_simulation_small_syncs_are_not_stuck_behind_a_backfill():
+    users = [SimulatedUser("backfill", arrival=0.0, emails=2000)] + [
+        SimulatedUser(f"user{i}", arrival=1.0 + i, emails=30, incremental=True) for i in range(20)
+    ]
+
+    fifo = simulate(users, "fifo")
+    fair = simulate(users, "fair")
+
+    def p90(completion):
+        return percentile([completion[f"user{i}"] for i in range(20)], 90)
+
+    assert set(fair) == set(fifo) == {user.user_id for user in users}
+    assert p90(fair) < p90(fifo) / 4
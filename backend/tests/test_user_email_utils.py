@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta
+
+import pytest
+import sqlalchemy as sa
+
+from db.user_emails import UserEmails
+from db.utils.user_email_utils import (
+    count_user_emails,
+    decode_email_cursor,
+    get_existing_email_ids,
+    get_user_emails,
+    get_user_emails_page,
+    upsert_user_emails,
+)
+
+
+def make_user_email(email_id: str, user_id: str) -> UserEmails:
+    return UserEmails(
+        id=email_id,
+        user_id=user_id,
+        company_name="Acme",
+        application_status="no response",
+        received_at=datetime(2025, 2, 13),
+        subject="Application received",
+        job_title="Software Engineer",
+        email_from="no-reply@acme.com",
+    )
+
+
+def test_get_existing_email_ids_uses_one_query_per_page(db_session, engine):
+    db_session.add_all(make_user_email(f"id{i}", "123") for i in range(0, 100, 2))
+    db_session.add(make_user_email("id1", "456"))
+    db_session.commit()
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    sa.event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        existing = get_existing_email_ids(db_session, "123", [f"id{i}" for i in range(100)])
+        assert get_existing_email_ids(db_session, "123", []) == set()
+    finally:
+        sa.event.remove(engine, "before_cursor_execute", count_statement)
+
+    # another user's copy of id1 does not count
+    assert existing == {f"id{i}" for i in range(0, 100, 2)}
+    assert len(statements) == 1
+
+
+def test_upsert_user_emails_skips_rows_already_stored(db_session):
+    db_session.add(make_user_email("id0", "123"))
+    db_session.commit()
+
+    records = [make_user_email(f"id{i}", "123") for i in range(5)]
+    records[2].company_name = "Globex"
+    records.insert(3, make_user_email("id2", "123"))  # repeated within the chunk
+    records.append(make_user_email("id0", "456"))  # same Gmail id, other user
+
+    counts = upsert_user_emails(db_session, records, chunk_size=4)
+    db_session.commit()
+
+    assert counts == {"inserted": 5, "updated": 0, "skipped": 2}
+    assert db_session.query(UserEmails).count() == 6
+    assert db_session.get(UserEmails, ("id2", "123")).company_name == "Acme"
+
+
+def test_upsert_user_emails_can_update_existing_rows(db_session):
+    db_session.add(make_user_email("id0", "123"))
+    db_session.commit()
+
+    records = [make_user_email(f"id{i}", "123") for i in range(3)]
+    for record in records:
+        record.application_status = "rejected"
+
+    counts = upsert_user_emails(db_session, records, update_existing=True)
+    db_session.commit()
+
+    assert counts == {"inserted": 2, "updated": 1, "skipped": 0}
+    db_session.expire_all()
+    assert {
+        email.application_status for email in db_session.query(UserEmails)
+    } == {"rejected"}
+
+
+def add_dated_user_emails(db_session, count: int, user_id: str = "123"):
+    """Emails two at a time on the same day, the newest last."""
+    statuses = ["no response", "Rejected", "interview scheduled"]
+    for i in range(count):
+        record = make_user_email(f"id{i:02d}", user_id)
+        record.received_at = datetime(2025, 1, 1) + timedelta(days=i // 2)
+        record.application_status = statuses[i % 3]
+        record.company_name = "Acme" if i % 2 else "Globex"
+        db_session.add(record)
+    db_session.commit()
+
+
+def test_user_email_pages_cover_every_email_once_newest_first(db_session):
+    add_dated_user_emails(db_session, 25)
+    add_dated_user_emails(db_session, 5, user_id="456")
+
+    pages, cursor = [], None
+    while True:
+        page, cursor = get_user_emails_page(db_session, "123", 4, cursor)
+        pages.append([email.id for email in page])
+        if cursor is None:
+            break
+
+    assert [len(page) for page in pages] == [4] * 6 + [1]
+    assert sum(pages, []) == [email.id for email in get_user_emails(db_session, "123")]
+    assert sum(pages, []) == sorted((f"id{i:02d}" for i in range(25)), reverse=True)
+
+
+def test_user_email_pages_are_filtered_in_the_database(db_session):
+    add_dated_user_emails(db_session, 30)
+    filters = {
+        "status": ["rejected", "Interview Scheduled"],
+        "company": "acme",
+        "received_after": datetime(2025, 1, 3),
+        "received_before": datetime(2025, 1, 13),
+    }
+
+    page, cursor = get_user_emails_page(db_session, "123", 100, **filters)
+
+    expected = [
+        f"id{i:02d}"
+        for i in range(29, -1, -1)
+        if i % 3 and i % 2 and datetime(2025, 1, 3) <= datetime(2025, 1, 1) + timedelta(days=i // 2) < datetime(2025, 1, 13)
+    ]
+    assert [email.id for email in page] == expected and cursor is None
+    assert count_user_emails(db_session, "123", **filters) == len(expected)
+    assert count_user_emails(db_session, "123") == 30
+
+
+def test_decode_email_cursor_rejects_malformed_cursors():
+    with pytest.raises(ValueError):
+        decode_email_cursor("not a cursor")
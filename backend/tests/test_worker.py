@@ -0,0 +1,70 @@
+import json
+from datetime import datetime
+from unittest import mock
+
+from google.oauth2.credentials import Credentials
+
+import worker
+from db.ingestion_jobs import FINISHED, QUEUED, IngestionJobs
+from db.processing_tasks import TaskRuns
+from db.user_emails import UserEmails
+from db.users import Users
+from db.utils.job_queue_utils import enqueue_ingestion_job
+from tests.fake_gmail import FakeGmailService, make_raw_message
+from tests.fake_llm import FakeGenerativeModel
+
+
+def make_payload() -> dict:
+    creds = Credentials(
+        "abc", refresh_token="def", client_id="client", client_secret="secret"
+    )
+    return {
+        "creds": creds.to_json(),
+        "session": {"start_date": None, "is_new_user": False},
+        "last_updated": None,
+    }
+
+
+def test_worker_runs_queued_ingestion_job(db_session):
+    db_session.add(Users(user_id="123", user_email="user123@example.com", start_date=datetime(2000, 1, 1)))
+    db_session.commit()
+    job_id = enqueue_ingestion_job(db_session, "123", make_payload())
+    db_session.commit()
+
+    service = FakeGmailService(
+        {f"id{i}": make_raw_message(f"Application {i} received") for i in range(5)}
+    )
+    with (
+        mock.patch("routes.email_routes.build", return_value=service),
+        mock.patch("utils.llm_utils.model", FakeGenerativeModel()),
+    ):
+        assert worker.run_next_job("worker-1")
+        assert not worker.run_next_job("worker-1")
+
+    db_session.expire_all()
+    job = db_session.get(IngestionJobs, job_id)
+    assert job.status == FINISHED
+    assert job.payload is None
+    assert db_session.get(TaskRuns, "123").status == FINISHED
+    # emails are stored under the job's user, without verifying an ID token
+    stored = db_session.query(UserEmails).all()
+    assert sorted(email.id for email in stored) == [f"id{i}" for i in range(5)]
+    assert {email.user_id for email in stored} == {"123"}
+
+
+def test_worker_queues_failed_job_for_a_retry(db_session):
+    db_session.add(Users(user_id="123", user_email="user123@example.com", start_date=datetime(2000, 1, 1)))
+    db_session.commit()
+    job_id = enqueue_ingestion_job(db_session, "123", make_payload())
+    db_session.commit()
+
+    service = FakeGmailService({"id0": make_raw_message("Application received")}, failing_page=0)
+    with mock.patch("routes.email_routes.build", return_value=service):
+        assert worker.run_next_job("worker-1")
+
+    db_session.expire_all()
+    job = db_session.get(IngestionJobs, job_id)
+    assert job.status == QUEUED
+    assert job.attempts == 1
+    assert "500" in job.last_error
+    assert json.loads(job.payload["creds"])["refresh_token"] == "def"
@@ -22,9 +22,13 @@ class AuthenticatedUser:
     successfully authenticated with Google.
     """
 
-    def __init__(self, creds: Credentials, start_date=None):
+    def __init__(self, creds: Credentials, start_date=None, user_id: str = None, user_email: str = None):
         self.creds = creds
-        self.user_id, self.user_email = self.get_user_id_and_email()
+        if user_id:
+            # already known, e.g. to a worker running a job enqueued at login
+            self.user_id, self.user_email = user_id, user_email
+        else:
+            self.user_id, self.user_email = self.get_user_id_and_email()
         self.filepath = get_user_filepath(self.user_id)
         self.start_date = start_date
 
@@ -0,0 +1,82 @@
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+
+class PageCheckpoint:
+    """
+    Tracks how far ingestion got through the pages of a Gmail listing, so an
+    interrupted run can resume without processing any message twice.
+
+    Messages are not processed in listing order (e.g. a rate limited one is
+    fetched again after the rest of its batch), so the messages still
+    outstanding are tracked per page. page_token only moves past a page once
+    every message on it was processed or failed, and every page before it is
+    done too. Messages processed on pages not done yet are kept in
+    processed_ids and skipped when the listing is resumed from page_token.
+    """
+
+    def __init__(self, page_token: Optional[str] = None, processed_ids: Iterable[str] = ()):
+        self.page_token = page_token  # token to resume listing from, None for the first page
+        self.processed_ids: Set[str] = set(processed_ids)
+        self.skip_ids = frozenset(self.processed_ids)
+        self.pages: Dict[int, dict] = {}  # pages not done yet, in listing order
+        self.page_of: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def page_listed(self, page_number: int, next_page_token: Optional[str], message_ids: List[str]) -> List[str]:
+        """
+        Registers a listed page and returns its ids minus those already
+        processed before the run was resumed.
+        """
+        with self.lock:
+            new_ids = [x for x in message_ids if x not in self.skip_ids]
+            self.pages[page_number] = {
+                "next_page_token": next_page_token,
+                "ids": set(self.skip_ids.intersection(message_ids)),
+                "outstanding": set(new_ids),
+            }
+            for message_id in new_ids:
+                self.page_of[message_id] = page_number
+            self.drop_done_pages()
+            return new_ids
+
+    def message_processed(self, message_id: str) -> None:
+        with self.lock:
+            page_number = self.page_of.pop(message_id, None)
+            if page_number is None:
+                return
+            page = self.pages[page_number]
+            page["outstanding"].discard(message_id)
+            page["ids"].add(message_id)
+            self.processed_ids.add(message_id)
+            self.drop_done_pages()
+
+    def message_failed(self, message_id: str) -> None:
+        """A message that could not be fetched; it is not tried again on resume."""
+        with self.lock:
+            page_number = self.page_of.pop(message_id, None)
+            if page_number is None:
+                return
+            self.pages[page_number]["outstanding"].discard(message_id)
+            self.drop_done_pages()
+
+    def drop_done_pages(self) -> None:
+        last_page_number = max(self.pages, default=None)
+        for page_number in list(self.pages):
+            page = self.pages[page_number]
+            if page["outstanding"]:
+                break
+            if page["next_page_token"] is None and page_number == last_page_number:
+                # the end of the listing so far; a page_token of None would
+                # list it again from the first page
+                break
+            del self.pages[page_number]
+            self.page_token = page["next_page_token"]
+            self.processed_ids -= page["ids"]
+
+    def get_state(self) -> dict:
+        with self.lock:
+            return {
+                "page_token": self.page_token,
+                "processed_message_ids": sorted(self.processed_ids),
+            }
@@ -0,0 +1,159 @@
+"""
+Compaction of email text before it reaches the LLM: the plain text and HTML
+versions of a body are merged sentence by sentence, reply quotes, signatures
+and ATS boilerplate are dropped, and whatever is still over the token budget
+is trimmed, keeping the subject and the sentences most likely to name the
+company, the job title or the application status.
+"""
+
+import re
+from typing import Iterable, List, Tuple
+
+CHARS_PER_TOKEN = 4  # rough average for English text
+
+# "On Mon, Feb 10, 2025 at 9:14 AM Jane Doe <jane@example.com> wrote:" may be
+# wrapped over two lines; everything after it is the quoted conversation
+REPLY_HEADER_PATTERN = re.compile(
+    r"^(On\b[^\n]{0,200}(\n[^\n]{0,200})?\bwrote:|-{2,} ?Original Message ?-{2,})",
+    re.MULTILINE | re.IGNORECASE,
+)
+INLINE_REPLY_HEADER_PATTERN = re.compile(r"\bOn [^.?!]{0,200}\bwrote:", re.IGNORECASE)
+SIGNATURE_PATTERN = re.compile(
+    r"^(-- ?|_{10,}|-{10,}|Sent from my \w+.*|Get Outlook for \w+.*)$", re.MULTILINE
+)
+SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+
+BOILERPLATE_PATTERN = re.compile(
+    r"unsubscribe|privacy (policy|notice)|terms of (use|service)|all rights reserved|©|"
+    r"\bview (this (e-?mail|message) )?in (your|a) browser|(email|e-mail) preferences|"
+    r"\byou('re| are) receiving this|\byou received this (e-?mail|message)|"
+    r"\bthis (e-?mail|email|message) was (intended|sent) (for|to)\b|"
+    r"\bconfidential(ity)?\b.{0,80}\b(intended|addressee|recipient)|"
+    r"\breceived this (e-?mail|message) in error\b|\bunauthori[sz]ed (review|use|disclosure)\b|"
+    r"\bequal (employment )?opportunity\b|\bwithout regard to\b|\bdiscriminat|"
+    r"\bqualified applicants\b|\bprotected (by law|veteran)|\bpowered by\b|"
+    r"\b(follow|connect with) us\b|\bregistered trademarks?\b|\blearn why we included this\b",
+    re.IGNORECASE,
+)
+# notices that often share a sentence with what the email is about, e.g. "This
+# is an automated message to confirm we received your application"; such a
+# sentence is only dropped if it says nothing about the application status
+NO_REPLY_PATTERN = re.compile(
+    r"\b(please )?do not reply\b|\bnot monitored\b|\bautomated message\b", re.IGNORECASE
+)
+
+# what the model is asked for; sentences mentioning it are kept first
+STATUS_PATTERN = re.compile(
+    r"\bappl(y|ied|ying|ication)\b|\breceived\b|\bsubmitted\b|\binterview|\boffer\b|"
+    r"\bunfortunately\b|\bregret\b|\bmov(e|ing) forward\b|\bother candidates\b|\bnext steps?\b|"
+    r"\bassessment|\bschedul|\bavailab|\bfilled\b|\bcongratulations\b|\breject",
+    re.IGNORECASE,
+)
+TITLE_PATTERN = re.compile(
+    r"\b(engineer|developer|manager|analyst|designer|scientist|intern|specialist|"
+    r"coordinator|director|lead|consultant|architect|administrator|associate|"
+    r"position|role|opening)s?\b",
+    re.IGNORECASE,
+)
+COMPANY_PATTERN = re.compile(
+    r"\b(at|with|to|from|join) [A-Z]|\bteam\b|\bcompany\b|\bcareers?\b|\bhiring\b|\brecruit",
+    re.IGNORECASE,
+)
+LEADING_SENTENCES = 3  # the opening of an email usually says what it is about
+
+
+def strip_quoted_reply(text: str) -> str:
+    """Drops the quoted conversation below a reply, and any '>' quoted lines."""
+    match = REPLY_HEADER_PATTERN.search(text)
+    if match:
+        text = text[: match.start()]
+    if "\n" not in text.strip():
+        # text from HTML runs on without line breaks
+        match = INLINE_REPLY_HEADER_PATTERN.search(text)
+        if match:
+            text = text[: match.start()]
+    return "\n".join(line for line in text.splitlines() if not line.lstrip().startswith(">"))
+
+
+def strip_signature(text: str) -> str:
+    match = SIGNATURE_PATTERN.search(text)
+    return text[: match.start()] if match else text
+
+
+def split_sentences(text: str) -> List[Tuple[int, str]]:
+    """(paragraph number, sentence) pairs; paragraphs are separated by blank lines."""
+    sentences = []
+    for paragraph_number, paragraph in enumerate(re.split(r"\n\s*\n", text)):
+        paragraph = " ".join(paragraph.split())  # sentences may be wrapped over lines
+        for sentence in SENTENCE_END_PATTERN.split(paragraph):
+            if sentence:
+                sentences.append((paragraph_number, sentence))
+    return sentences
+
+
+def is_boilerplate(sentence: str) -> bool:
+    if BOILERPLATE_PATTERN.search(sentence):
+        return True
+    return bool(NO_REPLY_PATTERN.search(sentence)) and not STATUS_PATTERN.search(sentence)
+
+
+def normalize_sentence(sentence: str) -> str:
+    return " ".join(re.findall(r"\w+", sentence.lower()))
+
+
+def score_sentence(sentence: str, position: int) -> int:
+    score = 3 * bool(STATUS_PATTERN.search(sentence))
+    score += 2 * bool(TITLE_PATTERN.search(sentence))
+    score += 2 * bool(COMPANY_PATTERN.search(sentence))
+    return score + (position < LEADING_SENTENCES)
+
+
+def compact_email_text(subject: str, bodies: Iterable[str], max_tokens: int) -> str:
+    """
+    Returns the subject and the compacted bodies (e.g. the plain text and the
+    text of the HTML version), at most about max_tokens tokens long.
+
+    Sentences are kept in their original order. A sentence whose words
+    already appeared, in the same or an earlier body, is dropped, so two
+    versions of the same email only count once while the parts where they
+    differ (e.g. LinkedIn's HTML lists more than its plain text) are kept.
+    """
+    # the words kept so far, space separated and padded, to look sentences up in
+    seen = f" {normalize_sentence(subject)} "
+    kept = []  # (body number, paragraph number, sentence)
+    for body_number, body in enumerate(bodies):
+        body = strip_signature(strip_quoted_reply(body or ""))
+        for paragraph_number, sentence in split_sentences(body):
+            key = normalize_sentence(sentence)
+            if not key or f" {key} " in seen or is_boilerplate(sentence):
+                continue
+            seen += f"{key} "
+            kept.append((body_number, paragraph_number, sentence))
+
+    budget = max_tokens * CHARS_PER_TOKEN - len(subject)
+    if sum(len(sentence) + 1 for _, _, sentence in kept) > budget:
+        ranked = sorted(
+            range(len(kept)),
+            key=lambda i: (-score_sentence(kept[i][2], i), i),
+        )
+        chosen = {}
+        for i in ranked:
+            if budget <= 1:
+                break
+            body_number, paragraph_number, sentence = kept[i]
+            # a run-on sentence (text from HTML often has no full stops) is cut
+            # to what is left rather than dropped
+            sentence = sentence[: budget - 1]
+            chosen[i] = (body_number, paragraph_number, sentence)
+            budget -= len(sentence) + 1
+        kept = [chosen[i] for i in sorted(chosen)]
+
+    lines = [subject]
+    previous = None
+    for body_number, paragraph_number, sentence in kept:
+        if (body_number, paragraph_number) == previous:
+            lines[-1] += " " + sentence
+        else:
+            lines.append(sentence)
+        previous = (body_number, paragraph_number)
+    return "\n".join(lines)
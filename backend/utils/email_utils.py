@@ -1,15 +1,42 @@
 import base64
-import email
+import json
 import logging
+import queue
 import re
-from typing import Dict, Any
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from typing import Callable, Dict, Any, Iterable, Iterator, List, Optional, Tuple
 
 from bs4 import BeautifulSoup
 from email_validator import validate_email, EmailNotValidError
+from googleapiclient.errors import HttpError
 
 from constants import GENERIC_ATS_DOMAINS
+from utils.compaction_utils import compact_email_text
+from utils.config_utils import get_settings
+from utils.metrics_utils import increment
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+try:
+    import lxml.etree
+    import lxml.html
+except ImportError:
+    lxml = None
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Gmail allows up to 100 calls per batch request, but large batches are
+# more likely to trip the per-user concurrent request limit.
+GMAIL_BATCH_SIZE = 50
+GMAIL_BATCH_MAX_RETRIES = 3
+GMAIL_BATCH_RETRY_DELAY = 1  # seconds, doubled on every retry
+HTML_FEED_CHARS = 16384  # HTML parsed at a time by html_parser_to_text
 
 
 def clean_whitespace(text: str) -> str:
@@ -57,7 +84,120 @@ def is_valid_email(email: str) -> bool:
         return False
 
 
-def get_email_content(email_data: Dict[str, Any]) -> str:
+class HTMLTextExtractor(HTMLParser):
+    """
+    Collects the text of an HTML document as it is parsed, without building
+    a tree, leaving out scripts and styles like BeautifulSoup's get_text.
+    """
+
+    SKIPPED_TAGS = {"script", "style", "template"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.strings = []
+        self.chars = 0
+        self.skipping = 0
+        self.text_node = []  # the text may arrive in pieces, e.g. split between two feed() calls
+
+    def end_text_node(self):
+        text = "".join(self.text_node).strip()
+        self.text_node = []
+        if text:
+            self.strings.append(text)
+            self.chars += len(text) + 1
+
+    def handle_starttag(self, tag, attrs):
+        self.end_text_node()
+        if tag in self.SKIPPED_TAGS:
+            self.skipping += 1
+
+    def handle_endtag(self, tag):
+        self.end_text_node()
+        if tag in self.SKIPPED_TAGS and self.skipping:
+            self.skipping -= 1
+
+    def handle_comment(self, data):
+        self.end_text_node()
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.text_node.append(data)
+
+    def close(self):
+        super().close()
+        self.end_text_node()
+
+
+def html_parser_to_text(html: str, max_chars: Optional[int] = None) -> str:
+    extractor = HTMLTextExtractor()
+    # fed in pieces, so parsing stops soon after max_chars of text were found
+    for start in range(0, len(html), HTML_FEED_CHARS):
+        extractor.feed(html[start : start + HTML_FEED_CHARS])
+        if max_chars is not None and extractor.chars > max_chars:
+            break
+    else:
+        extractor.close()
+    return " ".join(extractor.strings)
+
+
+def join_strings(strings: Iterable[str], max_chars: Optional[int] = None) -> str:
+    """The non-blank strings, stripped and separated by spaces, stopping soon after max_chars of text."""
+    joined = []
+    chars = 0
+    for text in strings:
+        text = text.strip()
+        if text:
+            joined.append(text)
+            chars += len(text) + 1
+            if max_chars is not None and chars > max_chars:
+                break
+    return " ".join(joined)
+
+
+def selectolax_to_text(html: str, max_chars: Optional[int] = None) -> str:
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(list(HTMLTextExtractor.SKIPPED_TAGS))
+    root = tree.root
+    if root is None:
+        return ""
+    if max_chars is None:
+        return root.text(separator=" ", strip=True)
+    # the text nodes are walked one by one, so the walk stops soon after max_chars of text were found
+    text_nodes = (node for node in root.traverse(include_text=True) if node.tag == "-text")
+    return join_strings((node.text(deep=False) for node in text_nodes), max_chars)
+
+
+def lxml_to_text(html: str, max_chars: Optional[int] = None) -> str:
+    try:
+        document = lxml.html.document_fromstring(html)
+    except lxml.etree.ParserError:  # e.g. only whitespace or comments
+        return ""
+    for element in document.iter(*HTMLTextExtractor.SKIPPED_TAGS):
+        element.drop_tree()
+    # itertext() is lazy, so the walk stops soon after max_chars of text were found
+    return join_strings(document.itertext(), max_chars)
+
+
+# HTML to text converters, fastest first; the C based ones are optional dependencies
+HTML_TO_TEXT_CONVERTERS = {}
+if LexborHTMLParser is not None:
+    HTML_TO_TEXT_CONVERTERS["selectolax"] = selectolax_to_text
+if lxml is not None:
+    HTML_TO_TEXT_CONVERTERS["lxml"] = lxml_to_text
+HTML_TO_TEXT_CONVERTERS["html.parser"] = html_parser_to_text
+
+
+def html_to_text(html: str, max_chars: Optional[int] = None) -> str:
+    """
+    The text of an HTML email body, its strings separated by spaces. Parsing
+    may stop early once max_chars of text were found, so the result can be
+    cut short but is not truncated here.
+    """
+    convert = next(iter(HTML_TO_TEXT_CONVERTERS.values()))
+    return convert(html, max_chars)
+
+
+def get_email_content(email_data: Dict[str, Any], max_chars: Optional[int] = None) -> str:
     """
     parses html content of email data and appends it to text content and subject conent
 
@@ -65,21 +205,95 @@ def get_email_content(email_data: Dict[str, Any]) -> str:
     Note 2: some automated emails only contain the information about the company in the subject and
         not the email body, so we need to append this to make sure the email processor gets to see it.
 
+    The text is then compacted to settings.EMAIL_MAX_TOKENS (see
+    utils/compaction_utils.py): the two versions are merged, reply quotes,
+    signatures and footers dropped. The result is truncated to max_chars
+    characters (settings.EMAIL_MAX_CHARS by default) in any case.
     """
-    text_content = email_data["subject"]
+    if max_chars is None:
+        max_chars = settings.EMAIL_MAX_CHARS
+    text_content = email_data["text_content"] or ""
+    html_content = ""
+
+    if email_data["html_content"] and len(email_data["subject"]) + len(text_content) < max_chars:
+        html_content = html_to_text(
+            email_data["html_content"], max_chars - len(email_data["subject"]) - len(text_content)
+        )
+
+    text_content = compact_email_text(
+        email_data["subject"], [text_content, html_content], settings.EMAIL_MAX_TOKENS
+    )
+    return text_content[:max_chars]
+
+
+def walk_payload(part: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Yields the parts of a format="full" message payload, depth first."""
+    yield part
+    for sub_part in part.get("parts") or []:
+        yield from walk_payload(sub_part)
+
+
+def is_attachment(part: Dict[str, Any]) -> bool:
+    # Gmail leaves the data of attachments out of format="full" responses
+    return bool(part.get("filename") or part.get("body", {}).get("attachmentId"))
 
-    if email_data["text_content"]:
-        text_content += "\n"
-        text_content += email_data["text_content"]
 
-    if email_data["html_content"]:
-        soup = BeautifulSoup(email_data["html_content"], "html.parser")
-        html_content = soup.get_text(separator=" ", strip=True)
+def decode_part_body(part: Dict[str, Any]) -> str:
+    data = part.get("body", {}).get("data") or ""
+    return base64.urlsafe_b64decode(data.encode("ASCII")).decode(
+        encoding="utf-8", errors="ignore"
+    )
 
-        text_content += "\n"
-        text_content += html_content
 
-    return text_content
+def parse_email_message(message_id: str, message: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Parses a Gmail API message fetched with format="full" into the email data
+    dict consumed by the email processor. Attachments are skipped; their data
+    is not part of the response in the first place.
+    """
+    try:
+        payload = get_email_payload(message)
+        email_data = {
+            "id": message_id,
+            "threadId": message.get("threadId", None),
+            "from": None,
+            "to": None,
+            "subject": None,
+            "date": None,
+            "text_content": None,
+            "html_content": None,
+        }
+
+        # Getting email headers
+        headers = {
+            header["name"].lower(): header["value"] for header in payload.get("headers", [])
+        }
+        email_data["from"] = clean_whitespace(headers.get("from"))
+        email_data["to"] = clean_whitespace(headers.get("to"))
+        email_data["subject"] = clean_whitespace(headers.get("subject"))
+        email_data["date"] = headers.get("date")
+
+        # Extract body of the email: the first plain text and HTML parts,
+        # which belong to the message itself rather than to a forwarded one
+        for part in walk_payload(payload):
+            if is_attachment(part):
+                continue
+            content_type = part.get("mimeType")
+            if content_type == "text/plain" and email_data["text_content"] is None:
+                email_data["text_content"] = decode_part_body(part)
+            elif content_type == "text/html" and email_data["html_content"] is None:
+                email_data["html_content"] = decode_part_body(part)
+            if email_data["text_content"] is not None and email_data["html_content"] is not None:
+                break
+
+        email_data["raw_text_content"] = email_data["text_content"]
+        email_data["text_content"] = get_email_content(email_data)
+
+        return email_data
+
+    except Exception as e:
+        logger.exception(f"Error parsing email with id {message_id}: {e}")
+        return {}
 
 
 def get_email(message_id: str, gmail_instance=None):
@@ -88,77 +302,178 @@ def get_email(message_id: str, gmail_instance=None):
             message = (
                 gmail_instance.users()
                 .messages()
-                .get(userId="me", id=message_id, format="raw")
+                .get(userId="me", id=message_id, format="full")
                 .execute()
             )
-            msg_str = base64.urlsafe_b64decode(message["raw"].encode("ASCII")).decode(
-                "utf-8"
-            )
-            mime_msg = email.message_from_string(msg_str)
-            # logger.info("mime_msg: %s", mime_msg)
-            # logger.info("msg_str: %s", msg_str)
-            email_data = {
-                "id": message_id,
-                "threadId": message.get("threadId", None),
-                "from": None,
-                "to": None,
-                "subject": None,
-                "date": None,
-                "text_content": None,
-                "html_content": None,
-            }
-
-            # Getting email headers
-            email_data["from"] = clean_whitespace(mime_msg.get("From"))
-            email_data["to"] = clean_whitespace(mime_msg.get("To"))
-            email_data["subject"] = clean_whitespace(mime_msg.get("Subject"))
-            email_data["date"] = mime_msg.get("Date")
-
-            # Extract body of the email
-            if mime_msg.is_multipart():
-                for part in mime_msg.walk():
-                    content_type = part.get_content_type()
-                    content_disposition = str(part.get("Content-Disposition"))
-                    if (
-                        content_type == "text/plain"
-                        and "attachment" not in content_disposition
-                    ):
-                        email_data["text_content"] = part.get_payload(
-                            decode=True
-                        ).decode(encoding="utf-8", errors="ignore")
-                    elif (
-                        content_type == "text/html"
-                        and "attachment" not in content_disposition
-                    ):
-                        email_data["html_content"] = part.get_payload(
-                            decode=True
-                        ).decode(encoding="utf-8", errors="ignore")
-            else:
-                content_type = mime_msg.get_content_type()
-                if content_type == "text/plain":
-                    email_data["text_content"] = mime_msg.get_payload(
-                        decode=True
-                    ).decode(encoding="utf-8", errors="ignore")
-                elif content_type == "text/html":
-                    email_data["html_content"] = mime_msg.get_payload(
-                        decode=True
-                    ).decode(encoding="utf-8", errors="ignore")
-
-            email_data["raw_text_content"] = email_data["text_content"]
-            email_data["text_content"] = get_email_content(email_data)
-
-            return email_data
-
         except Exception as e:
             logger.exception(f"Error retrieving email with id {message_id}: {e}")
             return {}
+        return parse_email_message(message_id, message)
     return {}
 
 
-def get_email_ids(query: tuple = None, gmail_instance=None):
-    email_ids = []
-    page_token = None
+def chunk_iterable(items: Iterable, size: int) -> Iterator[list]:
+    """
+    Splits a possibly lazy iterable into lists of at most size items. If the
+    iterable raises, the items read before the error are yielded first.
+    """
+    chunk = []
+    try:
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    except Exception:
+        if chunk:
+            yield chunk
+        raise
+    if chunk:
+        yield chunk
+
+
+def is_retryable_gmail_error(exception: Exception) -> bool:
+    """
+    Rate limit (429) and server side (5xx) errors are worth retrying, as are
+    transport errors that never got an HTTP status. Anything else (e.g. 404 for
+    a message deleted since it was listed) will fail again, so it is not retried.
+    """
+    status = getattr(getattr(exception, "resp", None), "status", None)
+    if status is None:
+        return True
+    return int(status) == 429 or int(status) >= 500
+
 
+def get_response_size(response: Dict[str, Any]) -> int:
+    # the size of the JSON Gmail sent, give or take whitespace
+    return len(json.dumps(response, separators=(",", ":")))
+
+
+def get_messages_batched(
+    message_ids: List[str],
+    gmail_instance,
+    max_retries: int = GMAIL_BATCH_MAX_RETRIES,
+    retry_delay: float = GMAIL_BATCH_RETRY_DELAY,
+    stats: Optional[Dict[str, int]] = None,
+    on_failure: Optional[Callable[[str], None]] = None,
+    **get_params,
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Gets the messages with one Gmail batch HTTP request, passing get_params
+    (e.g. format) to every messages().get(), and yields (id, response) pairs.
+
+    A failure of one message does not affect the others in the batch. Only the
+    sub-requests that failed with a retryable error are sent again, with
+    exponential backoff, up to max_retries times; messages that still fail are
+    logged, counted in the metrics as gmail.fetch_failed, added to
+    stats["failed"] and passed to on_failure one by one. The size of the responses is counted in the metrics as
+    gmail.bytes_downloaded and added to stats["bytes_downloaded"].
+    """
+    pending = list(message_ids)
+    failed = []
+    for attempt in range(max_retries + 1):
+        responses = {}
+        retry_ids = []
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                responses[request_id] = response
+            elif is_retryable_gmail_error(exception):
+                retry_ids.append(request_id)
+            else:
+                logger.error(f"Error retrieving email with id {request_id}: {exception}")
+                failed.append(request_id)
+
+        batch = gmail_instance.new_batch_http_request(callback=callback)
+        for message_id in pending:
+            batch.add(
+                gmail_instance.users().messages().get(userId="me", id=message_id, **get_params),
+                request_id=message_id,
+            )
+        try:
+            batch.execute()
+        except Exception as e:
+            # the batch request itself failed, so none of the callbacks ran
+            logger.warning(f"Gmail batch request failed: {e}")
+            retry_ids = [x for x in pending if x not in responses]
+
+        downloaded = sum(get_response_size(response) for response in responses.values())
+        increment("gmail.bytes_downloaded", downloaded)
+        if stats is not None:
+            stats["bytes_downloaded"] = stats.get("bytes_downloaded", 0) + downloaded
+        for message_id in pending:
+            if message_id in responses:
+                yield message_id, responses[message_id]
+
+        pending = [x for x in pending if x in retry_ids]
+        if not pending:
+            break
+        if attempt < max_retries:
+            delay = retry_delay * 2**attempt
+            logger.warning(
+                f"Retrying {len(pending)} failed Gmail requests in {delay} seconds (attempt {attempt + 1})."
+            )
+            time.sleep(delay)
+
+    for message_id in pending:
+        logger.error(
+            f"Failed to retrieve email with id {message_id} after {max_retries} retries."
+        )
+    failed.extend(pending)
+    if failed:
+        increment("gmail.fetch_failed", len(failed))
+        if stats is not None:
+            stats["failed"] = stats.get("failed", 0) + len(failed)
+        if on_failure is not None:
+            for message_id in failed:
+                on_failure(message_id)
+
+
+def get_emails_batched(
+    message_ids: Iterable[str],
+    gmail_instance=None,
+    batch_size: int = GMAIL_BATCH_SIZE,
+    max_retries: int = GMAIL_BATCH_MAX_RETRIES,
+    retry_delay: float = GMAIL_BATCH_RETRY_DELAY,
+    stats: Optional[Dict[str, int]] = None,
+    on_failure: Optional[Callable[[str], None]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Fetches messages with Gmail batch HTTP requests, batch_size messages per
+    round trip (see get_messages_batched), and yields the parsed email data
+    dicts as each batch completes. message_ids may be a lazy stream; only one
+    batch of it is read at a time.
+
+    Messages that could not be fetched or parsed are counted in
+    stats["failed"] and their ids passed to on_failure.
+    """
+    if not gmail_instance:
+        return
+
+    for chunk in chunk_iterable(message_ids, batch_size):
+        pending = list(dict.fromkeys(chunk))  # drop duplicates, keep order
+        for message_id, message in get_messages_batched(
+            pending, gmail_instance, max_retries, retry_delay, stats, on_failure, format="full"
+        ):
+            email_data = parse_email_message(message_id, message)
+            if email_data:
+                yield email_data
+                continue
+            if stats is not None:
+                stats["failed"] = stats.get("failed", 0) + 1
+            if on_failure is not None:
+                on_failure(message_id)
+
+
+def get_email_id_pages(
+    query: tuple = None, gmail_instance=None, page_token: Optional[str] = None
+) -> Iterator[Tuple[List[Dict[str, str]], Optional[str]]]:
+    """
+    Lists the messages matching query one page at a time, starting at page_token
+    if given. Yields each page of {"id": ..., "threadId": ...} dicts as soon as
+    it is received, together with the token of the page after it (None on the
+    last page).
+    """
     while True:
         response = (
             gmail_instance.users()
@@ -172,13 +487,150 @@ def get_email_ids(query: tuple = None, gmail_instance=None):
             .execute()
         )
 
-        if "messages" in response:
-            email_ids.extend(response["messages"])
-
         page_token = response.get("nextPageToken")
+        yield response.get("messages", []), page_token
+
         if not page_token:
             break
 
+
+class _ShardDone:
+    pass
+
+
+class _ShardError:
+    def __init__(self, exception: BaseException):
+        self.exception = exception
+
+
+def get_email_id_pages_sharded(
+    queries: List[str],
+    gmail_factory: Callable[[], Any],
+    max_workers: int,
+    timings: Optional[List[Dict[str, Any]]] = None,
+) -> Iterator[List[Dict[str, str]]]:
+    """
+    Lists the messages matching any of queries, up to max_workers queries at
+    the same time, each with its own client from gmail_factory since Gmail
+    clients are not thread-safe. Yields pages as they are received, without
+    the messages already yielded for another query.
+
+    The listing time, page and message counts of every query are logged and
+    appended to timings. An error listing any query is re-raised here after
+    the pages received before it, and the other queries are stopped.
+    """
+    pages = queue.Queue(maxsize=2 * max_workers)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def list_shard(shard_number: int, query: str):
+        try:
+            start = time.monotonic()
+            page_count = message_count = 0
+            for page, _ in get_email_id_pages(query=query, gmail_instance=gmail_factory()):
+                if not put(page):
+                    return
+                page_count += 1
+                message_count += len(page)
+            timing = {
+                "shard": shard_number,
+                "pages": page_count,
+                "messages": message_count,
+                "seconds": time.monotonic() - start,
+            }
+            logger.info(
+                f"Listed query shard {shard_number + 1}/{len(queries)}: {message_count} messages "
+                f"in {page_count} pages, {timing['seconds']:.2f}s"
+            )
+            if timings is not None:
+                timings.append(timing)
+            put(_ShardDone())
+        except BaseException as e:
+            put(_ShardError(e))
+
+    increment("gmail.list_shards", len(queries))
+    seen = set()
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gmail-list-shard")
+    try:
+        for shard_number, query in enumerate(queries):
+            executor.submit(list_shard, shard_number, query)
+        remaining = len(queries)
+        while remaining:
+            item = pages.get()
+            if isinstance(item, _ShardDone):
+                remaining -= 1
+                continue
+            if isinstance(item, _ShardError):
+                raise item.exception
+            page = [message for message in item if message["id"] not in seen]
+            seen.update(message["id"] for message in page)
+            yield page
+    finally:
+        stopped.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def get_history_id(gmail_instance) -> Optional[str]:
+    """The mailbox's current history id, or None if it cannot be read."""
+    try:
+        return gmail_instance.users().getProfile(userId="me").execute().get("historyId")
+    except Exception as e:
+        logger.warning(f"Error retrieving the Gmail history id: {e}")
+        return None
+
+
+def get_added_message_ids(
+    start_history_id: str, gmail_instance=None
+) -> Optional[Tuple[List[str], Optional[str]]]:
+    """
+    Lists the ids of the messages added to the mailbox after start_history_id
+    with users.history.list, oldest first, and returns them with the mailbox's
+    current history id. Returns None when start_history_id has expired (Gmail
+    keeps about a week of history), in which case a full sync is needed.
+    """
+    message_ids = {}  # ordered set
+    history_id = None
+    page_token = None
+    while True:
+        try:
+            response = (
+                gmail_instance.users()
+                .history()
+                .list(
+                    userId="me",
+                    startHistoryId=start_history_id,
+                    historyTypes=["messageAdded"],
+                    pageToken=page_token,
+                )
+                .execute()
+            )
+        except HttpError as e:
+            if int(e.resp.status) == 404:
+                logger.info(f"Gmail history id {start_history_id} has expired")
+                return None
+            raise
+
+        for record in response.get("history", []):
+            for added in record.get("messagesAdded", []):
+                message_ids[added["message"]["id"]] = None
+        history_id = response.get("historyId", history_id)
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            return list(message_ids), history_id
+
+
+def get_email_ids(query: tuple = None, gmail_instance=None):
+    email_ids = []
+    for page, _ in get_email_id_pages(query=query, gmail_instance=gmail_instance):
+        email_ids.extend(page)
     return email_ids
 
 
@@ -0,0 +1,130 @@
+"""
+Encoders for the exports of a user's emails (routes/file_routes.py). Each
+takes the rows in batches, as db.utils.user_email_utils.iter_user_email_rows
+reads them, and yields the encoded file a chunk per batch, so an export of
+any size is sent without being held in memory or written to disk.
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, Literal, Sequence
+
+import pyarrow
+import pyarrow.parquet
+
+# Key: DB field name; Value: Human-readable field name
+EXPORT_FIELDS = {
+    "company_name": "Company Name",
+    "application_status": "Application Status",
+    "received_at": "Received At",
+    "job_title": "Job Title",
+    "subject": "Subject",
+    "email_from": "Sender",
+}
+
+ExportFormat = Literal["csv", "csv.gz", "ndjson", "ndjson.gz", "parquet"]
+Batches = Iterable[Sequence[tuple]]
+
+
+def encode_csv(batches: Batches) -> Iterator[bytes]:
+    """A header row with the human-readable field names, then the rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS.values())
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    # the header alone if there are no rows
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def encode_ndjson(batches: Batches) -> Iterator[bytes]:
+    """A JSON object per line, keyed by DB field name, dates in ISO 8601."""
+    for batch in batches:
+        lines = (
+            json.dumps(
+                {
+                    field: value.isoformat() if isinstance(value, datetime) else value
+                    for field, value in zip(EXPORT_FIELDS, row)
+                }
+            )
+            + "\n"
+            for row in batch
+        )
+        yield "".join(lines).encode("utf-8")
+
+
+class ChunkedOutput:
+    """A write-only file whose contents are taken out as they are written."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def encode_parquet(batches: Batches) -> Iterator[bytes]:
+    """A Parquet file with a row group per batch, columns named by DB field name."""
+    schema = pyarrow.schema(
+        [
+            (field, pyarrow.timestamp("us") if field == "received_at" else pyarrow.string())
+            for field in EXPORT_FIELDS
+        ]
+    )
+    output = ChunkedOutput()
+    with pyarrow.parquet.ParquetWriter(output, schema) as writer:
+        for batch in batches:
+            columns = zip(*batch)
+            writer.write_table(pyarrow.Table.from_arrays([list(column) for column in columns], schema=schema))
+            yield output.take()
+    yield output.take()
+
+
+def gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """chunks compressed as one gzip file."""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)  # gzip header and trailer
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def encode_gzipped(encode: Callable[[Batches], Iterator[bytes]]) -> Callable[[Batches], Iterator[bytes]]:
+    return lambda batches: gzip_chunks(encode(batches))
+
+
+# format -> (media type, encoder)
+EXPORT_FORMATS: Dict[ExportFormat, tuple] = {
+    "csv": ("text/csv", encode_csv),
+    "csv.gz": ("application/gzip", encode_gzipped(encode_csv)),
+    "ndjson": ("application/x-ndjson", encode_ndjson),
+    "ndjson.gz": ("application/gzip", encode_gzipped(encode_ndjson)),
+    "parquet": ("application/vnd.apache.parquet", encode_parquet),
+}
@@ -1,5 +1,20 @@
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
 import yaml
 
+logger = logging.getLogger(__name__)
+
+FILTER_FIELDS = ("subject", "from", "body")
+
+# Drafts and messages the user sent (unless also delivered to their own inbox)
+# are not responses to an application, so they are not even listed.
+EXCLUDED_MESSAGES_QUERY = "-in:drafts AND (in:inbox OR -in:sent)"
+
 
 def parse_simple(term: str, field: str, exclude: bool = False) -> str:
     """
@@ -53,10 +68,64 @@ def parse_wildcard(term: str, field: str, exclude: bool = False) -> str:
     return out_str
 
 
-def parse_base_filter_config(filter_path: str) -> str:
+def load_filter_config(filter_path: str) -> Any:
     with open(filter_path, "r") as fid:
-        data = yaml.safe_load(fid)
+        return yaml.safe_load(fid)
+
+
+def validate_base_filter_config(data: Any, filter_path: str = "filter") -> List[Dict[str, Any]]:
+    """
+    Checks the blocks of a base filter config and raises ValueError for the
+    first one that would produce a wrong query: include blocks use "any"
+    logic, exclude blocks use "all" logic and contain no wildcards.
+    """
+    if not isinstance(data, list) or not data:
+        raise ValueError(f"{filter_path}: expected a list of filter blocks")
+    for idx, block in enumerate(data):
+        where = f"{filter_path}: block {idx}"
+        if not isinstance(block, dict):
+            raise ValueError(f"{where}: expected a mapping")
+        if block.get("field") not in FILTER_FIELDS:
+            raise ValueError(f"{where}: field must be one of {FILTER_FIELDS}")
+        if (block.get("logic"), block.get("how")) not in (("any", "include"), ("all", "exclude")):
+            raise ValueError(f"{where}: logic/how must be any/include or all/exclude")
+        terms = block.get("terms")
+        if not isinstance(terms, list) or not all(isinstance(x, str) and x for x in terms):
+            raise ValueError(f"{where}: terms must be a list of strings")
+        if block["how"] == "exclude" and any("*" in x for x in terms):
+            raise ValueError(f"{where}: wildcards are not allowed in exclude blocks")
+    return data
+
+
+def validate_override_filter_config(data: Any, filter_path: str = "filter") -> List[List[Dict[str, Any]]]:
+    """
+    Checks an override filter config: a list of overrides, each a list of
+    blocks with a field and include_terms/exclude_terms without wildcards.
+    An empty config has no overrides.
+    """
+    if data is None:
+        return []
+    if not isinstance(data, list):
+        raise ValueError(f"{filter_path}: expected a list of overrides")
+    for idx, override in enumerate(data):
+        where = f"{filter_path}: override {idx}"
+        if not isinstance(override, list):
+            raise ValueError(f"{where}: expected a list of blocks")
+        for block in override:
+            if not isinstance(block, dict) or block.get("field") not in FILTER_FIELDS:
+                raise ValueError(f"{where}: field must be one of {FILTER_FIELDS}")
+            for key in ("include_terms", "exclude_terms"):
+                terms = block.get(key)
+                if terms is None:
+                    continue
+                if not isinstance(terms, list) or not all(isinstance(x, str) and x for x in terms):
+                    raise ValueError(f"{where}: {key} must be a list of strings")
+                if any("*" in x for x in terms):
+                    raise ValueError(f"{where}: wildcards are not allowed in overrides")
+    return data
 
+
+def build_base_filter_query(data: List[Dict[str, Any]]) -> str:
     filter_str = ""
     for block in data:
         sub_filter_str = ""
@@ -99,34 +168,175 @@ def parse_base_filter_config(filter_path: str) -> str:
     return filter_str
 
 
-def parse_override_filter_config(filter_path: str):
-    """not implemented"""
-    with open(filter_path, "r") as fid:
-        data = yaml.safe_load(fid)
-
+def build_override_filter_query(data: List[List[Dict[str, Any]]]) -> str:
     filter_str_list = []
     for block in data:
         simple_filters = []
         for sub_block in block:
-            include_terms = sub_block["include_terms"]
-            exclude_terms = sub_block["exclude_terms"]
+            include_terms = sub_block.get("include_terms")
+            exclude_terms = sub_block.get("exclude_terms")
 
             # parse each item based on schema logic
             if include_terms is not None:
                 simple_filters += [
                     parse_simple(x, sub_block["field"], exclude=False)
-                    for x in sub_block["include_terms"]
+                    for x in include_terms
                 ]
             if exclude_terms is not None:
                 simple_filters += [
                     parse_simple(x, sub_block["field"], exclude=True)
-                    for x in sub_block["exclude_terms"]
+                    for x in exclude_terms
                 ]
 
         # join with an AND operator
         if simple_filters:
             filter_str_list.append("(" + " AND ".join(simple_filters) + ")")
 
+    if not filter_str_list:
+        return ""
     filter_str = "(" + " OR ".join(filter_str_list) + ")"
 
     return filter_str
+
+
+def parse_base_filter_config(filter_path: str) -> str:
+    data = load_filter_config(filter_path)
+    return build_base_filter_query(validate_base_filter_config(data, str(filter_path)))
+
+
+def parse_override_filter_config(filter_path: str) -> str:
+    data = load_filter_config(filter_path)
+    return build_override_filter_query(validate_override_filter_config(data, str(filter_path)))
+
+
+def get_file_version(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+@dataclass(frozen=True)
+class CompiledFilter:
+    """
+    A filter config compiled into its Gmail query, for the version (mtime and
+    size) of the files it was compiled from. See compile_filter.
+    """
+
+    filter_path: str
+    override_path: Optional[str]
+    version: Tuple[Tuple[int, int], ...]
+    base_query: str
+    override_query: Optional[str] = None
+    # the validated blocks of the base config, to shard the query by
+    base_blocks: Tuple[Dict[str, Any], ...] = field(default=(), compare=False, repr=False)
+
+    @property
+    def filter_query(self) -> str:
+        """The base query, or'ed with the overrides that force-include emails."""
+        if self.override_query:
+            return f"{self.base_query} OR {self.override_query}"
+        return self.base_query
+
+    def query(self, start_date: str, after_timestamp: Optional[int] = None) -> str:
+        return render_query(self, start_date, after_timestamp)
+
+    def shard_queries(
+        self, start_date: str, after_timestamp: Optional[int] = None, max_length: Optional[int] = None
+    ) -> Tuple[str, ...]:
+        return render_shard_queries(self, start_date, after_timestamp, max_length)
+
+
+def format_query(start_date: str, after_timestamp: Optional[int], filter_query: str) -> str:
+    query = f"after:{start_date} AND ({filter_query}) AND {EXCLUDED_MESSAGES_QUERY}"
+    if after_timestamp is not None:
+        query += f" after:{after_timestamp}"
+    return query
+
+
+@lru_cache(maxsize=1024)
+def render_query(compiled: CompiledFilter, start_date: str, after_timestamp: Optional[int] = None) -> str:
+    """
+    The full Gmail query for emails after start_date (YYYY/MM/DD) and, if
+    given, after a unix timestamp. Cached per compiled filter, so a reload
+    never serves a query built from the old config.
+    """
+    return format_query(start_date, after_timestamp, compiled.filter_query)
+
+
+@lru_cache(maxsize=256)
+def render_shard_queries(
+    compiled: CompiledFilter,
+    start_date: str,
+    after_timestamp: Optional[int] = None,
+    max_length: Optional[int] = None,
+) -> Tuple[str, ...]:
+    """
+    The full query split into smaller ones that together match the same
+    emails, so they can be listed at the same time: one per include block,
+    each with all the exclude blocks, and one for the overrides. Include
+    blocks are split further by their terms where the query would be longer
+    than max_length.
+    """
+    excludes = [block for block in compiled.base_blocks if block["how"] == "exclude"]
+
+    def render(block: Dict[str, Any], terms: List[str]) -> str:
+        filter_query = build_base_filter_query([{**block, "terms": terms}] + excludes)
+        return format_query(start_date, after_timestamp, filter_query)
+
+    queries = []
+    for block in compiled.base_blocks:
+        if block["how"] != "include":
+            continue
+        terms = []
+        for term in block["terms"]:
+            if terms and max_length and len(render(block, terms + [term])) > max_length:
+                queries.append(render(block, terms))
+                terms = []
+            terms.append(term)
+        if terms:
+            queries.append(render(block, terms))
+    if compiled.override_query:
+        queries.append(format_query(start_date, after_timestamp, compiled.override_query))
+    return tuple(queries)
+
+
+_compiled_filters: Dict[Tuple[str, Optional[str]], CompiledFilter] = {}
+_compiled_filters_lock = threading.Lock()
+
+
+def compile_filter(filter_path: str, override_path: Optional[str] = None) -> CompiledFilter:
+    """
+    Returns the compiled filter for a base config, merged with an override
+    config if given. The YAML is only read and parsed again when one of the
+    files changed, so edits are picked up without a restart.
+
+    An edit that doesn't validate is logged and the previous version kept
+    serving; a config that never compiled raises ValueError.
+    """
+    key = (str(filter_path), str(override_path) if override_path else None)
+    version = tuple(get_file_version(path) for path in key if path)
+    with _compiled_filters_lock:
+        compiled = _compiled_filters.get(key)
+    if compiled is not None and compiled.version == version:
+        return compiled
+
+    try:
+        base_blocks = validate_base_filter_config(load_filter_config(key[0]), key[0])
+        new_compiled = CompiledFilter(
+            filter_path=key[0],
+            override_path=key[1],
+            version=version,
+            base_query=build_base_filter_query(base_blocks),
+            override_query=parse_override_filter_config(key[1]) if key[1] else None,
+            base_blocks=tuple(base_blocks),
+        )
+    except (ValueError, yaml.YAMLError) as e:
+        if compiled is None:
+            raise
+        logger.error(f"Keeping the previous version of {key[0]}, the changed filter is invalid: {e}")
+        return compiled
+
+    if compiled is not None:
+        logger.info(f"Reloaded email filter {key[0]}")
+    with _compiled_filters_lock:
+        _compiled_filters[key] = new_compiled
+    return new_compiled
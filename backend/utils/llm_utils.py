@@ -1,10 +1,17 @@
 import google.generativeai as genai
+import threading
 import time
 import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 from google.ai.generativelanguage_v1beta2 import GenerateTextResponse
 import logging
 
 from utils.config_utils import get_settings
+from utils.preclassifier_utils import preclassify_emails
+from utils.scheduler_utils import FairScheduler
 
 settings = get_settings()
 
@@ -20,45 +27,115 @@ logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
-def process_email(email_text):
-    prompt = f"""
-        Extract the company name, job application status, and job title (role) from the following email. 
+RATE_LIMIT_BACKOFF_SECONDS = 60  # pause after a 429, doubled on each retry
+
+
+class RateLimitError(Exception):
+    """The model kept answering 429 after every retry."""
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every thread calling the model, so that concurrent
+    workers together stay under the Gemini requests-per-minute quota.
+
+    acquire() blocks until a request may be sent. backoff() is called when the
+    API answers 429 anyway: it empties the bucket and holds back all callers,
+    not only the one that hit the limit.
+    """
+
+    def __init__(self, requests_per_minute: int, burst: Optional[int] = None):
+        self.rate = requests_per_minute / 60  # tokens per second
+        self.capacity = burst or max(1, requests_per_minute // 10)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    elapsed = now - self.updated
+                    self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = self.paused_until - now
+            time.sleep(wait)
+
+    def backoff(self, seconds: float) -> None:
+        with self.lock:
+            self.tokens = 0
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.updated = self.paused_until
+
+
+rate_limiter = RateLimiter(settings.LLM_REQUESTS_PER_MINUTE)
+# shared by all ingestion runs in the process, so users take turns on the model
+llm_scheduler = FairScheduler(settings.LLM_MAX_WORKERS, name="llm")
+
+
+# Bump whenever the prompts change, so results cached under the old prompts are not reused.
+PROMPT_VERSION = "1"
+
+# Shared by the single and the batch prompt, so both classify emails the same way.
+PROMPT_INSTRUCTIONS = """
         Job application status can be a value from the following list:
         ["rejected", "no response", "request for availability", "interview scheduled", "offer"]
         Note that "no response" means that there is only a neutral, automated or human confirmation of the application being received.
         Note that "interview scheduled" implies a calendar invite with a meeting date and time has been sent.
         Note that "request for availability" implies waiting on the candidate to provide their availability.
         Note that job_title is the role that the user is applying for Ex: "Software Engineer", "Product Engineer", "Data Analyst"
-        Provide the output in JSON format, for example:  "company_name": "company_name", "application_status": "status", "job_title": "job_title"
-        Remove backticks. Only use double quotes. Enclose key and value pairs in a single pair of curly braces.
-        If the email is obviously not related to a job application, return an empty pair of curly braces like this {{}}
-        Email: {email_text}
+"""
+
+RESULT_KEYS = ("company_name", "application_status", "job_title")
+
+# Emails packed into one batch prompt are capped by count and by total length,
+# so a few long HTML-derived bodies cannot blow up the prompt.
+BATCH_MAX_EMAILS = 10
+BATCH_MAX_CHARS = 20000
+
+
+def parse_model_response(response_text: str):
+    """
+    Parses the JSON the model returned, tolerating markdown code fences and,
+    as a last resort, single quoted keys and values.
     """
+    cleaned_response_json = (
+        response_text.replace("`", "").strip().removeprefix("json").strip()
+    )
+    try:
+        return json.loads(cleaned_response_json)
+    except json.JSONDecodeError:
+        return json.loads(cleaned_response_json.replace("'", '"'))
 
+
+def generate_json(prompt: str):
+    """
+    Sends the prompt to the model under the shared rate limit and returns the
+    parsed JSON response, or None if the model could not produce one.
+
+    A prompt that hits the rate limit is queued again behind the limiter,
+    which holds back every caller meanwhile; RateLimitError is raised if it
+    is still limited after the retries.
+    """
     retries = 3  # Max retries
-    delay = 60  # Initial delay
+    delay = RATE_LIMIT_BACKOFF_SECONDS  # Initial delay
     for attempt in range(retries):
         try:
+            rate_limiter.acquire()
             logger.info("Calling generate_content")
             response: GenerateTextResponse = model.generate_content(prompt)
             response.resolve()
             response_json: str = response.text
             logger.info("Received response from model: %s", response_json)
             if response_json:
-                cleaned_response_json = (
-                    response_json.replace("json", "")
-                    .replace("`", "")
-                    .replace("'", '"')
-                    .strip()
-                )
-                cleaned_response_json = (
-                    response_json.replace("json", "")
-                    .replace("`", "")
-                    .replace("'", '"')
-                    .strip()
-                )
-                logger.info("Cleaned response: %s", cleaned_response_json)
-                return json.loads(cleaned_response_json)
+                return parse_model_response(response_json)
             else:
                 logger.error("Empty response received from the model.")
                 return None
@@ -67,10 +144,204 @@ def process_email(email_text):
                 logger.warning(
                     f"Rate limit hit. Retrying in {delay} seconds (attempt {attempt + 1})."
                 )
-                time.sleep(delay)
+                rate_limiter.backoff(delay)
+                delay *= 2
             else:
-                logger.error(f"process_email exception: {e}")
+                logger.error(f"generate_json exception: {e}")
                 return None
-    logger.error(f"Failed to process email after {retries} attempts.")
-    return None
+    logger.error(f"Failed to get a response after {retries} attempts.")
+    raise RateLimitError(f"Still rate limited after {retries} attempts")
+
 
+def process_email(email_text):
+    prompt = f"""
+        Extract the company name, job application status, and job title (role) from the following email. 
+        {PROMPT_INSTRUCTIONS}
+        Provide the output in JSON format, for example:  "company_name": "company_name", "application_status": "status", "job_title": "job_title"
+        Remove backticks. Only use double quotes. Enclose key and value pairs in a single pair of curly braces.
+        If the email is obviously not related to a job application, return an empty pair of curly braces like this {{}}
+        Email: {email_text}
+    """
+    return generate_json(prompt)
+
+
+def batch_emails(
+    emails: Iterable[Dict[str, Any]],
+    max_batch_size: int = BATCH_MAX_EMAILS,
+    max_chars: int = BATCH_MAX_CHARS,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Groups a stream of emails into lists of at most max_batch_size emails whose
+    text_content adds up to at most max_chars. An email longer than max_chars
+    on its own gets a batch to itself. If the stream raises, the emails read
+    before the error are yielded first.
+    """
+    batch = []
+    batch_chars = 0
+    try:
+        for email_data in emails:
+            email_chars = len(email_data["text_content"] or "")
+            if batch and (
+                len(batch) >= max_batch_size or batch_chars + email_chars > max_chars
+            ):
+                yield batch
+                batch = []
+                batch_chars = 0
+            batch.append(email_data)
+            batch_chars += email_chars
+    except Exception:
+        # hand over the emails read before the stream failed
+        if batch:
+            yield batch
+        raise
+    if batch:
+        yield batch
+
+
+def is_valid_batch_result(result) -> bool:
+    """
+    A batch result is either just the id, for an email unrelated to a job
+    application, or the id plus a string for every key in RESULT_KEYS.
+    """
+    if not isinstance(result, dict) or "id" not in result:
+        return False
+    fields = {key: value for key, value in result.items() if key != "id"}
+    if not fields:
+        return True
+    return all(isinstance(fields.get(key), str) for key in RESULT_KEYS)
+
+
+def process_emails_batch(emails: List[Dict[str, Any]]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Classifies several emails with a single prompt and returns the results keyed
+    by email id. Emails whose result is missing from the response or malformed
+    are classified again one by one with process_email.
+
+    A rate limited batch is not split into single emails, which would multiply
+    the requests just as the API asks for fewer: RateLimitError is passed on,
+    failing the run, which resumes from its checkpoint.
+    """
+    if len(emails) == 1:
+        return {emails[0]["id"]: process_email(emails[0]["text_content"])}
+
+    email_blocks = "\n".join(
+        f"Email id: {email_data['id']}\n{email_data['text_content']}\nEnd of email id: {email_data['id']}"
+        for email_data in emails
+    )
+    prompt = f"""
+        For each of the following {len(emails)} emails, extract the company name, job application status, and job title (role).
+        {PROMPT_INSTRUCTIONS}
+        Provide the output as a JSON array with one object per email, for example:
+        [{{"id": "email id", "company_name": "company_name", "application_status": "status", "job_title": "job_title"}}]
+        Remove backticks. Only use double quotes. Copy each email id exactly as given.
+        If an email is obviously not related to a job application, return an object with only its id like this {{"id": "email id"}}
+        {email_blocks}
+    """
+
+    response = generate_json(prompt)
+    results = {}
+    if isinstance(response, list):
+        email_ids = {email_data["id"] for email_data in emails}
+        for result in response:
+            if is_valid_batch_result(result) and str(result["id"]) in email_ids:
+                email_id = str(result.pop("id"))
+                results[email_id] = result
+    else:
+        logger.error("Batch response is not a JSON array, falling back to single emails.")
+
+    for email_data in emails:
+        if email_data["id"] not in results:
+            logger.warning(
+                f"No valid batch result for email id {email_data['id']}, classifying it on its own."
+            )
+            results[email_data["id"]] = process_email(email_data["text_content"])
+    return results
+
+
+def classify_batch(
+    emails: List[Dict[str, Any]], cache=None
+) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Classifies a batch of emails as cheaply as possible: obvious emails are
+    resolved by the rule based preclassifier, then emails whose text is in the
+    cache reuse the cached result, and only the rest go to the model with
+    process_emails_batch. New model results are added to the cache.
+    cache is expected to behave like db.utils.llm_cache_utils.ExtractionCache.
+    """
+    results = preclassify_emails(emails)
+    remaining = [email_data for email_data in emails if email_data["id"] not in results]
+
+    if cache is not None and remaining:
+        cached = cache.get_many(email_data["text_content"] for email_data in remaining)
+        for email_data in remaining:
+            if email_data["text_content"] in cached:
+                results[email_data["id"]] = cached[email_data["text_content"]]
+        remaining = [email_data for email_data in remaining if email_data["id"] not in results]
+
+    if remaining:
+        new_results = process_emails_batch(remaining)
+        if cache is not None:
+            cache.put_many(
+                {email_data["text_content"]: new_results.get(email_data["id"]) for email_data in remaining}
+            )
+        results.update(new_results)
+    return results
+
+
+def classify_emails(
+    emails: Iterable[Dict[str, Any]],
+    max_workers: int = settings.LLM_MAX_WORKERS,
+    max_batch_size: int = BATCH_MAX_EMAILS,
+    cache=None,
+    scheduler: Optional[FairScheduler] = None,
+    tenant: str = "",
+    incremental: bool = False,
+) -> Iterator[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]:
+    """
+    Classifies emails in batches (see batch_emails), running up to max_workers
+    batches at a time, and yields (email_data, result) pairs in the same order
+    the emails came in. See classify_batch for how the model is avoided.
+
+    With a scheduler, the batches run on its threads as work of tenant (the
+    user), taking turns with other users' batches; incremental marks a small
+    sync to be served ahead of backfills. Otherwise they run on a thread pool
+    of their own.
+
+    emails may be a lazy stream; at most 2 * max_workers batches are read
+    ahead of the caller, so memory stays bounded however many are passed.
+    """
+    def batch_results(batch, future):
+        results = future.result()
+        for email_data in batch:
+            yield email_data, results.get(email_data["id"])
+
+    with ExitStack() as stack:
+        if scheduler is None:
+            executor = stack.enter_context(
+                ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+            )
+            submit = executor.submit
+        else:
+            def submit(fn, batch, cache):
+                return scheduler.submit(
+                    tenant, fn, batch, cache, cost=len(batch), incremental=incremental
+                )
+        in_flight = deque()
+        upstream_error = None
+        try:
+            try:
+                for batch in batch_emails(emails, max_batch_size=max_batch_size):
+                    in_flight.append((batch, submit(classify_batch, batch, cache)))
+                    if len(in_flight) >= 2 * max_workers:
+                        yield from batch_results(*in_flight.popleft())
+            except Exception as e:
+                # finish the batches already submitted before passing the error on
+                upstream_error = e
+            while in_flight:
+                yield from batch_results(*in_flight.popleft())
+            if upstream_error:
+                raise upstream_error
+        finally:
+            # the caller stopped early: drop the batches that have not started
+            for _, future in in_flight:
+                future.cancel()
@@ -0,0 +1,23 @@
+import threading
+from collections import defaultdict
+from typing import Dict
+
+# Process wide counters, e.g. LLM cache hits, read through the /metrics route.
+# They reset when the process restarts.
+_counters: Dict[str, int] = defaultdict(int)
+_lock = threading.Lock()
+
+
+def increment(name: str, value: int = 1) -> None:
+    with _lock:
+        _counters[name] += value
+
+
+def get_metrics() -> Dict[str, int]:
+    with _lock:
+        return dict(_counters)
+
+
+def reset_metrics() -> None:
+    with _lock:
+        _counters.clear()
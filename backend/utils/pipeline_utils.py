@@ -0,0 +1,60 @@
+import queue
+import threading
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+class _StageError:
+    def __init__(self, exception: BaseException):
+        self.exception = exception
+
+
+def run_in_thread(iterable: Iterable[T], maxsize: int, name: str = None) -> Iterator[T]:
+    """
+    Consumes iterable in a background thread and yields its items through a
+    queue holding at most maxsize items, so a slow consumer applies
+    backpressure to the producer instead of letting items pile up in memory.
+
+    Chaining these turns a series of generators into a pipeline whose stages
+    run at the same time. An exception raised by the producer is re-raised in
+    the consumer after the items produced before it. If the consumer stops
+    early, the producer is stopped at its next item.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(_StageError(e))
+        finally:
+            put(_DONE)
+
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _StageError):
+                raise item.exception
+            yield item
+    finally:
+        stopped.set()
+        thread.join()
@@ -0,0 +1,134 @@
+"""
+Rule based classification of job application emails that are obvious enough
+not to need the LLM, mostly automated "thank you for applying" confirmations
+and plain rejections. Anything the rules are not sure about returns None and
+is escalated to the LLM.
+"""
+
+import email.utils
+import logging
+import re
+from typing import Any, Dict, Optional
+
+from utils.email_utils import (
+    get_email_domain_from_address,
+    is_automated_email,
+    is_generic_email_domain,
+)
+from utils.metrics_utils import increment
+
+logger = logging.getLogger(__name__)
+
+# Anything hinting at progress past the application stage is left to the LLM.
+ESCALATE_PATTERN = re.compile(
+    r"\binterview|\bavailab|\boffer\b|\bschedul|\bcalendly\b|\bassessment|"
+    r"\bphone screen|\bcoding (challenge|test|exercise)|\btake[- ]home\b",
+    re.IGNORECASE,
+)
+# "unfortunately" alone also opens "we cannot respond to every applicant" in
+# confirmations, so it only counts with a rejection in the same sentence.
+REJECTED_PATTERN = re.compile(
+    r"\bunfortunately\b[^.!?\n]*?\b(not (been |be )?(selected|successful|chosen|moving|progressing|proceeding)|"
+    r"not able to (move|proceed|progress)|unsuccessful|other (candidates|applicants)|"
+    r"no longer (being )?consider|decided not to)|"
+    r"\bnot (be )?(moving|move|to move) forward\b|"
+    r"\b(decided|chosen|elected) to (pursue|proceed|move forward) with other\b|"
+    r"\b(position|role) has (already )?been filled\b|\bnot been selected\b|"
+    r"\bwill not be progressing\b",
+    re.IGNORECASE,
+)
+CONFIRMATION_PATTERN = re.compile(
+    r"\bthank(s| you) for (your )?(applying|application|interest)\b|"
+    r"\b(we('ve| have)|has been) received your application\b|"
+    r"\bapplication (has been |was )?(received|submitted)\b",
+    re.IGNORECASE,
+)
+
+# Names are matched case sensitively and have to start with a capital letter.
+# Dots are only allowed inside a word (e.g. Booking.com), so a name ends at a full stop.
+WORD_TAIL = r"[\w&'\-]*(?:\.\w+)*"
+NAME = rf"[A-Z]{WORD_TAIL}(?: [A-Z0-9&]{WORD_TAIL})*"
+COMPANY_PATTERNS = [
+    re.compile(rf"\b(?:position|role|opening|job|opportunity) (?:at|with) (?P<company>{NAME})"),
+    re.compile(rf"\b(?:applying|application|applied|interest) (?:to|at|with|in) (?P<company>{NAME})"),
+    re.compile(rf"\b(?:careers|recruiting|talent|hiring) (?:at|with) (?P<company>{NAME})"),
+]
+TITLE_PATTERNS = [
+    re.compile(rf"\b[Tt]he (?P<title>{NAME}) (?:position|role|opening|job)\b"),
+    re.compile(rf"\b(?:position|role) of (?P<title>{NAME})"),
+    re.compile(rf"\bapplication (?:for|to) (?P<title>{NAME}) at\b"),
+]
+NOT_A_NAME = {"The", "Our", "Your", "This", "We", "Us", "Team"}
+
+
+def get_sender_domain(from_header: str) -> str:
+    _, address = email.utils.parseaddr(from_header or "")
+    return get_email_domain_from_address(address.lower())
+
+
+def is_automated_sender(from_header: str) -> bool:
+    _, address = email.utils.parseaddr(from_header or "")
+    return is_automated_email(address) or is_generic_email_domain(
+        get_sender_domain(from_header)
+    )
+
+
+def extract_first(patterns, group: str, *texts: str) -> str:
+    for text in texts:
+        for pattern in patterns:
+            match = pattern.search(text or "")
+            if match and match.group(group) not in NOT_A_NAME:
+                return match.group(group).strip(" .'-")
+    return ""
+
+
+def preclassify_email(email_data: Dict[str, Any]) -> Optional[Dict[str, str]]:
+    """
+    Returns the company_name, application_status and job_title of an obvious
+    confirmation or rejection email, or None to leave it to the LLM.
+
+    Confirmations only count when they come from an automated sender or an ATS
+    domain, since a person writing "thanks for applying" usually says more.
+    An email is only resolved when the company name can be extracted too.
+    """
+    subject = email_data.get("subject") or ""
+    text = email_data.get("text_content") or subject
+    if ESCALATE_PATTERN.search(text):
+        return None
+
+    if REJECTED_PATTERN.search(text):
+        status = "rejected"
+    elif CONFIRMATION_PATTERN.search(text) and is_automated_sender(email_data.get("from")):
+        status = "no response"
+    else:
+        return None
+
+    # names are taken from the subject or the plain text body only: the text
+    # derived from HTML runs separate lines together, so names could run on
+    body = email_data.get("raw_text_content") or ""
+    company_name = extract_first(COMPANY_PATTERNS, "company", subject, body)
+    if not company_name:
+        return None
+    job_title = extract_first(TITLE_PATTERNS, "title", subject, body)
+
+    return {
+        "company_name": company_name,
+        "application_status": status,
+        "job_title": job_title or "unknown",
+    }
+
+
+def preclassify_emails(emails) -> Dict[str, Dict[str, str]]:
+    """
+    Runs preclassify_email on every email and returns the resolved results keyed
+    by email id. Counts resolved and escalated emails in the metrics as
+    preclassifier.*.
+    """
+    results = {}
+    for email_data in emails:
+        result = preclassify_email(email_data)
+        if result is not None:
+            results[email_data["id"]] = result
+    increment("preclassifier.resolved", len(results))
+    increment("preclassifier.escalated", len(emails) - len(results))
+    return results
@@ -0,0 +1,229 @@
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import sqlalchemy as sa
+from cachetools import TTLCache
+
+from db.processing_tasks import STARTED
+
+logger = logging.getLogger(__name__)
+
+# Live progress of the ingestion runs, keyed by user id, so /processing can
+# answer without reading processing_task_runs. Runs in other processes (the
+# workers) notify theirs on PROGRESS_CHANNEL, which a ProgressListener in the
+# web process publishes here. Entries expire an hour after their last update.
+PROGRESS_TTL_SECONDS = 60 * 60
+_progress: TTLCache = TTLCache(maxsize=10000, ttl=PROGRESS_TTL_SECONDS)
+_lock = threading.Lock()
+# queues of the progress streams open for each user, see subscribe()
+_subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = defaultdict(list)
+
+# progress is written to processing_task_runs after this many emails or seconds
+PROGRESS_SAVE_EVERY_EMAILS = 100
+PROGRESS_SAVE_EVERY_SECONDS = 10
+# Postgres channel the runs notify their progress on, at most once a second
+PROGRESS_CHANNEL = "ingestion_progress"
+PROGRESS_NOTIFY_EVERY_SECONDS = 1
+PROGRESS_LISTEN_POLL_SECONDS = 5
+
+
+def publish_progress(user_id: str, status: str, processed_emails: int, total_emails: int) -> None:
+    progress = {
+        "status": status,
+        "processed_emails": processed_emails,
+        "total_emails": total_emails,
+    }
+    with _lock:
+        _progress[user_id] = progress
+        subscribers = list(_subscribers.get(user_id, ()))
+    for loop, updates in subscribers:
+        try:
+            loop.call_soon_threadsafe(_offer, updates, dict(progress))
+        except RuntimeError:
+            # the loop of a stream that was not unsubscribed has been closed
+            pass
+
+
+def _offer(updates: asyncio.Queue, progress: Dict) -> None:
+    # a slow stream only needs the latest progress, older updates are dropped
+    if updates.full():
+        updates.get_nowait()
+    updates.put_nowait(progress)
+
+
+def subscribe(user_id: str) -> asyncio.Queue:
+    """
+    Returns a queue receiving the progress published for user_id from now on,
+    for use on the running event loop. Pass it to unsubscribe() when done.
+    """
+    updates = asyncio.Queue(maxsize=1)
+    with _lock:
+        _subscribers[user_id].append((asyncio.get_running_loop(), updates))
+    return updates
+
+
+def unsubscribe(user_id: str, updates: asyncio.Queue) -> None:
+    with _lock:
+        _subscribers[user_id] = [x for x in _subscribers[user_id] if x[1] is not updates]
+        if not _subscribers[user_id]:
+            del _subscribers[user_id]
+
+
+def get_progress(user_id: str) -> Optional[Dict]:
+    with _lock:
+        progress = _progress.get(user_id)
+        return dict(progress) if progress else None
+
+
+def notify_progress(engine, user_id: str, progress: Dict) -> None:
+    """
+    Sends the progress to the processes listening on PROGRESS_CHANNEL, on a
+    connection of its own so it is not held back until the run commits.
+    """
+    try:
+        with engine.connect() as connection:
+            connection.execute(
+                sa.text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": PROGRESS_CHANNEL, "payload": json.dumps({"user_id": user_id, **progress})},
+            )
+            connection.commit()
+    except Exception as e:
+        # progress is also saved to processing_task_runs, a lost notification only delays it
+        logger.warning(f"user_id:{user_id} could not notify progress: {e}")
+
+
+class ProgressListener:
+    """
+    Publishes in this process the progress notified on PROGRESS_CHANNEL by
+    runs in other processes, so the progress streams of the web process get
+    the workers' progress pushed to them. Listens on a connection of its own,
+    in a thread, reconnecting if the connection is lost.
+    """
+
+    def __init__(self, engine, poll_seconds: float = PROGRESS_LISTEN_POLL_SECONDS):
+        self.engine = engine
+        self.poll_seconds = poll_seconds
+        self.listening = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="progress-listener", daemon=True)
+
+    def start(self) -> "ProgressListener":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            try:
+                self.listen()
+            except Exception as e:
+                logger.error(f"Progress listener lost its connection: {e}")
+                self.listening.clear()
+                self.stopped.wait(self.poll_seconds)
+
+    def listen(self) -> None:
+        # a connection out of the pool, held for as long as the listener runs
+        connection = self.engine.raw_connection()
+        dbapi_connection = connection.driver_connection
+        connection.detach()
+        try:
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {PROGRESS_CHANNEL}")
+            self.listening.set()
+            while not self.stopped.is_set():
+                if not select.select([dbapi_connection], [], [], self.poll_seconds)[0]:
+                    continue
+                dbapi_connection.poll()
+                while dbapi_connection.notifies:
+                    self.receive(dbapi_connection.notifies.pop(0).payload)
+        finally:
+            connection.close()
+
+    def receive(self, payload: str) -> None:
+        try:
+            progress = json.loads(payload)
+            publish_progress(
+                progress["user_id"], progress["status"], progress["processed_emails"], progress["total_emails"]
+            )
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error(f"Ignoring malformed progress notification {payload!r}: {e}")
+
+
+def clear_progress() -> None:
+    with _lock:
+        _progress.clear()
+        _subscribers.clear()
+
+
+class ProgressReporter:
+    """
+    Reports the progress of an ingestion run. Every update is published in
+    memory right away and notified to other processes at most every
+    notify_every_seconds, but only written to the TaskRuns row every
+    save_every_emails emails or save_every_seconds seconds, by save() (e.g.
+    together with a chunk of records) and by finish().
+    """
+
+    def __init__(
+        self,
+        db_session,
+        task_run,
+        save_every_emails: int = PROGRESS_SAVE_EVERY_EMAILS,
+        save_every_seconds: float = PROGRESS_SAVE_EVERY_SECONDS,
+        notify_every_seconds: float = PROGRESS_NOTIFY_EVERY_SECONDS,
+    ):
+        self.db_session = db_session
+        self.task_run = task_run
+        self.save_every_emails = save_every_emails
+        self.save_every_seconds = save_every_seconds
+        self.notify_every_seconds = notify_every_seconds
+        self.processed_emails = task_run.processed_emails
+        self.total_emails = task_run.total_emails
+        self.saved_emails = self.processed_emails
+        self.saved_at = time.monotonic()
+        self.notified_at = None
+        self.publish()
+
+    def publish(self) -> None:
+        """Publishes the progress in memory, and notifies it unless it was notified less than notify_every_seconds ago."""
+        status, user_id = self.task_run.status, self.task_run.user_id
+        publish_progress(user_id, status, self.processed_emails, self.total_emails)
+        now = time.monotonic()
+        if self.notified_at is None or now - self.notified_at >= self.notify_every_seconds or status != STARTED:
+            self.notified_at = now
+            progress = {"status": status, "processed_emails": self.processed_emails, "total_emails": self.total_emails}
+            notify_progress(self.db_session.get_bind(), user_id, progress)
+
+    def update(self, processed_emails: int, total_emails: int) -> None:
+        self.processed_emails = processed_emails
+        self.total_emails = total_emails
+        self.publish()
+        if (
+            self.processed_emails - self.saved_emails >= self.save_every_emails
+            or time.monotonic() - self.saved_at >= self.save_every_seconds
+        ):
+            self.save()
+
+    def save(self, commit: bool = True) -> None:
+        """Copies the progress to the TaskRuns row, committing unless the caller will."""
+        self.task_run.processed_emails = self.processed_emails
+        self.task_run.total_emails = self.total_emails
+        self.saved_emails = self.processed_emails
+        self.saved_at = time.monotonic()
+        if commit:
+            self.db_session.commit()
+
+    def finish(self, status: str) -> None:
+        self.task_run.status = status
+        self.publish()
+        self.save()
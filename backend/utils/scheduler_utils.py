@@ -0,0 +1,140 @@
+"""
+Fair sharing of the LLM between users whose emails are ingested at the same
+time, so one user's large backfill cannot hold up everyone else.
+"""
+
+import heapq
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Tuple
+
+from cachetools import LRUCache
+
+# Users are served in proportion to their weight. A user gets the higher weight
+# while they have had fewer than SMALL_SYNC_EMAILS emails classified, or for the
+# whole run of an incremental sync, so small syncs finish ahead of backfills.
+SMALL_SYNC_EMAILS = 100
+SMALL_SYNC_WEIGHT = 4
+BACKFILL_WEIGHT = 1
+
+
+@dataclass
+class _Tenant:
+    items: Deque[Tuple[float, Any]] = field(default_factory=deque)  # (finish tag, item)
+    last_finish: float = 0.0
+    served: int = 0
+
+
+class FairQueue:
+    """
+    Weighted fair queue of work items from several tenants (users).
+
+    Each item gets a virtual finish tag when pushed: the later of the queue's
+    virtual time and the tenant's previous tag, plus cost / weight. pop()
+    returns the item with the smallest tag, so every tenant with pending work
+    gets its share in turn, heavier tenants a bigger one, and a tenant that
+    arrives late starts at the current virtual time instead of at the back.
+    Not thread safe.
+    """
+
+    def __init__(
+        self,
+        small_sync_emails: int = SMALL_SYNC_EMAILS,
+        small_sync_weight: float = SMALL_SYNC_WEIGHT,
+        backfill_weight: float = BACKFILL_WEIGHT,
+    ):
+        self.small_sync_emails = small_sync_emails
+        self.small_sync_weight = small_sync_weight
+        self.backfill_weight = backfill_weight
+        self.virtual_time = 0.0
+        self.tenants: Dict[str, _Tenant] = {}  # tenants with queued items
+        # tenants stay known after their work is done, so a backfill that
+        # briefly runs dry does not come back as a small sync
+        self.idle_tenants: Dict[str, _Tenant] = LRUCache(maxsize=10000)
+        self.heads = []  # (finish tag, order, tenant) of the first item of every tenant
+        self.order = itertools.count()
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def get_weight(self, tenant: _Tenant, incremental: bool) -> float:
+        if incremental or tenant.served < self.small_sync_emails:
+            return self.small_sync_weight
+        return self.backfill_weight
+
+    def push(self, tenant_id: str, item: Any, cost: int = 1, incremental: bool = False) -> None:
+        tenant = self.tenants.get(tenant_id)
+        if tenant is None:
+            tenant = self.idle_tenants.pop(tenant_id, None) or _Tenant()
+            self.tenants[tenant_id] = tenant
+        start = max(self.virtual_time, tenant.last_finish)
+        tenant.last_finish = start + cost / self.get_weight(tenant, incremental)
+        # the served count is charged up front, so the weight drops while the
+        # backfill's first batches are still queued
+        tenant.served += cost
+        tenant.items.append((tenant.last_finish, item))
+        if len(tenant.items) == 1:
+            heapq.heappush(self.heads, (tenant.last_finish, next(self.order), tenant_id))
+        self.size += 1
+
+    def pop(self) -> Tuple[str, Any]:
+        """Returns (tenant_id, item) of the next item. Raises IndexError when empty."""
+        finish, _, tenant_id = heapq.heappop(self.heads)
+        tenant = self.tenants[tenant_id]
+        _, item = tenant.items.popleft()
+        if tenant.items:
+            heapq.heappush(self.heads, (tenant.items[0][0], next(self.order), tenant_id))
+        else:
+            self.idle_tenants[tenant_id] = self.tenants.pop(tenant_id)
+        self.virtual_time = max(self.virtual_time, finish)
+        self.size -= 1
+        return tenant_id, item
+
+
+class FairScheduler:
+    """
+    Runs callables on max_workers threads, taking them from a FairQueue, so
+    the work of several users is interleaved one call (e.g. one batch of
+    emails) at a time. The threads start on the first submit.
+    """
+
+    def __init__(self, max_workers: int, name: str = "fair", queue: FairQueue = None):
+        self.max_workers = max_workers
+        self.name = name
+        self.queue = queue or FairQueue()
+        self.condition = threading.Condition()
+        self.threads = []
+
+    def submit(
+        self, tenant_id: str, fn: Callable, *args, cost: int = 1, incremental: bool = False
+    ) -> Future:
+        future = Future()
+        with self.condition:
+            if not self.threads:
+                self._start_threads()
+            self.queue.push(tenant_id, (future, fn, args), cost=cost, incremental=incremental)
+            self.condition.notify()
+        return future
+
+    def _start_threads(self) -> None:
+        for i in range(self.max_workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _work(self) -> None:
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.condition.wait()
+                _, (future, fn, args) = self.queue.pop()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
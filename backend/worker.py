@@ -0,0 +1,138 @@
+"""
+Runs the email ingestion jobs queued by the web app, outside of the web
+process. Start as many as needed, on any machine with database access:
+
+    python worker.py
+"""
+
+import json
+import logging
+import os
+import signal
+import socket
+import threading
+from datetime import datetime
+from typing import Optional
+
+from google.oauth2.credentials import Credentials
+from sqlmodel import Session
+
+import database
+from db.ingestion_jobs import IngestionJobs
+from db.utils.job_queue_utils import (
+    JOB_VISIBILITY_TIMEOUT_SECONDS,
+    claim_job,
+    complete_job,
+    extend_job_lock,
+    fail_job,
+)
+from routes.email_routes import fetch_emails_to_db
+from utils.auth_utils import AuthenticatedUser
+from utils.config_utils import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+POLL_INTERVAL_SECONDS = 5  # wait between polls while the queue is empty
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def run_ingestion_job(job: IngestionJobs) -> None:
+    payload = job.payload
+    creds = Credentials.from_authorized_user_info(json.loads(payload["creds"]))
+    user = AuthenticatedUser(creds, user_id=job.user_id)
+    last_updated = payload.get("last_updated")
+    fetch_emails_to_db(
+        user,
+        payload.get("session") or {},
+        datetime.fromisoformat(last_updated) if last_updated else None,
+        user_id=job.user_id,
+        exclusive=True,
+    )
+
+
+def keep_job_locked(job_id: int, worker_id: str, done: threading.Event, visibility_timeout: int) -> None:
+    # renews the lock well before it expires, so long ingestions are not reclaimed
+    while not done.wait(visibility_timeout / 3):
+        try:
+            with Session(database.engine) as session:
+                if not extend_job_lock(session, job_id, worker_id, visibility_timeout):
+                    logger.warning(f"Lost the lock on job {job_id}")
+                    return
+        except Exception as e:
+            logger.error(f"Error extending the lock on job {job_id}: {e}")
+
+
+def run_next_job(
+    worker_id: str = WORKER_ID, visibility_timeout: int = JOB_VISIBILITY_TIMEOUT_SECONDS
+) -> bool:
+    """Runs the next due job, if any. Returns whether there was one."""
+    with Session(database.engine) as session:
+        job = claim_job(session, worker_id, visibility_timeout)
+        if job is None:
+            return False
+        logger.info(f"Worker {worker_id} running job {job.id} for user_id:{job.user_id} (attempt {job.attempts})")
+
+        done = threading.Event()
+        heartbeat = threading.Thread(
+            target=keep_job_locked,
+            args=(job.id, worker_id, done, visibility_timeout),
+            name="job-heartbeat",
+            daemon=True,
+        )
+        heartbeat.start()
+        try:
+            run_ingestion_job(job)
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed")
+            fail_job(session, job, str(e))
+        else:
+            complete_job(session, job)
+        finally:
+            done.set()
+            heartbeat.join()
+        return True
+
+
+def run_worker(
+    worker_id: str = WORKER_ID,
+    poll_interval: float = POLL_INTERVAL_SECONDS,
+    stop: Optional[threading.Event] = None,
+    concurrent_jobs: int = settings.WORKER_CONCURRENT_JOBS,
+) -> None:
+    """
+    Runs up to concurrent_jobs jobs at a time until stop is set, finishing the
+    current jobs first. Their LLM batches share the process wide scheduler,
+    so users take turns instead of waiting for each other's whole job.
+    """
+    stop = stop or threading.Event()
+
+    def run_jobs(slot_id: str) -> None:
+        while not stop.is_set():
+            try:
+                if run_next_job(slot_id):
+                    continue
+            except Exception as e:
+                # e.g. the database is unreachable; keep polling
+                logger.error(f"Worker {slot_id} could not run a job: {e}")
+            stop.wait(poll_interval)
+
+    logger.info(f"Worker {worker_id} started with {concurrent_jobs} job slots")
+    slots = [
+        threading.Thread(target=run_jobs, args=(f"{worker_id}/{i}",), name=f"job-slot-{i}")
+        for i in range(concurrent_jobs)
+    ]
+    for slot in slots:
+        slot.start()
+    for slot in slots:
+        slot.join()
+    logger.info(f"Worker {worker_id} stopped")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    database.create_db_and_tables()
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *args: stop_event.set())
+    run_worker(stop=stop_event)
@@ -1,5 +1,5 @@
 "use client";
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import { useRouter } from "next/navigation";
 import { addToast } from "@heroui/toast";
 import React from "react";
@@ -9,6 +9,9 @@ import ResponseRateCard from "@/components/response_rate_card";
 import UniqueOpenRateChart from "@/components/response_rate_chart";
 import { checkAuth } from "@/utils/auth";
 
+// Applications shown per page, each page is fetched from /get-emails when it is opened
+const PAGE_SIZE = 10;
+
 export default function Dashboard() {
 	const router = useRouter();
 	const [data, setData] = useState<Application[]>([]);
@@ -17,24 +20,34 @@ export default function Dashboard() {
 	const [error, setError] = useState<string | null>(null);
 	const [currentPage, setCurrentPage] = useState(1);
 	const [totalPages, setTotalPages] = useState(1);
+	// cursors[n] is the X-Next-Cursor that loads page n + 1, the first page has none
+	const cursors = useRef<(string | null)[]>([null]);
 	const apiUrl = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
 
 	useEffect(() => {
 		const fetchData = async () => {
 			try {
-				// Check if user is logged in
-				const isAuthenticated = await checkAuth(apiUrl);
-				if (!isAuthenticated) {
-					addToast({
-						title: "You need to be logged in to access this page.",
-						color: "warning"
-					});
-					router.push("/");
-					return;
+				if (currentPage === 1) {
+					// Check if user is logged in
+					const isAuthenticated = await checkAuth(apiUrl);
+					if (!isAuthenticated) {
+						addToast({
+							title: "You need to be logged in to access this page.",
+							color: "warning"
+						});
+						router.push("/");
+						return;
+					}
 				}
 
-				// Fetch applicaions (if user is logged in)
-				const response = await fetch(`${apiUrl}/get-emails?page=${currentPage}`, {
+				// Fetch the applications on the current page (if user is logged in)
+				setLoading(true);
+				const query = new URLSearchParams({ page_size: String(PAGE_SIZE) });
+				const cursor = cursors.current[currentPage - 1];
+				if (cursor) {
+					query.set("cursor", cursor);
+				}
+				const response = await fetch(`${apiUrl}/get-emails?${query}`, {
 					method: "GET",
 					credentials: "include" // Include cookies for session management
 				});
@@ -47,10 +60,14 @@ export default function Dashboard() {
 					}
 				}
 
-				const result = await response.json();
-				setTotalPages(result.totalPages);
-
+				const result: Application[] = await response.json();
 				setData(result);
+				cursors.current[currentPage] = response.headers.get("X-Next-Cursor");
+				// Only the first page has the total
+				const totalCount = response.headers.get("X-Total-Count");
+				if (totalCount !== null) {
+					setTotalPages(Math.max(1, Math.ceil(Number(totalCount) / PAGE_SIZE)));
+				}
 			} catch {
 				setError("Failed to load applications");
 			} finally {
@@ -62,7 +79,7 @@ export default function Dashboard() {
 	}, [apiUrl, router, currentPage]);
 
 	const nextPage = () => {
-		if (currentPage < totalPages) {
+		if (currentPage < totalPages && cursors.current[currentPage]) {
 			setCurrentPage(currentPage + 1);
 		}
 	};
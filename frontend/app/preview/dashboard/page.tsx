@@ -165,7 +165,7 @@ export default function PreviewDashboard() {
 	return (
 		<JobApplicationsDashboard
 			currentPage={currentPage}
-			data={data}
+			data={data.slice((currentPage - 1) * 10, currentPage * 10)}
 			downloading={downloading}
 			loading={loading}
 			responseRate={previewResponseRateContent}
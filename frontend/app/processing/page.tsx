@@ -11,6 +11,8 @@ const ProcessingPage = () => {
 	const router = useRouter();
 	const apiUrl = process.env.NEXT_PUBLIC_API_URL!;
 	const [progress, setProgress] = useState(0);
+	const [failed, setFailed] = useState(false);
+	const [retrying, setRetrying] = useState(false);
 
 	useEffect(() => {
 		const process = async () => {
@@ -25,34 +27,107 @@ const ProcessingPage = () => {
 				return;
 			}
 
-			const interval = setInterval(async () => {
-				try {
-					const res = await fetch(`${apiUrl}/processing`, {
-						method: "GET",
-						credentials: "include"
-					});
+			// returns true once the run is over, complete or failed
+			const handleProgress = (result: {
+				message: string;
+				status: string;
+				processed_emails: number;
+				total_emails: number;
+			}) => {
+				if (result.total_emails === 0) {
+					setProgress(100);
+				} else {
+					setProgress(100 * (result.processed_emails / result.total_emails));
+				}
+				if (result.message === "Processing complete") {
+					router.push("/dashboard");
+					return true;
+				}
+				if (result.status === "failed" || result.message === "Processing failed") {
+					setFailed(true);
+					return true;
+				}
+				return false;
+			};
 
-					const result = await res.json();
-					if (result.total_emails === 0) {
-						setProgress(100);
-					} else {
-						setProgress(100 * (result.processed_emails / result.total_emails));
-					}
-					if (result.message === "Processing complete") {
+			// polling is the fallback for when the progress stream is not available
+			const poll = () => {
+				const interval = setInterval(async () => {
+					try {
+						const res = await fetch(`${apiUrl}/processing`, {
+							method: "GET",
+							credentials: "include"
+						});
+
+						const result = await res.json();
+						if (handleProgress(result)) {
+							clearInterval(interval);
+						}
+					} catch {
 						clearInterval(interval);
-						router.push("/dashboard");
+						router.push("/logout");
 					}
-				} catch {
-					router.push("/logout");
-				}
-			}, 3000);
+				}, 3000);
+			};
 
-			return () => clearInterval(interval);
+			// the server pushes progress as it happens, so there is nothing to poll
+			const events = new EventSource(`${apiUrl}/processing/stream`, { withCredentials: true });
+			let receivedProgress = false;
+			events.onmessage = (event) => {
+				receivedProgress = true;
+				if (handleProgress(JSON.parse(event.data))) {
+					events.close();
+				}
+			};
+			events.onerror = () => {
+				if (!receivedProgress) {
+					events.close();
+					poll();
+				}
+			};
 		};
 
 		process();
 	}, [router]);
 
+	async function retry() {
+		setRetrying(true);
+		try {
+			const response = await fetch(`${apiUrl}/fetch-emails`, {
+				method: "POST",
+				credentials: "include"
+			});
+			if (!response.ok) {
+				throw new Error(`HTTP error! status: ${response.status}`);
+			}
+			// follow the new run from the start
+			window.location.reload();
+		} catch {
+			addToast({
+				title: "Failed to restart processing",
+				description: "Please try again or contact help@jobba.help if the issue persists.",
+				color: "danger"
+			});
+			setRetrying(false);
+		}
+	}
+
+	if (failed) {
+		return (
+			<div className="p-6 flex flex-col items-center justify-center min-h-[50vh]">
+				<p className="text-red-600 mb-4">Something went wrong while processing your emails.</p>
+				<div className="flex gap-4">
+					<button className="px-4 py-2 bg-blue-600 text-white rounded" disabled={retrying} onClick={retry}>
+						{retrying ? "Retrying..." : "Retry"}
+					</button>
+					<button className="px-4 py-2 border rounded" onClick={() => router.push("/dashboard")}>
+						Go to dashboard
+					</button>
+				</div>
+			</div>
+		);
+	}
+
 	return (
 		<div className="flex flex-col items-center justify-center h-full">
 			<div className="flex flex-col items-center justify-center">
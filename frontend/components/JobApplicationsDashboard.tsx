@@ -62,7 +62,11 @@ export default function JobApplicationsDashboard({
 	onDownloadSankey,
 	onRemoveItem, // Accept the callback
 	initialSortKey = "Date (Newest)",
-	responseRate
+	responseRate,
+	onNextPage,
+	onPrevPage,
+	currentPage,
+	totalPages
 }: JobApplicationsDashboardProps) {
 	const [sortedData, setSortedData] = useState<Application[]>([]);
 	const [selectedKeys, setSelectedKeys] = useState(new Set([getInitialSortKey(initialSortKey)]));
@@ -75,9 +79,6 @@ export default function JobApplicationsDashboard({
 	const [showDelete, setShowDelete] = useState(false);
 	const [itemToRemove, setItemToRemove] = useState<string | null>(null);
 
-	const [currentPage, setCurrentPage] = useState(1);
-	const pageSize = 10;
-
 	const selectedValue = React.useMemo(() => Array.from(selectedKeys).join(", ").replace(/_/g, ""), [selectedKeys]);
 
 	const handleSave = async () => {
@@ -171,8 +172,6 @@ export default function JobApplicationsDashboard({
 		}
 	}, [selectedKeys, data]);
 
-	const paginatedData = sortedData.slice((currentPage - 1) * pageSize, currentPage * pageSize);
-
 	// Handle sorting selection change and store it in localStorage
 	const handleSortChange = (keys: Set<string>) => {
 		const sortKey = Array.from(keys)[0];
@@ -180,25 +179,6 @@ export default function JobApplicationsDashboard({
 		setSelectedKeys(new Set([sortKey]));
 	};
 
-	// Pagination controls
-	const handleNextPage = () => {
-		if (currentPage < Math.ceil(sortedData.length / pageSize)) {
-			setCurrentPage(currentPage + 1);
-		}
-	};
-
-	const handlePreviousPage = () => {
-		if (currentPage > 1) {
-			setCurrentPage(currentPage - 1);
-		}
-	};
-
-	const handlePageChange = (page: number) => {
-		setCurrentPage(page);
-	};
-
-	const totalPages = Math.ceil(sortedData.length / pageSize);
-
 	return (
 		<div className="p-6">
 			{/* Modal for New User */}
@@ -318,7 +298,7 @@ export default function JobApplicationsDashboard({
 							<TableColumn>Actions</TableColumn>
 						</TableHeader>
 						<TableBody>
-							{paginatedData.map((item) => (
+							{sortedData.map((item) => (
 								<TableRow
 									key={item.id || item.received_at}
 									className="hover:bg-default-100 transition-colors"
@@ -361,11 +341,11 @@ export default function JobApplicationsDashboard({
 				</div>
 			)}
 			<div className="flex justify-between items-center mt-4">
-				<Button disabled={currentPage === 1} onPress={handlePreviousPage}>
+				<Button disabled={currentPage === 1} onPress={onPrevPage}>
 					Previous
 				</Button>
 				<span>{`${currentPage} of ${totalPages}`}</span>
-				<Button disabled={currentPage === totalPages} onPress={handleNextPage}>
+				<Button disabled={currentPage === totalPages} onPress={onNextPage}>
 					Next
 				</Button>
 			</div>